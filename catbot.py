@@ -8,24 +8,43 @@
 
 # --- MyCatBot ---
 
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import logging
 import random
 import os
-import requests
+import importlib
+import importlib.util
 import html
 import sqlite3
-import speedtest
 import asyncio
 import re
 import io
+import json
+import contextvars
+import threading
+import traceback
+import sys
+import signal
+import secrets
+import hmac
+import atexit
+import queue
+import logging.handlers
+import gc
+import tracemalloc
 import telegram
+from collections import deque, OrderedDict
 from typing import List, Tuple
 from telegram import Update, User, Chat, constants, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatType, ParseMode, ChatMemberStatus
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ApplicationHandlerStop, JobQueue
-from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes, ApplicationHandlerStop, JobQueue, BaseUpdateProcessor
+from telegram.error import TelegramError, TimedOut
 from telegram.request import HTTPXRequest
 from datetime import datetime, timezone, timedelta
+from urllib.parse import urlparse
+from types import SimpleNamespace
 from texts import (
     MEOW_TEXTS, NAP_TEXTS, PLAY_TEXTS, TREAT_TEXTS, ZOOMIES_TEXTS, 
     JUDGE_TEXTS, ATTACK_TEXTS, KILL_TEXTS, PUNCH_TEXTS, SLAP_TEXTS, 
@@ -34,14 +53,174 @@ from texts import (
     CANT_TARGET_OWNER_HUG_TEXTS, CANT_TARGET_SELF_HUG_TEXTS
 )
 
+# --- Lazy Imports ---
+LAZY_IMPORT_TIMINGS: dict[str, float] = {}
+
+class LazyModule:
+    """Stands in for a rarely used module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        module = self._module
+        if module is None:
+            started = time.perf_counter()
+            module = self._module = importlib.import_module(self._name)
+            LAZY_IMPORT_TIMINGS[self._name] = time.perf_counter() - started
+            logger.info(f"Loaded '{self._name}' on first use in {LAZY_IMPORT_TIMINGS[self._name] * 1000:.0f}ms.")
+        return getattr(module, attribute)
+
+# Only needed by /speedtest and the GIF commands; together they account for most of the import time.
+requests = LazyModule("requests")
+speedtest = LazyModule("speedtest")
+
 # --- Logging Configuration ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+LOG_FORMAT_TEXT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_QUEUE_SIZE = 10000
+LOG_ERROR_SUMMARY_INTERVAL = 60
+HOT_LOGGER_NAME = f"{__name__}.hot"
+# Set by the front process of a sharded deployment for each worker it starts (see Sharding Settings).
+SHARD_INDEX = int(os.environ["CATBOT_SHARD_INDEX"]) if os.getenv("CATBOT_SHARD_INDEX") else None
+
+def _float_from_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Per-logger sampling rate (0..1) and rate limit (records per second) for hot-path log lines.
+LOG_SAMPLE_RATES = {HOT_LOGGER_NAME: _float_from_env("LOG_HOT_SAMPLE_RATE", 1.0)}
+LOG_RATE_LIMITS = {HOT_LOGGER_NAME: _float_from_env("LOG_HOT_RATE_LIMIT", 20.0)}
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if getattr(record, 'repeated', None):
+            entry['repeated'] = record.repeated
+        if SHARD_INDEX is not None:
+            entry['shard'] = SHARD_INDEX
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogSamplingFilter(logging.Filter):
+    """Samples and rate limits records from the loggers in LOG_SAMPLE_RATES / LOG_RATE_LIMITS."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._buckets: dict[str, list[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        sample_rate = LOG_SAMPLE_RATES.get(record.name)
+        if sample_rate is not None and sample_rate < 1.0 and random.random() >= sample_rate:
+            return False
+        rate_limit = LOG_RATE_LIMITS.get(record.name)
+        if rate_limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_refill = self._buckets.get(record.name, (rate_limit, now))
+            tokens = min(rate_limit, tokens + (now - last_refill) * rate_limit)
+            allowed = tokens >= 1
+            self._buckets[record.name] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+class RepeatedErrorFilter(logging.Filter):
+    """Lets the first of identical warnings/errors through and folds repeats into one summary per interval."""
+
+    def __init__(self, emit_summary):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._seen: dict[tuple, dict] = {}
+        self._emit_summary = emit_summary
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or getattr(record, 'repeated', None):
+            return True
+        # The call site alone would fold different chats, users or exception texts into one.
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is None or now - seen['since'] >= LOG_ERROR_SUMMARY_INTERVAL:
+                expired = seen
+                self._seen[key] = {'since': now, 'suppressed': 0, 'record': record}
+            else:
+                seen['suppressed'] += 1
+                seen['record'] = record
+                return False
+        if expired and expired['suppressed']:
+            self._emit_summary(expired['record'], expired['suppressed'])
+        return True
+
+    def flush(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [(key, seen) for key, seen in self._seen.items() if now - seen['since'] >= LOG_ERROR_SUMMARY_INTERVAL]
+            for key, _ in expired:
+                del self._seen[key]
+        for _, seen in expired:
+            if seen['suppressed']:
+                self._emit_summary(seen['record'], seen['suppressed'])
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records are dropped (and counted) when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+def _emit_repeated_summary(record: logging.LogRecord, suppressed: int) -> None:
+    summary = logging.makeLogRecord(record.__dict__)
+    summary.msg = f"{record.getMessage()} [repeated {suppressed} more times in the last {LOG_ERROR_SUMMARY_INTERVAL}s]"
+    summary.args = None
+    summary.exc_info = None
+    summary.exc_text = None
+    summary.repeated = suppressed
+    log_queue_handler.handle(summary)
+
+def setup_logging() -> tuple[logging.handlers.QueueListener, DroppingQueueHandler, RepeatedErrorFilter]:
+    """Routes all logging through a queue so handlers never write to stderr on the event loop."""
+    output_handler = logging.StreamHandler()
+    text_format = LOG_FORMAT_TEXT if SHARD_INDEX is None else LOG_FORMAT_TEXT.replace("%(name)s", f"shard {SHARD_INDEX} - %(name)s")
+    output_handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == "json" else logging.Formatter(text_format))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    repeated_error_filter = RepeatedErrorFilter(_emit_repeated_summary)
+    queue_handler.addFilter(LogSamplingFilter())
+    queue_handler.addFilter(repeated_error_filter)
+
+    root_logger = logging.getLogger()
+    root_logger.handlers.clear()
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, output_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener, queue_handler, repeated_error_filter
+
+log_listener, log_queue_handler, log_repeated_error_filter = setup_logging()
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram.vendor.ptb_urllib3.urllib3").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
+hot_logger = logging.getLogger(HOT_LOGGER_NAME)
 
 # --- Owner ID Configuration & Bot Start Time ---
 OWNER_ID = None
@@ -49,6 +228,140 @@ BOT_START_TIME = datetime.now()
 TENOR_API_KEY = None
 DB_NAME = "catbot_data.db"
 LOG_CHAT_ID = None
+TELEGRAM_API_BASE_URL = None
+
+# --- Gban Sweep Settings ---
+GBAN_SWEEP_PROBE_LIMIT = 300
+GBAN_SWEEP_ACTION_DELAY = 0.5
+GBAN_SWEEP_BATCH_SIZE = 200
+GBAN_JOIN_BAN_CONCURRENCY = 5
+GBAN_JOIN_NOTICE_WINDOW = 10
+# Chat sightings are buffered in memory and written in bulk this often (seconds).
+CHAT_SIGHTINGS_FLUSH_INTERVAL = 30
+
+# --- Anti-Flood Settings ---
+ANTIFLOOD_DEFAULT_LIMIT = 8
+ANTIFLOOD_DEFAULT_WINDOW = 10
+ANTIFLOOD_DEFAULT_ACTION = "mute"
+ANTIFLOOD_ACTIONS = ("mute", "kick", "ban")
+ANTIFLOOD_PUNISH_DURATION = timedelta(hours=1)
+ANTIFLOOD_MAX_TRACKED_USERS = 20000
+# Per-chat settings are cached in an LRU; idle chats past this count are reloaded from the DB when next seen.
+ANTIFLOOD_SETTINGS_CACHE_MAX_CHATS = 5000
+ANTIRAID_DEFAULT_LIMIT = 10
+ANTIRAID_DEFAULT_WINDOW = 60
+ANTIRAID_DEFAULT_ACTION = "lock"
+ANTIRAID_ACTIONS = ("lock", "mute", "ban")
+ANTIRAID_DURATION = timedelta(minutes=10)
+
+# --- Blocklist Settings ---
+BLOCKLIST_MAX_ENTRIES = 500
+BLOCKLIST_MAX_ENTRY_LENGTH = 100
+# Compiled matchers (including "no blocklist") are cached in an LRU; idle chats past this count are reloaded when next seen.
+BLOCKLIST_CACHE_MAX_CHATS = 5000
+
+# --- Filters Settings ---
+FILTERS_MAX_PER_CHAT = 150
+FILTER_KEYWORD_MAX_LENGTH = 64
+FILTERS_CACHE_BUDGET_BYTES = 8 * 1024 * 1024
+
+# --- Metrics Settings ---
+METRICS_PORT = None
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Optional callable(kind, name, seconds) that receives raw handler / DB timings; set by the benchmark harness
+METRICS_SAMPLE_SINK = None
+
+# --- Loop Lag Settings ---
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_THRESHOLD = 0.25
+LOOP_LAG_SAMPLES = 2000
+LOOP_LAG_EVENTS_KEPT = 20
+LOOP_LAG_STACK_DEPTH = 12
+
+# --- Profiler Settings ---
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOP_FUNCTIONS = 25
+
+# --- Memory Introspection Settings ---
+MEM_TRACEMALLOC_FRAMES = 10
+MEM_TOP_ALLOCATIONS = 10
+MEM_SIZE_WALK_LIMIT = 200000
+
+# --- Status Counter Settings ---
+STATUS_COUNTED_TABLES = ("users", "blacklist", "sudo_users", "global_bans", "bot_chats")
+COUNTERS_RECONCILE_INTERVAL = timedelta(hours=6)
+
+# --- Database Profiling Settings ---
+DB_SLOW_QUERY_THRESHOLD = 0.1
+DB_SLOW_QUERY_LOG_SIZE = 50
+DB_BUSY_TIMEOUT = 5.0
+DB_TOP_STATEMENTS_DEFAULT = 10
+
+# --- Startup Settings ---
+STARTUP_TARGET_SECONDS = 5.0
+
+# --- HTTP Client Settings ---
+HTTP_CONNECT_TIMEOUT = 20.0
+HTTP_READ_TIMEOUT = 80.0
+HTTP_WRITE_TIMEOUT = 80.0
+HTTP_POOL_TIMEOUT = 20.0
+# Outgoing calls (sends, admin checks, ...) share this pool; getUpdates long polling has its own.
+API_CONNECTION_POOL_SIZE = 32
+GET_UPDATES_CONNECTION_POOL_SIZE = 1
+HTTP_VERSION = "1.1"
+
+# --- Update Dispatch Settings ---
+# Updates from different chats are handled concurrently, at most UPDATE_CONCURRENCY at a time;
+# updates from the same chat always run one after another, in the order they arrived.
+UPDATE_CONCURRENCY = 8
+UPDATE_MAX_PENDING = 1000
+
+# --- Catch-up Settings ---
+# After a restart, backlog updates older than CATCHUP_STALE_AGE seconds are triaged: stale fun commands are
+# dropped and the bookkeeping for chat activity is batched. An update younger than CATCHUP_LIVE_AGE ends catch-up mode.
+CATCHUP_STALE_AGE = 120
+CATCHUP_LIVE_AGE = 15
+CATCHUP_BATCH_SIZE = 200
+CATCHUP_FLUSH_INTERVAL = 2.0
+CATCHUP_IDLE_FINISH = 5.0
+CATCHUP_HANDLER_GROUP = -100
+# Commands that still run when stale: an admin's action should happen late rather than not at all.
+CATCHUP_MODERATION_COMMANDS = frozenset({
+    "ban", "unban", "mute", "unmute", "kick", "promote", "demote", "pin", "unpin", "purge", "report",
+    "gban", "ungban", "enforcegban", "blist", "unblist", "antiflood", "antiraid", "addblock", "unblock",
+    "filter", "stop", "addsudo", "delsudo", "leave",
+})
+
+# --- Allowed Updates Settings ---
+# "auto" requests only the update types the registered handlers use, "all" every type, or a comma-separated list.
+ALLOWED_UPDATES_MODE = "auto"
+
+# --- Webhook Settings ---
+BOT_RUN_MODE = "polling"
+WEBHOOK_URL = None
+WEBHOOK_SECRET_TOKEN = None
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_MAX_CONNECTIONS = 40
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+WEBHOOK_IDLE_TIMEOUT = 75.0
+WEBHOOK_DRAIN_TIMEOUT = 30.0
+WEBHOOK_SECRET_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+# --- Sharding Settings ---
+# With SHARD_COUNT > 1 a front process receives updates (polling or webhook) and routes each chat to one of
+# SHARD_COUNT worker processes over a Unix socket, so handler CPU work is spread over several cores.
+SHARD_COUNT = 1
+SHARD_SOCKET_PATH = "catbot_shards.sock"
+SHARD_MAX_MESSAGE_BYTES = 4 * 1024 * 1024
+# Updates kept per shard while its worker is starting or restarting.
+SHARD_MAX_BUFFERED = 10000
+SHARD_STATS_INTERVAL = 5.0
+SHARD_RESTART_DELAY = 2.0
+SHARD_STOP_TIMEOUT = 30.0
+SHARD_ROUTER_GROUP = -1000
 
 # --- Load configuration from environment variables ---
 try:
@@ -76,11 +389,317 @@ if log_chat_id_str:
 else:
     logger.info("LOG_CHAT_ID not set. Operational logs (globalbans/blacklist/sudo) will be sent to OWNER_ID if available.")
 
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+if TELEGRAM_API_BASE_URL:
+    TELEGRAM_API_BASE_URL = TELEGRAM_API_BASE_URL.rstrip("/")
+    logger.warning(f"TELEGRAM_API_BASE_URL set: Bot API calls will go to {TELEGRAM_API_BASE_URL} instead of api.telegram.org.")
+
+for pool_env_name in ("API_POOL_SIZE", "GET_UPDATES_POOL_SIZE"):
+    pool_size_str = os.getenv(pool_env_name)
+    if pool_size_str:
+        try:
+            pool_size = int(pool_size_str)
+            if pool_size < 1:
+                raise ValueError
+            if pool_env_name == "API_POOL_SIZE":
+                API_CONNECTION_POOL_SIZE = pool_size
+            else:
+                GET_UPDATES_CONNECTION_POOL_SIZE = pool_size
+            logger.info(f"{pool_env_name} set to {pool_size}.")
+        except ValueError:
+            logger.error(f"Invalid {pool_env_name}: '{pool_size_str}' is not a positive integer. Using the default.")
+
+update_concurrency_str = os.getenv("UPDATE_CONCURRENCY")
+if update_concurrency_str:
+    try:
+        UPDATE_CONCURRENCY = int(update_concurrency_str)
+        if UPDATE_CONCURRENCY < 1:
+            raise ValueError
+        logger.info(f"Update concurrency set to {UPDATE_CONCURRENCY}.")
+    except ValueError:
+        logger.error(f"Invalid UPDATE_CONCURRENCY: '{update_concurrency_str}' is not a positive integer. Using default of 8.")
+        UPDATE_CONCURRENCY = 8
+
+catchup_stale_seconds_str = os.getenv("CATCHUP_STALE_SECONDS")
+if catchup_stale_seconds_str:
+    try:
+        CATCHUP_STALE_AGE = int(catchup_stale_seconds_str)
+        logger.info(f"Catch-up stale age set to {CATCHUP_STALE_AGE}s." if CATCHUP_STALE_AGE else "Catch-up mode disabled.")
+    except ValueError:
+        logger.error(f"Invalid CATCHUP_STALE_SECONDS: '{catchup_stale_seconds_str}' is not a valid integer. Using default of {CATCHUP_STALE_AGE}s.")
+
+ALLOWED_UPDATES_MODE = os.getenv("ALLOWED_UPDATES", ALLOWED_UPDATES_MODE).strip().lower()
+if ALLOWED_UPDATES_MODE not in ("auto", "all"):
+    unknown_update_types = [t.strip() for t in ALLOWED_UPDATES_MODE.split(",") if t.strip() and t.strip() not in [str(u) for u in Update.ALL_TYPES]]
+    if unknown_update_types or not ALLOWED_UPDATES_MODE.strip(", "):
+        logger.error(f"Invalid ALLOWED_UPDATES: unknown update type(s) {', '.join(unknown_update_types) or '(empty list)'}. Using 'auto'.")
+        ALLOWED_UPDATES_MODE = "auto"
+
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling").lower()
+if BOT_RUN_MODE not in ("polling", "webhook"):
+    logger.error(f"Invalid BOT_RUN_MODE: '{BOT_RUN_MODE}'. Use 'polling' or 'webhook'. Using polling.")
+    BOT_RUN_MODE = "polling"
+if BOT_RUN_MODE == "webhook":
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    if not WEBHOOK_URL:
+        logger.error("BOT_RUN_MODE=webhook needs WEBHOOK_URL (the public HTTPS URL Telegram should post to). Using polling.")
+        BOT_RUN_MODE = "polling"
+    WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+    if WEBHOOK_SECRET_TOKEN and not WEBHOOK_SECRET_PATTERN.match(WEBHOOK_SECRET_TOKEN):
+        logger.error("Invalid WEBHOOK_SECRET_TOKEN: use 1-256 characters from A-Z, a-z, 0-9, _ and -. Generating a random one.")
+        WEBHOOK_SECRET_TOKEN = None
+    if not WEBHOOK_SECRET_TOKEN:
+        # Telegram is told the token again by setWebhook on every start, so a fresh one per run works.
+        WEBHOOK_SECRET_TOKEN = secrets.token_urlsafe(32)
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", WEBHOOK_LISTEN)
+    webhook_port_str = os.getenv("WEBHOOK_PORT")
+    if webhook_port_str:
+        try:
+            WEBHOOK_PORT = int(webhook_port_str)
+        except ValueError:
+            logger.error(f"Invalid WEBHOOK_PORT: '{webhook_port_str}' is not a valid integer. Using default of {WEBHOOK_PORT}.")
+
+http_version_str = os.getenv("HTTP_VERSION")
+if http_version_str:
+    if http_version_str not in ("1.1", "2", "2.0"):
+        logger.error(f"Invalid HTTP_VERSION: '{http_version_str}'. Use '1.1' or '2'. Using HTTP/1.1.")
+    elif http_version_str != "1.1" and importlib.util.find_spec("h2") is None:
+        logger.error("HTTP_VERSION=2 needs the 'h2' package (pip install \"httpx[http2]\"). Using HTTP/1.1.")
+    else:
+        HTTP_VERSION = http_version_str
+        logger.info(f"Bot API calls will use HTTP/{HTTP_VERSION}.")
+
+shard_count_str = os.getenv("SHARD_COUNT")
+if shard_count_str:
+    try:
+        SHARD_COUNT = max(int(shard_count_str), 1)
+    except ValueError:
+        logger.error(f"Invalid SHARD_COUNT: '{shard_count_str}' is not a valid integer. Using default of {SHARD_COUNT}.")
+if SHARD_COUNT > 1 and not hasattr(asyncio, "start_unix_server"):
+    logger.error("SHARD_COUNT > 1 needs Unix domain sockets, which this platform lacks. Running a single process.")
+    SHARD_COUNT = 1
+SHARD_SOCKET_PATH = os.getenv("SHARD_SOCKET", SHARD_SOCKET_PATH)
+IS_SHARD_FRONT = SHARD_COUNT > 1 and SHARD_INDEX is None
+if IS_SHARD_FRONT:
+    logger.info(f"Sharded deployment: {SHARD_COUNT} worker processes.")
+
+metrics_port_str = os.getenv("METRICS_PORT")
+if metrics_port_str:
+    try:
+        METRICS_PORT = int(metrics_port_str)
+        logger.info(f"Prometheus metrics will be served on 127.0.0.1:{METRICS_PORT}")
+    except ValueError:
+        logger.error(f"Invalid METRICS_PORT: '{metrics_port_str}' is not a valid integer. Metrics endpoint disabled.")
+        METRICS_PORT = None
+
+db_slow_query_ms_str = os.getenv("DB_SLOW_QUERY_MS")
+if db_slow_query_ms_str:
+    try:
+        DB_SLOW_QUERY_THRESHOLD = int(db_slow_query_ms_str) / 1000
+        logger.info(f"Slow query threshold set to {db_slow_query_ms_str}ms.")
+    except ValueError:
+        logger.error(f"Invalid DB_SLOW_QUERY_MS: '{db_slow_query_ms_str}' is not a valid integer. Using default of {DB_SLOW_QUERY_THRESHOLD * 1000:.0f}ms.")
+
+loop_lag_threshold_ms_str = os.getenv("LOOP_LAG_THRESHOLD_MS")
+if loop_lag_threshold_ms_str:
+    try:
+        LOOP_LAG_THRESHOLD = int(loop_lag_threshold_ms_str) / 1000
+        logger.info(f"Event loop lag threshold set to {loop_lag_threshold_ms_str}ms.")
+    except ValueError:
+        logger.error(f"Invalid LOOP_LAG_THRESHOLD_MS: '{loop_lag_threshold_ms_str}' is not a valid integer. Using default of {LOOP_LAG_THRESHOLD * 1000:.0f}ms.")
+
+startup_target_ms_str = os.getenv("STARTUP_TARGET_MS")
+if startup_target_ms_str:
+    try:
+        STARTUP_TARGET_SECONDS = int(startup_target_ms_str) / 1000
+        logger.info(f"Cold start target set to {startup_target_ms_str}ms.")
+    except ValueError:
+        logger.error(f"Invalid STARTUP_TARGET_MS: '{startup_target_ms_str}' is not a valid integer. Using default of {STARTUP_TARGET_SECONDS * 1000:.0f}ms.")
+
+# --- Database Profiling ---
+DB_STATEMENT_STATS: dict[str, dict] = {}
+DB_SLOW_QUERIES: deque = deque(maxlen=DB_SLOW_QUERY_LOG_SIZE)
+DB_IN_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def normalize_sql(sql: str) -> str:
+    return DB_IN_LIST_PATTERN.sub("(?, ...)", " ".join(sql.split()))
+
+def _is_lock_error(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def _record_statement(statement: str, elapsed: float, rows: int = 0, lock_wait: float = 0.0, lock_waited: bool = False) -> dict:
+    stats = DB_STATEMENT_STATS.get(statement)
+    if stats is None:
+        stats = DB_STATEMENT_STATS[statement] = {'count': 0, 'total_time': 0.0, 'max_time': 0.0, 'rows': 0, 'lock_waits': 0, 'lock_wait_time': 0.0, 'slow': 0}
+    stats['count'] += 1
+    stats['total_time'] += elapsed
+    stats['max_time'] = max(stats['max_time'], elapsed)
+    stats['rows'] += rows
+    stats['lock_wait_time'] += lock_wait
+    if lock_waited:
+        stats['lock_waits'] += 1
+    if METRICS_SAMPLE_SINK is not None:
+        METRICS_SAMPLE_SINK("db", statement, elapsed)
+    return stats
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times every statement, counts the rows it touches and measures time spent waiting on locks."""
+
+    _statement = None
+
+    def _run_with_lock_wait(self, run, statement: str, *args):
+        started = time.perf_counter()
+        lock_wait = 0.0
+        lock_waited = False
+        delay = 0.001
+        while True:
+            attempt_started = time.perf_counter()
+            try:
+                result = run(*args)
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_lock_error(e) or time.perf_counter() - started + delay > DB_BUSY_TIMEOUT:
+                    _record_statement(statement, time.perf_counter() - started, 0, lock_wait + time.perf_counter() - attempt_started, True)
+                    raise
+                lock_waited = True
+                time.sleep(delay)
+                lock_wait += time.perf_counter() - attempt_started
+                delay = min(delay * 2, 0.1)
+        elapsed = time.perf_counter() - started
+        rows = self.rowcount if self.rowcount > 0 else 0
+        stats = _record_statement(statement, elapsed, rows, lock_wait, lock_waited)
+        self._statement = statement
+        return result, elapsed, stats
+
+    def execute(self, sql: str, parameters=()):
+        statement = normalize_sql(sql)
+        result, elapsed, stats = self._run_with_lock_wait(super().execute, statement, sql, parameters)
+        if elapsed >= DB_SLOW_QUERY_THRESHOLD:
+            log_slow_query(self.connection, statement, sql, parameters, elapsed, stats)
+        return result
+
+    def executemany(self, sql: str, seq_of_parameters):
+        statement = normalize_sql(sql)
+        result, elapsed, stats = self._run_with_lock_wait(super().executemany, statement, sql, seq_of_parameters)
+        if elapsed >= DB_SLOW_QUERY_THRESHOLD:
+            log_slow_query(self.connection, statement, None, None, elapsed, stats)
+        return result
+
+    def _count_fetched(self, rows: int, elapsed: float) -> None:
+        stats = DB_STATEMENT_STATS.get(self._statement)
+        if stats:
+            stats['rows'] += rows
+            stats['total_time'] += elapsed
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._count_fetched(1 if row is not None else 0, time.perf_counter() - started)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._count_fetched(len(rows), time.perf_counter() - started)
+        return rows
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors are profiled. Commits are timed as a COMMIT statement."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        cursor = self.cursor()
+        result, _, _ = cursor._run_with_lock_wait(super().commit, "COMMIT")
+        return result
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # sqlite3's own context manager commits through the C-level commit, which would skip the lock-wait retry
+        # above, and never closes the connection (and its file descriptor) until the cyclic garbage collector runs.
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
+
+def connect_db() -> sqlite3.Connection:
+    # Lock waits are handled (and measured) by ProfiledCursor instead of SQLite's busy timeout.
+    conn = sqlite3.connect(DB_NAME, timeout=0, factory=ProfiledConnection)
+    # Lets INSERT OR REPLACE fire the row counter delete triggers for the row it replaces.
+    sqlite3.Connection.execute(conn, "PRAGMA recursive_triggers = ON")
+    return conn
+
+def log_slow_query(conn: sqlite3.Connection, statement: str, sql: str | None, parameters, elapsed: float, stats: dict) -> None:
+    stats['slow'] += 1
+    plan = "n/a"
+    if sql is not None and statement.split(" ", 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH"):
+        try:
+            plan_rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            plan = "; ".join(str(row[-1]) for row in plan_rows) or "n/a"
+        except sqlite3.Error as e:
+            plan = f"unavailable ({e})"
+    DB_SLOW_QUERIES.append({'time': datetime.now(), 'statement': statement, 'elapsed': elapsed, 'plan': plan})
+    logger.warning(f"Slow query ({elapsed * 1000:.1f}ms): {statement[:300]} | plan: {plan}")
+
+async def db_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id != OWNER_ID:
+        logger.warning(f"Unauthorized /dbstats attempt by user {user.id}.")
+        return
+
+    top_n = DB_TOP_STATEMENTS_DEFAULT
+    if context.args:
+        try:
+            top_n = max(1, min(int(context.args[0]), 30))
+        except ValueError:
+            await update.message.reply_text("Mrow? Usage: /dbstats [number of statements]")
+            return
+
+    if not DB_STATEMENT_STATS:
+        await update.message.reply_text("Meow! No database statements recorded yet.")
+        return
+
+    ranked = sorted(DB_STATEMENT_STATS.items(), key=lambda item: item[1]['total_time'], reverse=True)[:top_n]
+    lines = [f"<b>🗄️ Top {len(ranked)} SQL statements by total time:</b>\n"]
+    for index, (statement, stats) in enumerate(ranked, start=1):
+        lines.append(
+            f"<b>{index}.</b> <code>{html.escape(statement[:160])}</code>\n"
+            f"   calls <code>{stats['count']}</code>, total <code>{stats['total_time'] * 1000:.1f}ms</code>, "
+            f"avg <code>{stats['total_time'] / stats['count'] * 1000:.2f}ms</code>, max <code>{stats['max_time'] * 1000:.1f}ms</code>, "
+            f"rows <code>{stats['rows']}</code>, lock waits <code>{stats['lock_waits']}</code> (<code>{stats['lock_wait_time'] * 1000:.0f}ms</code>), "
+            f"slow <code>{stats['slow']}</code>"
+        )
+    if DB_SLOW_QUERIES:
+        lines.append(f"\n<b>🐢 Recent slow queries (&gt;= {DB_SLOW_QUERY_THRESHOLD * 1000:.0f}ms):</b>")
+        for entry in list(DB_SLOW_QUERIES)[-5:]:
+            lines.append(
+                f"• <code>{entry['time'].strftime('%H:%M:%S')}</code> <code>{entry['elapsed'] * 1000:.1f}ms</code> "
+                f"<code>{html.escape(entry['statement'][:120])}</code>\n   plan: <code>{html.escape(entry['plan'][:200])}</code>"
+            )
+
+    message_text = "\n".join(lines)
+    if len(message_text) > 4096:
+        message_text = message_text[:message_text.rfind("\n<b>", 0, 4000)] + "\n\n<i>...list truncated.</i>"
+    await update.message.reply_html(message_text)
+
 # --- Database Initialization ---
 def init_db():
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -130,6 +749,68 @@ def init_db():
                 enforce_gban INTEGER DEFAULT 1 NOT NULL 
             )
         """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS antiflood_settings (
+                chat_id INTEGER PRIMARY KEY,
+                flood_enabled INTEGER DEFAULT 0 NOT NULL,
+                flood_limit INTEGER NOT NULL,
+                flood_window INTEGER NOT NULL,
+                flood_action TEXT NOT NULL,
+                raid_enabled INTEGER DEFAULT 0 NOT NULL,
+                raid_limit INTEGER NOT NULL,
+                raid_window INTEGER NOT NULL,
+                raid_action TEXT NOT NULL
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blocklist_entries (
+                chat_id INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                is_link INTEGER DEFAULT 0 NOT NULL,
+                added_by_id INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (chat_id, entry)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_filters (
+                chat_id INTEGER NOT NULL,
+                keyword TEXT NOT NULL,
+                reply_html TEXT NOT NULL,
+                added_by_id INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (chat_id, keyword)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_sightings (
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (chat_id, user_id)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS table_counters (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL
+            )
+        """)
+        for table_name in STATUS_COUNTED_TABLES:
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table_name}_count_insert AFTER INSERT ON {table_name} "
+                f"BEGIN UPDATE table_counters SET row_count = row_count + 1 WHERE table_name = '{table_name}'; END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table_name}_count_delete AFTER DELETE ON {table_name} "
+                f"BEGIN UPDATE table_counters SET row_count = row_count - 1 WHERE table_name = '{table_name}'; END"
+            )
+            cursor.execute(f"INSERT OR IGNORE INTO table_counters (table_name, row_count) SELECT '{table_name}', COUNT(*) FROM {table_name}")
         
         conn.commit()
         logger.info(f"Database '{DB_NAME}' initialized successfully (tables users, blacklist, sudo_users ensured).")
@@ -139,11 +820,64 @@ def init_db():
         if conn:
             conn.close()
 
+# --- Status Counters ---
+def get_table_counters() -> dict[str, int]:
+    """Row counts kept up to date by triggers, so /status does not have to scan the tables."""
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT table_name, row_count FROM table_counters")
+            return dict(cursor.fetchall())
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error reading table counters: {e}", exc_info=True)
+        return {}
+
+def reconcile_table_counters_in_db() -> dict[str, tuple[int, int]]:
+    """Recounts each table in its own short read, so writers are never held off for the whole scan. Only a drifted
+    counter takes the write lock, briefly, and keeps the trigger deltas applied since it was counted."""
+    drifted = {}
+    conn = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor()
+        for table_name in STATUS_COUNTED_TABLES:
+            # One statement, so the count and the counter come from the same snapshot.
+            cursor.execute(
+                f"SELECT (SELECT COUNT(*) FROM {table_name}), (SELECT row_count FROM table_counters WHERE table_name = ?)",
+                (table_name,)
+            )
+            actual_count, counted = cursor.fetchone()
+            counted = counted or 0
+            if counted == actual_count:
+                continue
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT row_count FROM table_counters WHERE table_name = ?", (table_name,))
+            row = cursor.fetchone()
+            # The insert/delete triggers moved the counter by exactly the rows changed since the count above.
+            applied_since = (row[0] if row else 0) - counted
+            cursor.execute(
+                "INSERT OR REPLACE INTO table_counters (table_name, row_count) VALUES (?, ?)",
+                (table_name, actual_count + applied_since)
+            )
+            conn.commit()
+            drifted[table_name] = (counted, actual_count)
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error reconciling table counters: {e}", exc_info=True)
+    finally:
+        if conn:
+            conn.close()
+    return drifted
+
+async def reconcile_table_counters(context: ContextTypes.DEFAULT_TYPE) -> None:
+    drifted = await asyncio.to_thread(reconcile_table_counters_in_db)
+    for table_name, (counted, actual) in drifted.items():
+        logger.warning(f"Table counter for '{table_name}' drifted: counter said {counted}, table has {actual}. Corrected.")
+
 # --- Blacklist Helper Functions ---
 def add_to_blacklist(user_id: int, banned_by_id: int, reason: str | None = "No reason provided.") -> bool:
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         current_timestamp_iso = datetime.now(timezone.utc).isoformat()
         cursor.execute(
@@ -162,7 +896,7 @@ def add_to_blacklist(user_id: int, banned_by_id: int, reason: str | None = "No r
 def remove_from_blacklist(user_id: int) -> bool:
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM blacklist WHERE user_id = ?", (user_id,))
         conn.commit()
@@ -177,7 +911,7 @@ def remove_from_blacklist(user_id: int) -> bool:
 def get_blacklist_reason(user_id: int) -> str | None:
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("SELECT reason FROM blacklist WHERE user_id = ?", (user_id,))
         row = cursor.fetchone()
@@ -208,7 +942,7 @@ async def check_blacklist_handler(update: Update, context: ContextTypes.DEFAULT_
         user_mention_log = f"@{user.username}" if user.username else str(user.id)
         message_text_preview = update.message.text[:50] if update.message.text else "[No text content]"
         
-        logger.info(f"User {user.id} ({user_mention_log}) is blacklisted. Silently ignoring and blocking interaction: '{message_text_preview}'")
+        hot_logger.info(f"User {user.id} ({user_mention_log}) is blacklisted. Silently ignoring and blocking interaction: '{message_text_preview}'")
         
         raise ApplicationHandlerStop
 
@@ -217,7 +951,7 @@ def add_sudo_user(user_id: int, added_by_id: int) -> bool:
     """Adds a user to the sudo list."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         current_timestamp_iso = datetime.now(timezone.utc).isoformat()
         cursor.execute(
@@ -237,7 +971,7 @@ def remove_sudo_user(user_id: int) -> bool:
     """Removes a user from the sudo list."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM sudo_users WHERE user_id = ?", (user_id,))
         conn.commit()
@@ -253,7 +987,7 @@ def is_sudo_user(user_id: int) -> bool:
     """Checks if a user is on the sudo list (specifically, not checking if they are THE owner)."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("SELECT 1 FROM sudo_users WHERE user_id = ?", (user_id,))
         return cursor.fetchone() is not None
@@ -276,7 +1010,7 @@ def update_user_in_db(user: User | None):
         return
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         current_timestamp_iso = datetime.now(timezone.utc).isoformat()
         cursor.execute("""
@@ -300,13 +1034,37 @@ def update_user_in_db(user: User | None):
         if conn:
             conn.close()
 
+def update_users_in_db_bulk(users: list[User]) -> None:
+    """update_user_in_db for many users in one transaction."""
+    if not users:
+        return
+    current_timestamp_iso = datetime.now(timezone.utc).isoformat()
+    try:
+        with connect_db() as conn:
+            conn.executemany("""
+                INSERT INTO users (user_id, username, first_name, last_name, language_code, is_bot, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    language_code = excluded.language_code,
+                    is_bot = excluded.is_bot,
+                    last_seen = excluded.last_seen
+            """, [
+                (user.id, user.username, user.first_name, user.last_name, user.language_code, 1 if user.is_bot else 0, current_timestamp_iso)
+                for user in users
+            ])
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error updating {len(users)} users in users table: {e}", exc_info=True)
+
 def get_user_from_db_by_username(username_query: str) -> User | None:
     if not username_query:
         return None
     conn = None
     user_obj: User | None = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         normalized_username = username_query.lstrip('@').lower()
         cursor.execute(
@@ -328,10 +1086,12 @@ def get_user_from_db_by_username(username_query: str) -> User | None:
     return user_obj
 
 async def log_user_from_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user:
+    # Backlog updates are logged in bulk by flush_catch_up_batch.
+    catch_up_update = is_catch_up_update(update)
+    if update.effective_user and not catch_up_update:
         update_user_in_db(update.effective_user)
     
-    if update.message and update.message.reply_to_message and update.message.reply_to_message.from_user:
+    if update.message and update.message.reply_to_message and update.message.reply_to_message.from_user and not catch_up_update:
         update_user_in_db(update.message.reply_to_message.from_user)
 
     chat = update.effective_chat
@@ -339,7 +1099,7 @@ async def log_user_from_interaction(update: Update, context: ContextTypes.DEFAUL
         if 'known_chats' not in context.bot_data:
             context.bot_data['known_chats'] = set()
             try:
-                with sqlite3.connect(DB_NAME) as conn:
+                with connect_db() as conn:
                     cursor = conn.cursor()
                     known_ids = {row[0] for row in cursor.execute("SELECT chat_id FROM bot_chats")}
                     context.bot_data['known_chats'] = known_ids
@@ -348,15 +1108,18 @@ async def log_user_from_interaction(update: Update, context: ContextTypes.DEFAUL
                 logger.error(f"Could not preload known chats into cache: {e}")
 
         if chat.id not in context.bot_data['known_chats']:
-            logger.info(f"Passively discovered and adding new chat to DB: {chat.title} ({chat.id})")
+            hot_logger.info(f"Passively discovered and adding new chat to DB: {chat.title} ({chat.id})")
             add_chat_to_db(chat.id, chat.title or f"Untitled Chat {chat.id}")
             context.bot_data['known_chats'].add(chat.id)
 
+        if update.effective_user and not update.effective_user.is_bot and not catch_up_update:
+            record_chat_sighting(chat.id, update.effective_user.id)
+
 def get_all_sudo_users_from_db() -> List[Tuple[int, str]]:
     conn = None
     sudo_list = []
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("SELECT user_id, timestamp FROM sudo_users ORDER BY timestamp DESC")
         rows = cursor.fetchall()
@@ -490,7 +1253,7 @@ def get_readable_time_delta(delta: timedelta) -> str:
 def add_to_gban(user_id: int, banned_by_id: int, reason: str | None) -> bool:
     reason = reason or "No reason provided."
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             timestamp = datetime.now(timezone.utc).isoformat()
             cursor.execute(
@@ -504,7 +1267,7 @@ def add_to_gban(user_id: int, banned_by_id: int, reason: str | None) -> bool:
 
 def remove_from_gban(user_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM global_bans WHERE user_id = ?", (user_id,))
             return cursor.rowcount > 0
@@ -514,7 +1277,7 @@ def remove_from_gban(user_id: int) -> bool:
 
 def get_gban_reason(user_id: int) -> str | None:
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT reason FROM global_bans WHERE user_id = ?", (user_id,))
             row = cursor.fetchone()
@@ -523,9 +1286,59 @@ def get_gban_reason(user_id: int) -> str | None:
         logger.error(f"SQLite error checking gban status for user {user_id}: {e}")
         return None
 
+def get_gban_reasons_bulk(user_ids: list[int]) -> dict[int, str]:
+    """Looks up many users at once. Returns {user_id: reason} for the gbanned ones."""
+    if not user_ids:
+        return {}
+    unique_ids = list(set(user_ids))
+    found: dict[int, str] = {}
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(unique_ids), 500):
+                chunk = unique_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT user_id, reason FROM global_bans WHERE user_id IN ({placeholders})", chunk)
+                found.update({row[0]: row[1] for row in cursor.fetchall()})
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error checking gban status for {len(unique_ids)} users: {e}")
+    return found
+
+def get_sighted_gbanned_users(chat_id: int) -> List[Tuple[int, str]]:
+    """Returns globally banned users that have been seen in the given chat."""
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT g.user_id, g.reason FROM global_bans g "
+                "JOIN chat_sightings s ON s.user_id = g.user_id WHERE s.chat_id = ?",
+                (chat_id,)
+            )
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error fetching sighted gbanned users for chat {chat_id}: {e}")
+        return []
+
+def get_gban_batch(after_user_id: int | None, limit: int) -> List[Tuple[int, str]]:
+    """Pages through the gban list ordered by user_id, so large lists are never loaded at once."""
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            if after_user_id is None:
+                cursor.execute("SELECT user_id, reason FROM global_bans ORDER BY user_id LIMIT ?", (limit,))
+            else:
+                cursor.execute(
+                    "SELECT user_id, reason FROM global_bans WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after_user_id, limit)
+                )
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error paging gban list: {e}")
+        return []
+
 def add_chat_to_db(chat_id: int, chat_title: str):
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             timestamp = datetime.now(timezone.utc).isoformat()
             cursor.execute(
@@ -536,17 +1349,59 @@ def add_chat_to_db(chat_id: int, chat_title: str):
         logger.error(f"Failed to add chat {chat_id} to DB: {e}")
 
 def remove_chat_from_db(chat_id: int):
+    PENDING_CHAT_SIGHTINGS.difference_update({sighting for sighting in PENDING_CHAT_SIGHTINGS if sighting[0] == chat_id})
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM bot_chats WHERE chat_id = ?", (chat_id,))
+            cursor.execute("DELETE FROM chat_sightings WHERE chat_id = ?", (chat_id,))
     except sqlite3.Error as e:
         logger.error(f"Failed to remove chat {chat_id} from DB: {e}")
 
+PENDING_CHAT_SIGHTINGS: set[tuple[int, int]] = set()
+
+def record_chat_sighting(chat_id: int, user_id: int):
+    """Remembers that a user was seen in a group, used by the gban sweep. Written in bulk by flush_chat_sightings."""
+    PENDING_CHAT_SIGHTINGS.add((chat_id, user_id))
+
+def take_pending_chat_sightings() -> set[tuple[int, int]]:
+    pending = set(PENDING_CHAT_SIGHTINGS)
+    PENDING_CHAT_SIGHTINGS.clear()
+    return pending
+
+async def flush_chat_sightings(context: ContextTypes.DEFAULT_TYPE) -> None:
+    pending = take_pending_chat_sightings()
+    if pending:
+        await asyncio.to_thread(record_chat_sightings_bulk, pending)
+
+def remove_chat_sighting(chat_id: int, user_id: int):
+    PENDING_CHAT_SIGHTINGS.discard((chat_id, user_id))
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM chat_sightings WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+    except sqlite3.Error as e:
+        logger.error(f"Failed to remove sighting of user {user_id} in chat {chat_id}: {e}")
+
+def record_chat_sightings_bulk(sightings: set[tuple[int, int]]) -> None:
+    """record_chat_sighting for many (chat_id, user_id) pairs in one transaction."""
+    if not sightings:
+        return
+    try:
+        with connect_db() as conn:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            conn.executemany(
+                "INSERT INTO chat_sightings (chat_id, user_id, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id, user_id) DO UPDATE SET last_seen = excluded.last_seen",
+                [(chat_id, user_id, timestamp) for chat_id, user_id in sightings]
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to record {len(sightings)} chat sightings: {e}")
+
 def is_gban_enforced(chat_id: int) -> bool:
     """Checks if gban enforcement is enabled for a specific chat."""
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             res = cursor.execute(
                 "SELECT enforce_gban FROM bot_chats WHERE chat_id = ?", (chat_id,)
@@ -577,7 +1432,7 @@ async def check_username_protection(target_mention: str, context: ContextTypes.D
 async def get_themed_gif(context: ContextTypes.DEFAULT_TYPE, search_terms: list[str]) -> str | None:
     if not TENOR_API_KEY: return None
     if not search_terms: logger.warning("No search terms for get_themed_gif."); return None
-    search_term = random.choice(search_terms); logger.info(f"Searching Tenor: '{search_term}'")
+    search_term = random.choice(search_terms); hot_logger.info(f"Searching Tenor: '{search_term}'")
     url = "https://tenor.googleapis.com/v2/search"; params = { "q": search_term, "key": TENOR_API_KEY, "client_key": "my_cat_bot_project_py", "limit": 15, "media_filter": "gif", "contentfilter": "medium", "random": "true" }
     try:
         response = requests.get(url, params=params, timeout=7)
@@ -590,7 +1445,7 @@ async def get_themed_gif(context: ContextTypes.DEFAULT_TYPE, search_terms: list[
         if results:
             selected_gif = random.choice(results); gif_url = selected_gif.get("media_formats", {}).get("gif", {}).get("url")
             if not gif_url: gif_url = selected_gif.get("media_formats", {}).get("tinygif", {}).get("url")
-            if gif_url: logger.info(f"Found GIF URL: {gif_url}"); return gif_url
+            if gif_url: hot_logger.info(f"Found GIF URL: {gif_url}"); return gif_url
             else: logger.warning(f"Could not extract GIF URL from Tenor item for '{search_term}'.")
         else: logger.warning(f"No results on Tenor for '{search_term}'."); logger.debug(f"Tenor response (no results): {data}")
     except requests.exceptions.Timeout: logger.error(f"Timeout fetching GIF from Tenor for '{search_term}'.")
@@ -630,10 +1485,19 @@ HELP_TEXT = """
 /unpin - Unpin the replied message. 📍
 /purge &lt;silent&gt; - Deletes user messages up to the replied-to message. 🗑
 /report &lt;ID/@user/reply&gt; [reason] - Report user. ⚠️
+/filter &lt;keyword&gt; &lt;reply&gt; - Auto-reply when the keyword is said. 💬
+<i>Note: Use "quotes" for multi-word keywords, or reply to a message to use it as the answer</i>
+/stop &lt;keyword&gt; - Remove a filter. 🛑
+/filters - List the filters in this chat. 📃
 
 <b>Security:</b>
 /enforcegban &lt;yes/no&gt; - Enable/disable Global Ban enforcement in this chat. 🛡️
 <i>(Chat Creator only)</i>
+/antiflood [on|off|&lt;count&gt; &lt;seconds&gt;|action &lt;mute|kick|ban&gt;] - Configure flood protection. 🌊
+/antiraid [on|off|&lt;joins&gt; &lt;seconds&gt;|action &lt;lock|mute|ban&gt;] - Configure join raid protection. 🚨
+/addblock &lt;word/domain&gt;[, ...] - Delete messages containing these words or links. 🚫
+/unblock &lt;word/domain&gt;[, ...] - Remove entries from the blocklist. ✅
+/blocklist - Show this chat's blocklist. 📃
 
 <b>4FUN Commands:</b>
 /gif - Get a random cat GIF! 🖼️
@@ -673,6 +1537,10 @@ OWNER_COMMANDS_TEXT = """
 /listsudo - List all users with sudo privileges.
 /addsudo &lt;ID/@user/reply&gt; - Grants SUDO (bot admin) permissions to a user.
 /delsudo &lt;ID/@user/reply&gt; - Revokes SUDO (bot admin) permissions from a user.
+/metrics - Show handler and Bot API call counts with latency percentiles.
+/dbstats [N] - Show the N most expensive SQL statements and recent slow queries.
+/profile &lt;seconds&gt; - Run a sampling profiler and send back collapsed stacks and a top-functions summary.
+/mem [stop] - Show RSS, cache sizes and allocation growth since the previous call.
 """
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2134,56 +3002,33 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     uptime_delta = datetime.now() - BOT_START_TIME 
     readable_uptime = get_readable_time_delta(uptime_delta)
 
-    known_users_count = "N/A"
-    blacklisted_count = "N/A"
-    sudo_users_count = "N/A"
-    gban_count = "N/A"
-    chat_count = "N/A"
-
-    try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM users")
-            count_result_users = cursor.fetchone()
-            if count_result_users:
-                known_users_count = str(count_result_users[0])
-
-            cursor.execute("SELECT COUNT(*) FROM blacklist")
-            count_result_blacklist = cursor.fetchone()
-            if count_result_blacklist:
-                blacklisted_count = str(count_result_blacklist[0])
-                
-            cursor.execute("SELECT COUNT(*) FROM sudo_users")
-            count_result_sudo = cursor.fetchone()
-            if count_result_sudo:
-                sudo_users_count = str(count_result_sudo[0])
-
-            cursor.execute("SELECT COUNT(*) FROM global_bans")
-            count_result_gban = cursor.fetchone()
-            if count_result_gban:
-                gban_count = str(count_result_gban[0])
-                
-            cursor.execute("SELECT COUNT(*) FROM bot_chats")
-            count_result_chats = cursor.fetchone()
-            if count_result_chats:
-                chat_count = str(count_result_chats[0])
-            
-    except sqlite3.Error as e:
-        logger.error(f"SQLite error fetching counts for /status: {e}", exc_info=True)
-        known_users_count = "DB Error"
-        blacklisted_count = "DB Error"
-        sudo_users_count = "DB Error"
-        gban_count = "DB Error"
-        chat_count = "DB Error"
-    except Exception as e:
-        logger.error(f"Unexpected error fetching counts for /status: {e}", exc_info=True)
-        known_users_count = "Error"
-        blacklisted_count = "Error"
-        sudo_users_count = "Error"
-        gban_count = "Error"
-        chat_count = "Error"
-
+    counters = get_table_counters()
+    if counters:
+        known_users_count, blacklisted_count, sudo_users_count, gban_count, chat_count = (
+            str(counters.get(table_name, "N/A")) for table_name in STATUS_COUNTED_TABLES
+        )
+    else:
+        known_users_count = blacklisted_count = sudo_users_count = gban_count = chat_count = "DB Error"
+
+    uptime_seconds = max(uptime_delta.total_seconds(), 1)
+    handler_totals = merge_latency_histograms(HANDLER_METRICS.values())
+    api_totals = merge_latency_histograms(API_CALL_METRICS.values())
+    api_pool = HTTP_POOL_STATS.get('api', {'size': 0, 'current': 0, 'peak': 0, 'saturated': 0})
+    cache_ratios = []
+    for cache_name, cache_stats in sorted(context.bot_data.get('cache_stats', {}).items()):
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        cache_ratios.append(f"{cache_name} {cache_stats['hits'] / lookups * 100:.0f}%" if lookups else f"{cache_name} n/a")
+
+    catch_up_report = context.bot_data.get('catch_up_report')
+    if CATCHUP_STATE['active']:
+        catch_up_status = f"catching up, <code>{CATCHUP_STATE['seen']}</code> of ~<code>{CATCHUP_STATE['pending_at_start']}</code> seen"
+    elif catch_up_report:
+        catch_up_status = (
+            f"<code>{catch_up_report['seen']}</code> drained in <code>{catch_up_report['duration']:.1f}s</code> "
+            f"(dropped <code>{catch_up_report['dropped']}</code>, batched <code>{catch_up_report['batched']}</code>)"
+        )
+    else:
+        catch_up_status = "<code>none</code>"
     status_lines = [
         "<b>Purrrr! Bot Status:</b> ✨\n",
         f"<b>• State:</b> Ready & Purring! 🐾",
@@ -2193,8 +3038,31 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f" <b>• 👀 Known Users:</b> <code>{known_users_count}</code>",
         f" <b>• 🛡 Sudo Users:</b> <code>{sudo_users_count}</code>",
         f" <b>• 🚫 Blacklisted Users:</b> <code>{blacklisted_count}</code>",
-        f" <b>• 🌍 Globally Banned Users:</b> <code>{gban_count}</code>"
+        f" <b>• 🌍 Globally Banned Users:</b> <code>{gban_count}</code>\n",
+        "<b>🚀 Throughput:</b>",
+        f" <b>• Handler calls:</b> <code>{handler_totals['count']}</code> (<code>{handler_totals['count'] / uptime_seconds:.2f}/s</code>)",
+        f" <b>• Handler p95 latency:</b> <code>{histogram_percentile(handler_totals, 0.95) * 1000:.0f}ms</code>",
+        f" <b>• Bot API calls:</b> <code>{api_totals['count']}</code> (<code>{api_totals['count'] / uptime_seconds:.2f}/s</code>)",
+        f" <b>• Update queue:</b> <code>{UPDATE_DISPATCH_STATS['waiting']}</code> waiting (peak <code>{UPDATE_DISPATCH_STATS['peak_waiting']}</code>), "
+        f"<code>{UPDATE_DISPATCH_STATS['running']}/{UPDATE_CONCURRENCY}</code> running, wait p95 <code>{histogram_percentile(UPDATE_WAIT_HISTOGRAM, 0.95) * 1000:.0f}ms</code>",
+        f" <b>• Outbound queue:</b> <code>{api_pool['current']}/{api_pool['size']}</code> in flight (peak <code>{api_pool['peak']}</code>, saturated <code>{api_pool['saturated']}</code>)",
+        f" <b>• Restart backlog:</b> {catch_up_status}",
+        f" <b>• Cache hit ratios:</b> <code>{html.escape(', '.join(cache_ratios)) or 'N/A'}</code>\n",
+        "<b>⏱ Event Loop Lag:</b>",
+        f" <b>• Percentiles:</b> <code>{get_loop_lag_summary()}</code>",
+        f" <b>• Stalls over {LOOP_LAG_THRESHOLD * 1000:.0f}ms:</b> <code>{LOOP_LAG_STATE['stalls']}</code>"
     ]
+    if LOOP_LAG_EVENTS:
+        last_stall = LOOP_LAG_EVENTS[-1]
+        status_lines.append(
+            f" <b>• Last stall:</b> <code>{last_stall['stalled_for'] * 1000:.0f}ms</code> in "
+            f"<code>{html.escape(last_stall['handler'])}</code> at <code>{last_stall['time'].strftime('%H:%M:%S')}</code>"
+        )
+    if SHARD_INDEX is not None:
+        status_lines.append(
+            f"\n<b>🧩 Shard:</b> <code>{SHARD_INDEX}</code> of <code>{SHARD_COUNT}</code> (pid <code>{os.getpid()}</code>). "
+            f"Throughput and lag figures cover this shard only."
+        )
 
     status_msg = "\n".join(status_lines)
     await update.message.reply_html(status_msg)
@@ -2806,9 +3674,13 @@ async def handle_new_group_members(update: Update, context: ContextTypes.DEFAULT
             except Exception as e:
                 logger.error(f"Failed to send join notification to owner for group {chat.id}: {e}")
 
+    joined_users = [member for member in update.message.new_chat_members if member.id != context.bot.id]
+    await check_join_raid(update, context, joined_users)
+
     if not is_gban_enforced(chat.id):
         return
 
+    candidates: list[User] = []
     for member in update.message.new_chat_members:
         if member.id == context.bot.id:
             continue
@@ -2823,17 +3695,83 @@ async def handle_new_group_members(update: Update, context: ContextTypes.DEFAULT
                      logger.error(f"Failed to send owner welcome message: {e}")
             continue
 
-        gban_reason = get_gban_reason(member.id)
-        if gban_reason:
-            logger.info(f"G-banned user {member.id} tried to join {chat.id}. Removing.")
-            try:
-                await context.bot.ban_chat_member(chat_id=chat.id, user_id=member.id)
-                await update.message.reply_text(
-                    f"User {member.mention_html()} was removed because they are globally banned.\n<b>Reason:</b> {html.escape(gban_reason)}",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                logger.error(f"Failed to enforce gban on new member {member.id} in {chat.id}: {e}")
+        candidates.append(member)
+
+    gban_reasons = get_gban_reasons_bulk([member.id for member in candidates])
+    members_to_ban = [member for member in candidates if member.id in gban_reasons]
+    if not members_to_ban:
+        return
+
+    logger.info(f"{len(members_to_ban)} g-banned user(s) tried to join {chat.id}. Removing.")
+    ban_semaphore = asyncio.Semaphore(GBAN_JOIN_BAN_CONCURRENCY)
+
+    async def ban_joined_member(member: User) -> None:
+        async with ban_semaphore:
+            await context.bot.ban_chat_member(chat_id=chat.id, user_id=member.id)
+
+    results = await asyncio.gather(*(ban_joined_member(member) for member in members_to_ban), return_exceptions=True)
+    removals: list[tuple[User, str]] = []
+    for member, result in zip(members_to_ban, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to enforce gban on new member {member.id} in {chat.id}: {result}")
+            continue
+        removals.append((member, gban_reasons[member.id]))
+    queue_gban_join_notices(context, chat.id, removals)
+
+def queue_gban_join_notices(context: ContextTypes.DEFAULT_TYPE, chat_id: int, removals: list[tuple[User, str]]) -> None:
+    """Queues the gban removals from one join event as a single notice.
+
+    The first batch in a chat is announced right away and opens a GBAN_JOIN_NOTICE_WINDOW;
+    removals from later join events inside that window are collected into one follow-up
+    notice when it closes, so a raid produces at most two notices per window.
+    """
+    if not removals:
+        return
+    pending = context.bot_data.setdefault('gban_join_notices', {})
+    entries = [(member.mention_html(), reason) for member, reason in removals]
+    if chat_id in pending:
+        pending[chat_id].extend(entries)
+        return
+
+    pending[chat_id] = []
+    context.job_queue.run_once(
+        flush_gban_join_notices,
+        when=0,
+        data={'chat_id': chat_id, 'removed': entries},
+        name=f"gban_join_notice_now_{chat_id}"
+    )
+    context.job_queue.run_once(
+        flush_gban_join_notices,
+        when=GBAN_JOIN_NOTICE_WINDOW,
+        data={'chat_id': chat_id},
+        name=f"gban_join_notice_{chat_id}"
+    )
+
+async def flush_gban_join_notices(context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = context.job.data['chat_id']
+    removed = context.job.data.get('removed')
+    if removed is None:
+        removed = context.bot_data.get('gban_join_notices', {}).pop(chat_id, [])
+    if not removed:
+        return
+
+    if len(removed) == 1:
+        user_mention, reason = removed[0]
+        message_text = f"User {user_mention} was removed because they are globally banned.\n<b>Reason:</b> {html.escape(reason)}"
+    else:
+        lines = [f"<b>{len(removed)} users were removed because they are globally banned:</b>\n"]
+        for user_mention, reason in removed:
+            line = f"• {user_mention} — {html.escape(reason)}"
+            if len("\n".join(lines)) + len(line) > 3900:
+                lines.append(f"<i>...and {len(removed) - (len(lines) - 1)} more.</i>")
+                break
+            lines.append(line)
+        message_text = "\n".join(lines)
+
+    try:
+        await context.bot.send_message(chat_id=chat_id, text=message_text, parse_mode=ParseMode.HTML)
+    except TelegramError as e:
+        logger.error(f"Failed to send gban join notice to {chat_id}: {e}")
 
 async def handle_left_group_member(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.message and update.message.left_chat_member:
@@ -2841,6 +3779,8 @@ async def handle_left_group_member(update: Update, context: ContextTypes.DEFAULT
             chat_id = update.effective_chat.id
             logger.info(f"Bot was removed from chat {chat_id}.")
             remove_chat_from_db(chat_id)
+        else:
+            remove_chat_sighting(update.effective_chat.id, update.message.left_chat_member.id)
 
 async def send_operational_log(context: ContextTypes.DEFAULT_TYPE, message: str, parse_mode: str = ParseMode.HTML) -> None:
     """
@@ -3068,6 +4008,9 @@ async def check_gban_on_message(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     chat = update.effective_chat
+    if is_catch_up_update(update):
+        # flush_catch_up_batch checks the whole backlog with one query.
+        return
     
     if not is_gban_enforced(chat.id):
         return
@@ -3289,7 +4232,7 @@ async def propagate_unban(context: ContextTypes.DEFAULT_TYPE) -> None:
 
     chats_to_scan = []
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect_db() as conn:
             cursor = conn.cursor()
             chats_to_scan = [row[0] for row in cursor.execute("SELECT chat_id FROM bot_chats")]
     except sqlite3.Error as e:
@@ -3333,6 +4276,111 @@ async def propagate_unban(context: ContextTypes.DEFAULT_TYPE) -> None:
         parse_mode=ParseMode.HTML
     )
 
+async def _sweep_enforce_gban(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> str:
+    """Bans one gbanned user if they are currently a regular member. Returns the outcome."""
+    try:
+        member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+    except telegram.error.BadRequest as e:
+        if "user not found" in str(e).lower() or "member not found" in str(e).lower():
+            return "absent"
+        logger.warning(f"Gban sweep could not check user {user_id} in {chat_id}: {e}")
+        return "failed"
+    except TelegramError as e:
+        logger.warning(f"Gban sweep could not check user {user_id} in {chat_id}: {e}")
+        return "failed"
+
+    if member.status not in [ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED]:
+        return "absent" if member.status in [ChatMemberStatus.LEFT, ChatMemberStatus.BANNED] else "skipped"
+
+    try:
+        await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+        logger.info(f"Gban sweep removed user {user_id} from chat {chat_id}.")
+        return "banned"
+    except TelegramError as e:
+        logger.warning(f"Gban sweep failed to ban user {user_id} in {chat_id}: {e}")
+        return "failed"
+
+async def sweep_gban_chat(context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = context.job.data['chat_id']
+    active_sweeps = context.bot_data.setdefault('gban_sweeps', set())
+    if chat_id in active_sweeps:
+        logger.info(f"Gban sweep already running for chat {chat_id}, skipping.")
+        return
+    active_sweeps.add(chat_id)
+
+    try:
+        try:
+            bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
+            if not (bot_member.status == "administrator" and bot_member.can_restrict_members):
+                logger.info(f"Skipping gban sweep in {chat_id}: bot lacks ban rights.")
+                return
+        except TelegramError as e:
+            logger.error(f"Could not verify bot permissions for gban sweep in {chat_id}: {e}")
+            return
+
+        start_time = datetime.now()
+        results = {"banned": 0, "failed": 0, "skipped": 0, "absent": 0}
+        checked_ids: set[int] = set()
+        probed = 0
+        probe_limit_hit = False
+        aborted = False
+
+        logger.info(f"Starting gban sweep in chat {chat_id}.")
+        await flush_chat_sightings(context)
+
+        for user_id, _ in get_sighted_gbanned_users(chat_id):
+            if not is_gban_enforced(chat_id):
+                aborted = True
+                break
+            checked_ids.add(user_id)
+            if is_privileged_user(user_id):
+                continue
+            results[await _sweep_enforce_gban(context, chat_id, user_id)] += 1
+            await asyncio.sleep(GBAN_SWEEP_ACTION_DELAY)
+
+        last_user_id = None
+        while not aborted and not probe_limit_hit:
+            batch = get_gban_batch(last_user_id, GBAN_SWEEP_BATCH_SIZE)
+            if not batch:
+                break
+            for user_id, _ in batch:
+                last_user_id = user_id
+                if user_id in checked_ids or is_privileged_user(user_id):
+                    continue
+                if probed >= GBAN_SWEEP_PROBE_LIMIT:
+                    probe_limit_hit = True
+                    break
+                if not is_gban_enforced(chat_id):
+                    aborted = True
+                    break
+                probed += 1
+                results[await _sweep_enforce_gban(context, chat_id, user_id)] += 1
+                await asyncio.sleep(GBAN_SWEEP_ACTION_DELAY)
+
+        duration = get_readable_time_delta(datetime.now() - start_time)
+        logger.info(f"Gban sweep in {chat_id} finished in {duration}: {results}, probed={probed}, aborted={aborted}.")
+
+        summary_lines = [
+            "🧹 <b>Meow! Global Ban sweep finished.</b>\n",
+            f"<b>• Removed:</b> <code>{results['banned']}</code>",
+            f"<b>• Checked from recent activity:</b> <code>{len(checked_ids)}</code>",
+            f"<b>• Checked by lookup:</b> <code>{probed}</code>",
+            f"<b>• Duration:</b> <code>{duration}</code>",
+        ]
+        if results['failed']:
+            summary_lines.append(f"<b>• Failed:</b> <code>{results['failed']}</code>")
+        if probe_limit_hit:
+            summary_lines.append("\n<i>The global ban list is large, so only part of it was checked. Others will be removed when they speak or join.</i>")
+        if aborted:
+            summary_lines.append("\n<i>Sweep stopped because enforcement was disabled.</i>")
+
+        try:
+            await context.bot.send_message(chat_id=chat_id, text="\n".join(summary_lines), parse_mode=ParseMode.HTML)
+        except TelegramError as e:
+            logger.error(f"Failed to send gban sweep summary to {chat_id}: {e}")
+    finally:
+        active_sweeps.discard(chat_id)
+
 async def enforce_gban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat
     user = update.effective_user
@@ -3378,7 +4426,7 @@ async def enforce_gban_command(update: Update, context: ContextTypes.DEFAULT_TYP
         
         setting = 1
         try:
-            with sqlite3.connect(DB_NAME) as conn:
+            with connect_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("UPDATE bot_chats SET enforce_gban = ? WHERE chat_id = ?", (setting, chat.id))
                 if cursor.rowcount == 0:
@@ -3390,10 +4438,20 @@ async def enforce_gban_command(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("An error occurred while updating the setting.")
             return
 
+        sweep_notice = ""
+        if not permission_notice:
+            context.job_queue.run_once(
+                sweep_gban_chat,
+                when=1,
+                data={'chat_id': chat.id},
+                name=f"gban_sweep_{chat.id}"
+            )
+            sweep_notice = "\n\n<i>I'm also checking current members against the global ban list in the background.</i>"
+
         await update.message.reply_html(
             f"✅ <b>Meow! Global Ban enforcement is now ENABLED for this chat.</b>\n\n"
             f"I will now automatically remove any user from the global ban list who tries to join or speak here."
-            f"{permission_notice}"
+            f"{permission_notice}{sweep_notice}"
         )
         return
 
@@ -3404,7 +4462,7 @@ async def enforce_gban_command(update: Update, context: ContextTypes.DEFAULT_TYP
         
         setting = 0
         try:
-            with sqlite3.connect(DB_NAME) as conn:
+            with connect_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("UPDATE bot_chats SET enforce_gban = ? WHERE chat_id = ?", (setting, chat.id))
                 conn.commit()
@@ -3419,19 +4477,705 @@ async def enforce_gban_command(update: Update, context: ContextTypes.DEFAULT_TYP
             "This may expose your community to users banned for severe offenses like spam, harassment, or illegal activities."
         )
 
-# --- Sudo commands ---
-async def add_sudo_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+# --- Anti-Flood ---
+def get_antiflood_settings(chat_id: int) -> dict:
+    settings = {
+        'flood_enabled': False, 'flood_limit': ANTIFLOOD_DEFAULT_LIMIT,
+        'flood_window': ANTIFLOOD_DEFAULT_WINDOW, 'flood_action': ANTIFLOOD_DEFAULT_ACTION,
+        'raid_enabled': False, 'raid_limit': ANTIRAID_DEFAULT_LIMIT,
+        'raid_window': ANTIRAID_DEFAULT_WINDOW, 'raid_action': ANTIRAID_DEFAULT_ACTION,
+    }
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            row = cursor.execute(
+                "SELECT flood_enabled, flood_limit, flood_window, flood_action, "
+                "raid_enabled, raid_limit, raid_window, raid_action FROM antiflood_settings WHERE chat_id = ?",
+                (chat_id,)
+            ).fetchone()
+            if row:
+                settings.update({
+                    'flood_enabled': bool(row[0]), 'flood_limit': row[1], 'flood_window': row[2], 'flood_action': row[3],
+                    'raid_enabled': bool(row[4]), 'raid_limit': row[5], 'raid_window': row[6], 'raid_action': row[7],
+                })
+    except sqlite3.Error as e:
+        logger.error(f"Could not load anti-flood settings for chat {chat_id}: {e}")
+    return settings
+
+def save_antiflood_settings(chat_id: int, settings: dict) -> bool:
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO antiflood_settings (chat_id, flood_enabled, flood_limit, flood_window, flood_action, "
+                "raid_enabled, raid_limit, raid_window, raid_action) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, int(settings['flood_enabled']), settings['flood_limit'], settings['flood_window'], settings['flood_action'],
+                 int(settings['raid_enabled']), settings['raid_limit'], settings['raid_window'], settings['raid_action'])
+            )
+            return True
+    except sqlite3.Error as e:
+        logger.error(f"Could not save anti-flood settings for chat {chat_id}: {e}")
+        return False
+
+def get_cached_antiflood_settings(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> dict:
+    """Settings are read on every group message, so they are kept in an LRU of ANTIFLOOD_SETTINGS_CACHE_MAX_CHATS chats."""
+    cache = context.bot_data.setdefault('antiflood_settings', OrderedDict())
+    settings = cache.get(chat_id)
+    record_cache_lookup(context, 'antiflood', settings is not None)
+    if settings is not None:
+        cache.move_to_end(chat_id)
+        return settings
+    settings = get_antiflood_settings(chat_id)
+    cache_antiflood_settings(context, chat_id, settings)
+    return settings
+
+def cache_antiflood_settings(context: ContextTypes.DEFAULT_TYPE, chat_id: int, settings: dict) -> None:
+    cache = context.bot_data.setdefault('antiflood_settings', OrderedDict())
+    cache[chat_id] = settings
+    cache.move_to_end(chat_id)
+    while len(cache) > ANTIFLOOD_SETTINGS_CACHE_MAX_CHATS:
+        cache.popitem(last=False)
+
+def _hit_rate_window(windows: dict, key, limit: int, period: int, now: float) -> bool:
+    """Records one event in a fixed-size ring buffer and reports whether `limit` events fell within `period` seconds."""
+    window = windows.get(key)
+    if window is None or window.maxlen != limit:
+        window = deque(maxlen=limit)
+        windows[key] = window
+    window.append(now)
+    if len(window) == limit and now - window[0] <= period:
+        window.clear()
+        return True
+    return False
+
+async def _punish_flooder(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, action: str) -> bool:
+    until_date = datetime.now(timezone.utc) + ANTIFLOOD_PUNISH_DURATION
+    try:
+        if action == "ban":
+            await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+        elif action == "kick":
+            await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+            await context.bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
+        else:
+            muted_permissions = ChatPermissions(can_send_messages=False, can_send_audios=False, can_send_documents=False, can_send_photos=False, can_send_videos=False, can_send_video_notes=False, can_send_voice_notes=False, can_send_polls=False, can_send_other_messages=False, can_add_web_page_previews=False)
+            await context.bot.restrict_chat_member(chat_id=chat_id, user_id=user_id, permissions=muted_permissions, until_date=until_date, use_independent_chat_permissions=True)
+        return True
+    except TelegramError as e:
+        logger.warning(f"Anti-flood could not {action} user {user_id} in chat {chat_id}: {e}")
+        return False
+
+async def check_flood(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.effective_message
+    chat = update.effective_chat
     user = update.effective_user
-    if user.id != OWNER_ID:
-        logger.warning(f"Unauthorized /addsudo attempt by user {user.id}.")
+    if not message or not user or not chat or chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        return
+    if message.sender_chat or user.id == OWNER_ID or user.id == context.bot.id:
         return
 
-    target_user: User | None = None
+    settings = get_cached_antiflood_settings(context, chat.id)
+    if not settings['flood_enabled']:
+        return
 
-    if update.message.reply_to_message:
-        if update.message.reply_to_message.from_user:
-            target_user = update.message.reply_to_message.from_user
-        else:
+    windows = context.bot_data.setdefault('flood_windows', OrderedDict())
+    key = (chat.id, user.id)
+    if key in windows:
+        windows.move_to_end(key)
+    flooded = _hit_rate_window(windows, key, settings['flood_limit'], settings['flood_window'], moderation_clock(update))
+    if len(windows) > ANTIFLOOD_MAX_TRACKED_USERS:
+        windows.popitem(last=False)
+    if not flooded:
+        return
+
+    if is_privileged_user(user.id):
+        return
+    try:
+        member = await context.bot.get_chat_member(chat.id, user.id)
+        if member.status in ["creator", "administrator"]:
+            return
+    except TelegramError as e:
+        logger.warning(f"Could not check flooder {user.id} status in chat {chat.id}: {e}")
+        return
+
+    action = settings['flood_action']
+    logger.info(f"Flood detected from user {user.id} in chat {chat.id}, applying '{action}'.")
+    if await _punish_flooder(context, chat.id, user.id, action):
+        action_display = {"mute": "muted", "kick": "kicked", "ban": "banned"}.get(action, action)
+        duration_note = f" for {get_readable_time_delta(ANTIFLOOD_PUNISH_DURATION)}" if action == "mute" else ""
+        try:
+            await context.bot.send_message(
+                chat.id,
+                text=f"🌊 Meow! Too many messages. {user.mention_html()} has been <b>{action_display}</b>{duration_note}.",
+                parse_mode=ParseMode.HTML
+            )
+        except TelegramError as e:
+            logger.error(f"Failed to send flood notice in chat {chat.id}: {e}")
+        raise ApplicationHandlerStop
+
+async def check_join_raid(update: Update, context: ContextTypes.DEFAULT_TYPE, joined_users: list[User]) -> None:
+    chat = update.effective_chat
+    if not joined_users or chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        return
+    settings = get_cached_antiflood_settings(context, chat.id)
+    if not settings['raid_enabled']:
+        return
+
+    now = moderation_clock(update)
+    raid_until = context.bot_data.setdefault('raid_until', {})
+    raid_active = raid_until.get(chat.id, 0) > now
+    action = settings['raid_action']
+    # Admin IDs are fetched once per raid instead of once per join event, which would flood the Bot API mid-raid.
+    raid_admins = context.bot_data.setdefault('raid_admins', {})
+
+    if not raid_active:
+        raid_admins.pop(chat.id, None)
+        join_windows = context.bot_data.setdefault('join_windows', {})
+        for _ in joined_users:
+            if _hit_rate_window(join_windows, chat.id, settings['raid_limit'], settings['raid_window'], now):
+                raid_active = True
+        if not raid_active:
+            return
+
+        raid_until[chat.id] = now + ANTIRAID_DURATION.total_seconds()
+        if raid_until[chat.id] > time.time():
+            logger.warning(f"Join raid detected in chat {chat.id}. Raid mode '{action}' enabled.")
+            await start_raid_mode(context, chat.id, action)
+        else:
+            # Found while replaying a restart backlog: the raid period is already over, so only its joiners are dealt with.
+            logger.warning(f"Join raid detected in chat {chat.id} in the restart backlog; it has already ended.")
+
+    if action in ["mute", "ban"]:
+        targets = [member for member in joined_users if not is_privileged_user(member.id)]
+        if not targets:
+            return
+        admin_ids = raid_admins.get(chat.id)
+        if admin_ids is None:
+            try:
+                admin_ids = {admin.user.id for admin in await context.bot.get_chat_administrators(chat.id)}
+            except TelegramError as e:
+                logger.warning(f"Could not fetch admins of chat {chat.id} during raid, not restricting new members: {e}")
+                return
+            raid_admins[chat.id] = admin_ids
+        for member in targets:
+            if member.id in admin_ids:
+                continue
+            await _punish_flooder(context, chat.id, member.id, action)
+
+async def start_raid_mode(context: ContextTypes.DEFAULT_TYPE, chat_id: int, action: str) -> None:
+    duration_display = get_readable_time_delta(ANTIRAID_DURATION)
+    if action == "lock":
+        try:
+            full_chat = await context.bot.get_chat(chat_id)
+            await context.bot.set_chat_permissions(chat_id, ChatPermissions.no_permissions(), use_independent_chat_permissions=True)
+            context.job_queue.run_once(
+                end_raid_lock,
+                when=ANTIRAID_DURATION,
+                data={'chat_id': chat_id, 'permissions': full_chat.permissions},
+                name=f"raid_unlock_{chat_id}"
+            )
+            notice = f"🚨 <b>Meow! Raid detected.</b>\nThe chat is locked for <code>{duration_display}</code>."
+        except TelegramError as e:
+            logger.error(f"Failed to lock chat {chat_id} during raid: {e}")
+            notice = "🚨 <b>Meow! Raid detected</b>, but I couldn't lock the chat. Please check my permissions."
+    else:
+        action_display = "muted" if action == "mute" else "banned"
+        notice = f"🚨 <b>Meow! Raid detected.</b>\nNew members will be <b>{action_display}</b> for the next <code>{duration_display}</code>."
+
+    try:
+        await context.bot.send_message(chat_id, text=notice, parse_mode=ParseMode.HTML)
+    except TelegramError as e:
+        logger.error(f"Failed to send raid notice in chat {chat_id}: {e}")
+
+async def end_raid_lock(context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = context.job.data['chat_id']
+    permissions = context.job.data['permissions'] or ChatPermissions(
+        can_send_messages=True, can_send_audios=True, can_send_documents=True,
+        can_send_photos=True, can_send_videos=True, can_send_video_notes=True,
+        can_send_voice_notes=True, can_send_polls=True, can_send_other_messages=True,
+        can_add_web_page_previews=True
+    )
+    try:
+        await context.bot.set_chat_permissions(chat_id, permissions, use_independent_chat_permissions=True)
+        await context.bot.send_message(chat_id, text="✅ Meow! Raid mode is over, the chat is unlocked.")
+    except TelegramError as e:
+        logger.error(f"Failed to unlock chat {chat_id} after raid: {e}")
+
+async def _antiflood_settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str) -> None:
+    chat = update.effective_chat
+    command = "antiflood" if kind == "flood" else "antiraid"
+    actions = ANTIFLOOD_ACTIONS if kind == "flood" else ANTIRAID_ACTIONS
+    unit = "messages" if kind == "flood" else "joins"
+
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await update.message.reply_text("Meow. This command can only be used in groups.")
+        return
+    if not await _can_user_perform_action(update, context, 'can_restrict_members', "Meeeow! You need to be an admin with rights to restrict users in this chat."):
+        return
+
+    settings = dict(get_cached_antiflood_settings(context, chat.id))
+    args = [arg.lower() for arg in context.args]
+    usage = f"Usage: /{command} [on|off] | /{command} &lt;{unit}&gt; &lt;seconds&gt; | /{command} action &lt;{'|'.join(actions)}&gt;"
+
+    if not args:
+        state = "Enabled" if settings[f'{kind}_enabled'] else "Disabled"
+        await update.message.reply_html(
+            f"<b>{'🌊 Anti-Flood' if kind == 'flood' else '🚨 Anti-Raid'} settings:</b>\n\n"
+            f"<b>• State:</b> <code>{state}</code>\n"
+            f"<b>• Limit:</b> <code>{settings[f'{kind}_limit']} {unit} / {settings[f'{kind}_window']}s</code>\n"
+            f"<b>• Action:</b> <code>{settings[f'{kind}_action']}</code>\n\n{usage}"
+        )
+        return
+
+    if args[0] in ["on", "off", "yes", "no"]:
+        settings[f'{kind}_enabled'] = args[0] in ["on", "yes"]
+        reply = f"✅ Meow! {'Anti-Flood' if kind == 'flood' else 'Anti-Raid'} is now <b>{'ENABLED' if settings[f'{kind}_enabled'] else 'DISABLED'}</b>."
+    elif args[0] == "action" and len(args) == 2 and args[1] in actions:
+        settings[f'{kind}_action'] = args[1]
+        reply = f"✅ Meow! Action set to <code>{args[1]}</code>."
+    elif len(args) == 2 and args[0].isdigit() and args[1].isdigit() and 2 <= int(args[0]) <= 200 and 1 <= int(args[1]) <= 3600:
+        settings[f'{kind}_limit'] = int(args[0])
+        settings[f'{kind}_window'] = int(args[1])
+        reply = f"✅ Meow! Limit set to <code>{args[0]} {unit}</code> per <code>{args[1]}s</code>."
+    else:
+        await update.message.reply_html(usage)
+        return
+
+    if not save_antiflood_settings(chat.id, settings):
+        await update.message.reply_text("An error occurred while updating the setting.")
+        return
+    cache_antiflood_settings(context, chat.id, settings)
+    publish_cache_invalidation('antiflood', chat.id)
+    await update.message.reply_html(reply)
+
+async def antiflood_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _antiflood_settings_command(update, context, "flood")
+
+async def antiraid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _antiflood_settings_command(update, context, "raid")
+
+# --- Blocklist ---
+BLOCKLIST_LINK_PATTERN = re.compile(r"^(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}/?$", re.IGNORECASE)
+
+def get_blocklist_entries(chat_id: int) -> List[Tuple[str, bool]]:
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT entry, is_link FROM blocklist_entries WHERE chat_id = ? ORDER BY entry", (chat_id,))
+            return [(row[0], bool(row[1])) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error loading blocklist for chat {chat_id}: {e}")
+        return []
+
+def add_blocklist_entries(chat_id: int, entries: list[str], added_by_id: int) -> int:
+    added = 0
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            timestamp = datetime.now(timezone.utc).isoformat()
+            for entry in entries:
+                is_link = bool(BLOCKLIST_LINK_PATTERN.match(entry))
+                if is_link:
+                    entry = re.sub(r"^https?://", "", entry).rstrip("/")
+                cursor.execute(
+                    "INSERT OR IGNORE INTO blocklist_entries (chat_id, entry, is_link, added_by_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    (chat_id, entry, int(is_link), added_by_id, timestamp)
+                )
+                added += cursor.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error adding blocklist entries for chat {chat_id}: {e}")
+    return added
+
+def remove_blocklist_entries(chat_id: int, entries: list[str]) -> int:
+    removed = 0
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            for entry in entries:
+                cursor.execute("DELETE FROM blocklist_entries WHERE chat_id = ? AND entry = ?", (chat_id, re.sub(r"^https?://", "", entry).rstrip("/")))
+                removed += cursor.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error removing blocklist entries for chat {chat_id}: {e}")
+    return removed
+
+def compile_blocklist(entries: List[Tuple[str, bool]]) -> re.Pattern | None:
+    """Folds all of a chat's entries into one regex so a message is scanned once, not once per entry."""
+    words = sorted((re.escape(entry) for entry, is_link in entries if not is_link), key=len, reverse=True)
+    links = sorted((re.escape(entry) for entry, is_link in entries if is_link), key=len, reverse=True)
+    alternatives = []
+    if words:
+        alternatives.append(rf"(?<!\w)(?:{'|'.join(words)})(?!\w)")
+    if links:
+        alternatives.append(rf"(?<![\w-])(?:{'|'.join(links)})(?![\w-])")
+    if not alternatives:
+        return None
+    return re.compile("|".join(alternatives), re.IGNORECASE)
+
+def get_blocklist_matcher(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> re.Pattern | None:
+    matchers = context.bot_data.setdefault('blocklist_matchers', OrderedDict())
+    record_cache_lookup(context, 'blocklist', chat_id in matchers)
+    if chat_id in matchers:
+        matchers.move_to_end(chat_id)
+        return matchers[chat_id]
+    return cache_blocklist_matcher(context, chat_id)
+
+def cache_blocklist_matcher(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> re.Pattern | None:
+    """Compiles and caches the chat's matcher. Match stats live only as long as the chat's cached matcher."""
+    matchers = context.bot_data.setdefault('blocklist_matchers', OrderedDict())
+    stats = context.bot_data.setdefault('blocklist_stats', {})
+    matcher = matchers[chat_id] = compile_blocklist(get_blocklist_entries(chat_id))
+    matchers.move_to_end(chat_id)
+    if matcher is None:
+        stats.pop(chat_id, None)
+    while len(matchers) > BLOCKLIST_CACHE_MAX_CHATS:
+        evicted_chat_id, _ = matchers.popitem(last=False)
+        stats.pop(evicted_chat_id, None)
+    return matcher
+
+def rebuild_blocklist_matcher(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    cache_blocklist_matcher(context, chat_id)
+    publish_cache_invalidation('blocklist', chat_id)
+
+async def check_blocklist(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.effective_message
+    chat = update.effective_chat
+    user = update.effective_user
+    if not message or not chat or chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        return
+
+    matcher = get_blocklist_matcher(context, chat.id)
+    if matcher is None:
+        return
+
+    text_parts = [message.text or message.caption or ""]
+    for entity in (message.entities or message.caption_entities or ()):
+        if entity.url:
+            text_parts.append(entity.url)
+
+    started = time.perf_counter()
+    match = matcher.search("\n".join(text_parts))
+    elapsed = time.perf_counter() - started
+
+    stats = context.bot_data.setdefault('blocklist_stats', {}).setdefault(chat.id, {'checks': 0, 'matches': 0, 'total_time': 0.0, 'max_time': 0.0})
+    stats['checks'] += 1
+    stats['total_time'] += elapsed
+    if elapsed > stats['max_time']:
+        stats['max_time'] = elapsed
+    if not match:
+        return
+    stats['matches'] += 1
+
+    if user and (user.id == OWNER_ID or user.id == context.bot.id or is_privileged_user(user.id)):
+        return
+    if user and not message.sender_chat:
+        try:
+            member = await context.bot.get_chat_member(chat.id, user.id)
+            if member.status in ["creator", "administrator"]:
+                return
+        except TelegramError as e:
+            logger.warning(f"Could not check blocklist offender {user.id} in chat {chat.id}: {e}")
+
+    try:
+        await message.delete()
+        logger.info(f"Deleted message {message.message_id} in chat {chat.id} matching blocklist entry '{match.group(0)}'.")
+    except TelegramError as e:
+        logger.warning(f"Could not delete blocklisted message in chat {chat.id}: {e}")
+        return
+    raise ApplicationHandlerStop
+
+def _parse_blocklist_args(context: ContextTypes.DEFAULT_TYPE) -> list[str]:
+    raw = " ".join(context.args)
+    return [entry.strip().lower() for entry in re.split(r"[,\n]", raw) if entry.strip()]
+
+async def add_blocklist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await update.message.reply_text("Meow. This command can only be used in groups.")
+        return
+    if not await _can_user_perform_action(update, context, 'can_delete_messages', "Meeeow! You need to be an admin with 'Delete Messages' permission to use this command."):
+        return
+
+    entries = _parse_blocklist_args(context)
+    if not entries:
+        await update.message.reply_text("Usage: /addblock <word, phrase or domain>[, ...]")
+        return
+    if any(len(entry) > BLOCKLIST_MAX_ENTRY_LENGTH for entry in entries):
+        await update.message.reply_text(f"Mrow? Entries can be at most {BLOCKLIST_MAX_ENTRY_LENGTH} characters long.")
+        return
+    if len(get_blocklist_entries(chat.id)) + len(entries) > BLOCKLIST_MAX_ENTRIES:
+        await update.message.reply_text(f"Mrow? This chat can have at most {BLOCKLIST_MAX_ENTRIES} blocklist entries.")
+        return
+
+    added = add_blocklist_entries(chat.id, entries, update.effective_user.id)
+    rebuild_blocklist_matcher(context, chat.id)
+    await update.message.reply_html(f"✅ Meow! Added <code>{added}</code> new blocklist entr{'y' if added == 1 else 'ies'}. Matching messages will be deleted.")
+
+async def remove_blocklist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await update.message.reply_text("Meow. This command can only be used in groups.")
+        return
+    if not await _can_user_perform_action(update, context, 'can_delete_messages', "Meeeow! You need to be an admin with 'Delete Messages' permission to use this command."):
+        return
+
+    entries = _parse_blocklist_args(context)
+    if not entries:
+        await update.message.reply_text("Usage: /unblock <word, phrase or domain>[, ...]")
+        return
+
+    removed = remove_blocklist_entries(chat.id, entries)
+    rebuild_blocklist_matcher(context, chat.id)
+    if removed:
+        await update.message.reply_html(f"✅ Meow! Removed <code>{removed}</code> blocklist entr{'y' if removed == 1 else 'ies'}.")
+    else:
+        await update.message.reply_text("ℹ️ Mrow? None of those are on this chat's blocklist.")
+
+async def list_blocklist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await update.message.reply_text("Meow. This command can only be used in groups.")
+        return
+
+    entries = get_blocklist_entries(chat.id)
+    if not entries:
+        await update.message.reply_text("Meeeow! This chat's blocklist is empty. 😼")
+        return
+
+    lines = [f"<b>🚫 Blocklist for this chat ({len(entries)}):</b>\n"]
+    for entry, is_link in entries:
+        line = f"• <code>{html.escape(entry)}</code>{' 🔗' if is_link else ''}"
+        if len("\n".join(lines)) + len(line) > 3500:
+            lines.append("<i>...list truncated.</i>")
+            break
+        lines.append(line)
+
+    stats = context.bot_data.get('blocklist_stats', {}).get(chat.id)
+    if stats and stats['checks']:
+        avg_us = stats['total_time'] / stats['checks'] * 1_000_000
+        lines.append(
+            f"\n<b>• Checked:</b> <code>{stats['checks']}</code> | <b>Matched:</b> <code>{stats['matches']}</code>\n"
+            f"<b>• Match time:</b> <code>{avg_us:.1f}µs avg, {stats['max_time'] * 1_000_000:.1f}µs max</code>"
+        )
+    await update.message.reply_html("\n".join(lines))
+
+# --- Filters ---
+FILTER_TRIE_END = "\0"
+FILTER_TRIE_NODE_BYTES = 232
+
+def get_chat_filters(chat_id: int) -> List[Tuple[str, str]]:
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT keyword, reply_html FROM chat_filters WHERE chat_id = ? ORDER BY keyword", (chat_id,))
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error loading filters for chat {chat_id}: {e}")
+        return []
+
+def add_chat_filter(chat_id: int, keyword: str, reply_html: str, added_by_id: int) -> bool:
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO chat_filters (chat_id, keyword, reply_html, added_by_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, keyword, reply_html, added_by_id, datetime.now(timezone.utc).isoformat())
+            )
+            return True
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error adding filter '{keyword}' for chat {chat_id}: {e}")
+        return False
+
+def remove_chat_filter(chat_id: int, keyword: str) -> bool:
+    try:
+        with connect_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM chat_filters WHERE chat_id = ? AND keyword = ?", (chat_id, keyword))
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error removing filter '{keyword}' for chat {chat_id}: {e}")
+        return False
+
+def _is_filter_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+def build_filter_trie(keywords: list[str]) -> tuple[dict, int]:
+    """Builds a character trie of the keywords. Returns the trie and its node count."""
+    root: dict = {}
+    node_count = 1
+    for keyword in keywords:
+        node = root
+        for char in keyword:
+            if char not in node:
+                node[char] = {}
+                node_count += 1
+            node = node[char]
+        node[FILTER_TRIE_END] = keyword
+    return root, node_count
+
+def match_filter_trie(trie: dict, text: str) -> str | None:
+    """Returns the longest keyword at the earliest position that stands as a whole word in the text."""
+    text = text.lower()
+    length = len(text)
+    for start in range(length):
+        if text[start] not in trie or (start and _is_filter_word_char(text[start - 1])):
+            continue
+        node = trie
+        found = None
+        position = start
+        while position < length:
+            node = node.get(text[position])
+            if node is None:
+                break
+            position += 1
+            if FILTER_TRIE_END in node and (position == length or not _is_filter_word_char(text[position])):
+                found = node[FILTER_TRIE_END]
+        if found:
+            return found
+    return None
+
+def get_filter_cache_entry(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> dict:
+    """Per-chat tries are built on first use and kept in an LRU, evicting idle chats past FILTERS_CACHE_BUDGET_BYTES."""
+    cache = context.bot_data.setdefault('filter_cache', OrderedDict())
+    entry = cache.get(chat_id)
+    record_cache_lookup(context, 'filters', entry is not None)
+    if entry is not None:
+        cache.move_to_end(chat_id)
+        return entry
+
+    chat_filters = get_chat_filters(chat_id)
+    trie, node_count = build_filter_trie([keyword for keyword, _ in chat_filters])
+    replies = dict(chat_filters)
+    entry = {
+        'trie': trie,
+        'replies': replies,
+        'size': node_count * FILTER_TRIE_NODE_BYTES + sum(len(reply) for reply in replies.values()),
+    }
+    cache[chat_id] = entry
+    context.bot_data['filter_cache_bytes'] = context.bot_data.get('filter_cache_bytes', 0) + entry['size']
+
+    while context.bot_data['filter_cache_bytes'] > FILTERS_CACHE_BUDGET_BYTES and len(cache) > 1:
+        _, evicted = cache.popitem(last=False)
+        context.bot_data['filter_cache_bytes'] -= evicted['size']
+    return entry
+
+def invalidate_filter_cache(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    apply_cache_invalidation(context.bot_data, 'filters', chat_id)
+    publish_cache_invalidation('filters', chat_id)
+
+async def check_chat_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    chat = update.effective_chat
+    if not message or not chat or chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        return
+    text = message.text or message.caption
+    if not text:
+        return
+
+    entry = get_filter_cache_entry(context, chat.id)
+    if not entry['replies']:
+        return
+    keyword = match_filter_trie(entry['trie'], text)
+    if keyword is None:
+        return
+
+    try:
+        await send_safe_reply(update, context, text=entry['replies'][keyword], parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    except TelegramError as e:
+        logger.error(f"Failed to send filter reply for '{keyword}' in chat {chat.id}: {e}")
+
+def _parse_filter_keyword(raw: str) -> tuple[str | None, str]:
+    """Splits '<keyword> <reply>' where the keyword may be a "quoted phrase"."""
+    raw = raw.strip()
+    if raw.startswith('"'):
+        closing = raw.find('"', 1)
+        if closing == -1:
+            return None, ""
+        return raw[1:closing].strip().lower(), raw[closing + 1:].strip()
+    parts = raw.split(None, 1)
+    if not parts:
+        return None, ""
+    return parts[0].lower(), parts[1].strip() if len(parts) > 1 else ""
+
+async def add_filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    message = update.message
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await message.reply_text("Meow. This command can only be used in groups.")
+        return
+    if not await _can_user_perform_action(update, context, 'can_change_info', "Meeeow! You need to be an admin with 'Change Info' permission to manage filters."):
+        return
+
+    command_parts = (message.text or "").split(None, 1)
+    keyword, reply_text = _parse_filter_keyword(command_parts[1] if len(command_parts) > 1 else "")
+    reply_html = html.escape(reply_text) if reply_text else ""
+    if not reply_html and message.reply_to_message:
+        reply_html = message.reply_to_message.text_html or message.reply_to_message.caption_html or ""
+
+    if not keyword or not reply_html:
+        await message.reply_text('Usage: /filter <keyword or "phrase"> <reply> (or reply to a message to use it as the answer)')
+        return
+    if len(keyword) > FILTER_KEYWORD_MAX_LENGTH:
+        await message.reply_text(f"Mrow? Keywords can be at most {FILTER_KEYWORD_MAX_LENGTH} characters long.")
+        return
+    existing_keywords = {existing for existing, _ in get_chat_filters(chat.id)}
+    if keyword not in existing_keywords and len(existing_keywords) >= FILTERS_MAX_PER_CHAT:
+        await message.reply_text(f"Mrow? This chat already has the maximum of {FILTERS_MAX_PER_CHAT} filters.")
+        return
+
+    if not add_chat_filter(chat.id, keyword, reply_html, update.effective_user.id):
+        await message.reply_text("An error occurred while saving the filter.")
+        return
+    invalidate_filter_cache(context, chat.id)
+    await message.reply_html(f"✅ Meow! I'll now reply to <code>{html.escape(keyword)}</code>.")
+
+async def stop_filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    message = update.message
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await message.reply_text("Meow. This command can only be used in groups.")
+        return
+    if not await _can_user_perform_action(update, context, 'can_change_info', "Meeeow! You need to be an admin with 'Change Info' permission to manage filters."):
+        return
+
+    command_parts = (message.text or "").split(None, 1)
+    keyword, _ = _parse_filter_keyword(command_parts[1] if len(command_parts) > 1 else "")
+    if not keyword:
+        await message.reply_text("Usage: /stop <keyword>")
+        return
+
+    if remove_chat_filter(chat.id, keyword):
+        invalidate_filter_cache(context, chat.id)
+        await message.reply_html(f"✅ Meow! Filter <code>{html.escape(keyword)}</code> stopped.")
+    else:
+        await message.reply_html(f"ℹ️ Mrow? There is no filter for <code>{html.escape(keyword)}</code>.")
+
+async def list_filters_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat = update.effective_chat
+    if chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        await update.message.reply_text("Meow. This command can only be used in groups.")
+        return
+
+    chat_filters = get_chat_filters(chat.id)
+    if not chat_filters:
+        await update.message.reply_text("Meeeow! There are no filters in this chat. 😼")
+        return
+
+    lines = [f"<b>🐾 Filters in this chat ({len(chat_filters)}):</b>\n"]
+    lines.extend(f"• <code>{html.escape(keyword)}</code>" for keyword, _ in chat_filters)
+    await update.message.reply_html("\n".join(lines))
+
+# --- Sudo commands ---
+async def add_sudo_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id != OWNER_ID:
+        logger.warning(f"Unauthorized /addsudo attempt by user {user.id}.")
+        return
+
+    target_user: User | None = None
+
+    if update.message.reply_to_message:
+        if update.message.reply_to_message.from_user:
+            target_user = update.message.reply_to_message.from_user
+        else:
             await update.message.reply_text("Mrow? You must reply to a user's message.")
             return
     elif context.args:
@@ -3677,40 +5421,1477 @@ async def list_sudo_users_command(update: Update, context: ContextTypes.DEFAULT_
 
     await update.message.reply_html(message_text)
 
-# --- Main Function ---
-def main() -> None:
-    init_db()
-    logger.info("Initializing bot application...")
-    application = Application.builder().token(BOT_TOKEN).build()
-
-    connect_timeout_val = 20.0
-    read_timeout_val = 80.0
-    write_timeout_val = 80.0
-    pool_timeout_val = 20.0
-
-    custom_request_settings = HTTPXRequest(
-        connect_timeout=connect_timeout_val,
-        read_timeout=read_timeout_val,
-        write_timeout=write_timeout_val,
-        pool_timeout=pool_timeout_val
+# --- Metrics ---
+HANDLER_METRICS: dict[tuple[str, str], dict] = {}
+API_CALL_METRICS: dict[tuple[str, str], dict] = {}
+HTTP_POOL_STATS: dict[str, dict] = {}
+CURRENT_HANDLER: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default="background")
+
+def new_latency_histogram() -> dict:
+    return {'count': 0, 'errors': 0, 'sum': 0.0, 'buckets': [0] * (len(METRICS_LATENCY_BUCKETS) + 1)}
+
+def observe_latency(histogram: dict, seconds: float, error: bool = False) -> None:
+    histogram['count'] += 1
+    histogram['sum'] += seconds
+    if error:
+        histogram['errors'] += 1
+    for index, upper_bound in enumerate(METRICS_LATENCY_BUCKETS):
+        if seconds <= upper_bound:
+            histogram['buckets'][index] += 1
+            return
+    histogram['buckets'][-1] += 1
+
+def merge_latency_histograms(histograms) -> dict:
+    merged = new_latency_histogram()
+    for histogram in histograms:
+        merged['count'] += histogram['count']
+        merged['errors'] += histogram['errors']
+        merged['sum'] += histogram['sum']
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+    return merged
+
+def histogram_percentile(histogram: dict, quantile: float) -> float:
+    """Estimates a percentile by interpolating inside the bucket it falls in."""
+    if not histogram['count']:
+        return 0.0
+    rank = quantile * histogram['count']
+    seen = 0
+    lower_bound = 0.0
+    for index, bucket_count in enumerate(histogram['buckets']):
+        upper_bound = METRICS_LATENCY_BUCKETS[index] if index < len(METRICS_LATENCY_BUCKETS) else METRICS_LATENCY_BUCKETS[-1] * 2
+        if bucket_count and seen + bucket_count >= rank:
+            return lower_bound + (upper_bound - lower_bound) * ((rank - seen) / bucket_count)
+        seen += bucket_count
+        lower_bound = upper_bound
+    return lower_bound
+
+def instrument_handler_callback(callback):
+    """Wraps a handler callback so each call is counted and timed per handler and chat type."""
+    handler_name = getattr(callback, "__name__", "handler")
+
+    async def instrumented_callback(update: object, context: ContextTypes.DEFAULT_TYPE):
+        chat = getattr(update, "effective_chat", None)
+        chat_type = chat.type if chat else "none"
+        failed = False
+        handler_token = CURRENT_HANDLER.set(handler_name)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            CURRENT_HANDLER.reset(handler_token)
+            key = (handler_name, chat_type)
+            histogram = HANDLER_METRICS.get(key)
+            if histogram is None:
+                histogram = HANDLER_METRICS[key] = new_latency_histogram()
+            elapsed = time.perf_counter() - started
+            observe_latency(histogram, elapsed, failed)
+            if METRICS_SAMPLE_SINK is not None:
+                METRICS_SAMPLE_SINK("handler", handler_name, elapsed)
+
+    instrumented_callback.__name__ = handler_name
+    instrumented_callback.__wrapped__ = callback
+    return instrumented_callback
+
+def instrument_application_handlers(application: Application) -> int:
+    wrapped = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if not hasattr(handler.callback, "__wrapped__"):
+                handler.callback = instrument_handler_callback(handler.callback)
+                wrapped += 1
+    return wrapped
+
+def _request_payload_size(request_data) -> int:
+    if request_data is None:
+        return 0
+    if request_data.contains_files:
+        size = 0
+        for value in (request_data.multipart_data or {}).values():
+            content = value[1] if isinstance(value, tuple) else value
+            size += len(content) if isinstance(content, (bytes, str)) else 0
+        return size
+    return len(request_data.json_payload)
+
+# --- Update Dispatcher ---
+UPDATE_DISPATCH_STATS = {'waiting': 0, 'peak_waiting': 0, 'running': 0, 'peak_running': 0}
+UPDATE_WAIT_HISTOGRAM = new_latency_histogram()
+
+def update_ordering_key(update: object) -> int | None:
+    """Updates sharing a key are processed strictly in order: the chat, or the user for chat-less updates."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return user.id if user is not None else None
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different chats in parallel while keeping each chat's updates in arrival order.
+
+    PTB's own semaphore only bounds how many updates are admitted (max_pending). An update first waits for its
+    chat's turn and only then for one of the max_running slots, so a busy chat cannot occupy every slot with
+    updates that are just waiting behind each other.
+    """
+
+    def __init__(self, max_running: int, max_pending: int):
+        super().__init__(max_concurrent_updates=max(max_running, max_pending))
+        self.max_running = max_running
+        self._running_slots = None
+        self._chat_locks: dict[int, dict] = {}
+
+    async def initialize(self) -> None:
+        self._running_slots = asyncio.Semaphore(self.max_running)
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        record_inbound_update(update)
+        key = update_ordering_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chat_locks.get(key)
+            if entry is None:
+                entry = self._chat_locks[key] = {'lock': asyncio.Lock(), 'users': 0}
+            entry['users'] += 1
+        stats = UPDATE_DISPATCH_STATS
+        stats['waiting'] += 1
+        stats['peak_waiting'] = max(stats['peak_waiting'], stats['waiting'])
+        queued = time.perf_counter()
+        started = False
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, and PTB starts one task per update in arrival order.
+            if entry is not None:
+                await entry['lock'].acquire()
+            try:
+                async with self._running_slots:
+                    started = True
+                    stats['waiting'] -= 1
+                    stats['running'] += 1
+                    stats['peak_running'] = max(stats['peak_running'], stats['running'])
+                    observe_latency(UPDATE_WAIT_HISTOGRAM, time.perf_counter() - queued)
+                    try:
+                        await coroutine
+                    finally:
+                        stats['running'] -= 1
+            finally:
+                if entry is not None:
+                    entry['lock'].release()
+        finally:
+            if not started:
+                stats['waiting'] -= 1
+                coroutine.close()
+            if entry is not None:
+                entry['users'] -= 1
+                if entry['users'] == 0:
+                    del self._chat_locks[key]
+
+# --- Startup Timing ---
+STARTUP_PHASES = {
+    'import': "import",
+    'init_db': "init_db",
+    'build': "application build",
+    'handlers': "handler registration",
+    'first_get_updates': "until first getUpdates",
+    'webhook_ready': "until webhook set",
+}
+STARTUP_TIMINGS: dict[str, float] = {}
+STARTUP_STATE = {'last_mark': STARTUP_STARTED}
+
+def mark_startup_phase(phase: str) -> None:
+    """Records the time since the previous phase ended (or since the module started importing) under `phase`."""
+    now = time.perf_counter()
+    STARTUP_TIMINGS[phase] = now - STARTUP_STATE['last_mark']
+    STARTUP_STATE['last_mark'] = now
+
+def log_startup_breakdown() -> None:
+    total = time.perf_counter() - STARTUP_STARTED
+    STARTUP_TIMINGS['total'] = total
+    breakdown = ", ".join(f"{label} {STARTUP_TIMINGS[phase] * 1000:.0f}ms" for phase, label in STARTUP_PHASES.items() if phase in STARTUP_TIMINGS)
+    message = f"Cold start took {total * 1000:.0f}ms ({breakdown}); target is {STARTUP_TARGET_SECONDS * 1000:.0f}ms."
+    if total > STARTUP_TARGET_SECONDS:
+        logger.warning(f"{message} Over target!")
+    else:
+        logger.info(message)
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that records every Bot API call per method and per triggering handler, and how busy its connection pool is."""
+
+    def __init__(self, pool_name: str, connection_pool_size: int, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        # A call that starts while every connection is in use has to wait for one (up to pool_timeout).
+        # With HTTP/2 several calls share a connection, so this over-reports saturation.
+        self.pool_stats = HTTP_POOL_STATS[pool_name] = {'size': connection_pool_size, 'current': 0, 'peak': 0, 'saturated': 0, 'pool_timeouts': 0}
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        if api_method == "getUpdates" and 'first_get_updates' not in STARTUP_TIMINGS:
+            # Measured when the first long poll is sent: from here on the bot receives updates.
+            mark_startup_phase('first_get_updates')
+            log_startup_breakdown()
+        key = (api_method, CURRENT_HANDLER.get())
+        record = API_CALL_METRICS.get(key)
+        if record is None:
+            record = API_CALL_METRICS[key] = {**new_latency_histogram(), 'retry_after': 0, 'request_bytes': 0, 'response_bytes': 0}
+        record['request_bytes'] += _request_payload_size(request_data)
+        pool_stats = self.pool_stats
+        if pool_stats['current'] >= pool_stats['size']:
+            pool_stats['saturated'] += 1
+        pool_stats['current'] += 1
+        pool_stats['peak'] = max(pool_stats['peak'], pool_stats['current'])
+        started = time.perf_counter()
+        try:
+            status_code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception as e:
+            observe_latency(record, time.perf_counter() - started, error=True)
+            if isinstance(e, TimedOut) and "pool" in str(e).lower():
+                pool_stats['pool_timeouts'] += 1
+                logger.warning(f"Bot API connection pool exhausted on {api_method} (triggered by {key[1]}): {pool_stats['size']} connections busy.")
+            raise
+        finally:
+            pool_stats['current'] -= 1
+        observe_latency(record, time.perf_counter() - started, error=status_code >= 400)
+        record['response_bytes'] += len(payload)
+        if status_code == 429:
+            record['retry_after'] += 1
+            try:
+                retry_after = json.loads(payload).get("parameters", {}).get("retry_after")
+            except (ValueError, AttributeError):
+                retry_after = None
+            logger.warning(f"Bot API flood wait on {api_method} (triggered by {key[1]}): retry after {retry_after}s")
+        return status_code, payload
+
+def record_cache_lookup(context: ContextTypes.DEFAULT_TYPE, cache_name: str, hit: bool) -> None:
+    cache_stats = context.bot_data.setdefault('cache_stats', {}).setdefault(cache_name, {'hits': 0, 'misses': 0})
+    cache_stats['hits' if hit else 'misses'] += 1
+
+def _prometheus_labels(**labels) -> str:
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+def render_prometheus_histograms(name: str, help_text: str, histograms: dict, label_names: tuple[str, ...]) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for label_values, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, label_values))
+        cumulative = 0
+        for index, bucket_count in enumerate(histogram['buckets']):
+            cumulative += bucket_count
+            upper_bound = str(METRICS_LATENCY_BUCKETS[index]) if index < len(METRICS_LATENCY_BUCKETS) else "+Inf"
+            lines.append(f"{name}_bucket{_prometheus_labels(**labels, le=upper_bound)} {cumulative}")
+        lines.append(f"{name}_sum{_prometheus_labels(**labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{_prometheus_labels(**labels)} {histogram['count']}")
+    return lines
+
+def render_prometheus_metrics() -> str:
+    lines = [
+        "# HELP catbot_uptime_seconds Seconds since the bot started.",
+        "# TYPE catbot_uptime_seconds gauge",
+        f"catbot_uptime_seconds {(datetime.now() - BOT_START_TIME).total_seconds():.0f}",
+    ]
+    lines.extend(render_prometheus_histograms(
+        "catbot_handler_latency_seconds", "Time spent in each update handler.",
+        HANDLER_METRICS, ("handler", "chat_type")
+    ))
+    lines.extend(["# HELP catbot_handler_errors_total Handler calls that raised an exception.", "# TYPE catbot_handler_errors_total counter"])
+    for (handler_name, chat_type), histogram in sorted(HANDLER_METRICS.items()):
+        lines.append(f"catbot_handler_errors_total{_prometheus_labels(handler=handler_name, chat_type=chat_type)} {histogram['errors']}")
+    lines.extend(render_prometheus_histograms(
+        "catbot_api_call_latency_seconds", "Bot API round trip time per method and triggering handler.",
+        API_CALL_METRICS, ("method", "handler")
+    ))
+    for metric_name, field, help_text in (
+        ("catbot_api_call_errors_total", 'errors', "Bot API calls that failed or returned an error status."),
+        ("catbot_api_retry_after_total", 'retry_after', "Bot API calls rejected with a flood wait (HTTP 429)."),
+        ("catbot_api_request_bytes_total", 'request_bytes', "Bytes sent to the Bot API."),
+        ("catbot_api_response_bytes_total", 'response_bytes', "Bytes received from the Bot API."),
+    ):
+        lines.extend([f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} counter"])
+        for (api_method, handler_name), record in sorted(API_CALL_METRICS.items()):
+            lines.append(f"{metric_name}{_prometheus_labels(method=api_method, handler=handler_name)} {record[field]}")
+    for metric_name, field, metric_type, help_text in (
+        ("catbot_http_pool_size", 'size', "gauge", "Connections available in the HTTP connection pool."),
+        ("catbot_http_pool_in_flight", 'current', "gauge", "Requests currently using the HTTP connection pool."),
+        ("catbot_http_pool_in_flight_peak", 'peak', "gauge", "Highest number of concurrent requests seen on the pool."),
+        ("catbot_http_pool_saturated_total", 'saturated', "counter", "Requests that started while every pool connection was busy."),
+        ("catbot_http_pool_timeouts_total", 'pool_timeouts', "counter", "Requests that gave up waiting for a pool connection."),
+    ):
+        lines.extend([f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} {metric_type}"])
+        for pool_name, pool_stats in sorted(HTTP_POOL_STATS.items()):
+            lines.append(f"{metric_name}{_prometheus_labels(pool=pool_name)} {pool_stats[field]}")
+    lines.extend([
+        "# HELP catbot_updates_waiting Updates waiting for their chat's turn or a free processing slot.",
+        "# TYPE catbot_updates_waiting gauge",
+        f"catbot_updates_waiting {UPDATE_DISPATCH_STATS['waiting']}",
+        "# HELP catbot_updates_running Updates currently being processed.",
+        "# TYPE catbot_updates_running gauge",
+        f"catbot_updates_running {UPDATE_DISPATCH_STATS['running']}",
+    ])
+    lines.extend(render_prometheus_histograms(
+        "catbot_update_wait_seconds", "Time an update waited before its handlers started.", {(): UPDATE_WAIT_HISTOGRAM}, ()
+    ))
+    if BOT_RUN_MODE == "webhook":
+        lines.extend(["# HELP catbot_webhook_requests_total Webhook requests by outcome.", "# TYPE catbot_webhook_requests_total counter"])
+        for result, count in sorted(WEBHOOK_STATS['requests'].items()):
+            lines.append(f"catbot_webhook_requests_total{_prometheus_labels(result=result)} {count}")
+        lines.extend([
+            "# HELP catbot_webhook_connections Open connections to the webhook server.",
+            "# TYPE catbot_webhook_connections gauge",
+            f"catbot_webhook_connections {WEBHOOK_STATS['connections']}",
+            "# HELP catbot_webhook_received_bytes_total Update payload bytes received by the webhook.",
+            "# TYPE catbot_webhook_received_bytes_total counter",
+            f"catbot_webhook_received_bytes_total {WEBHOOK_STATS['bytes']}",
+        ])
+    lines.extend(["# HELP catbot_inbound_updates_total Updates received, by update type.", "# TYPE catbot_inbound_updates_total counter"])
+    for update_type, stats in sorted(INBOUND_UPDATE_STATS.items()):
+        lines.append(f"catbot_inbound_updates_total{_prometheus_labels(type=update_type)} {stats['count']}")
+    lines.extend([
+        "# HELP catbot_avoidable_updates_total Received updates of types no handler uses (avoidable with ALLOWED_UPDATES=auto).",
+        "# TYPE catbot_avoidable_updates_total counter",
+    ])
+    for update_type, stats in sorted(INBOUND_UPDATE_STATS.items()):
+        lines.append(f"catbot_avoidable_updates_total{_prometheus_labels(type=update_type)} {stats['avoidable']}")
+    lines.extend(["# HELP catbot_avoidable_update_bytes_total JSON size of those avoidable updates.", "# TYPE catbot_avoidable_update_bytes_total counter"])
+    for update_type, stats in sorted(INBOUND_UPDATE_STATS.items()):
+        lines.append(f"catbot_avoidable_update_bytes_total{_prometheus_labels(type=update_type)} {stats['avoidable_bytes']}")
+    if 'pending_at_start' in CATCHUP_STATE:
+        lines.extend([
+            "# HELP catbot_catch_up_active Whether the bot is still working through a restart backlog.",
+            "# TYPE catbot_catch_up_active gauge",
+            f"catbot_catch_up_active {int(CATCHUP_STATE['active'])}",
+            "# HELP catbot_catch_up_backlog_updates Pending updates Telegram reported at startup.",
+            "# TYPE catbot_catch_up_backlog_updates gauge",
+            f"catbot_catch_up_backlog_updates {CATCHUP_STATE['pending_at_start']}",
+            "# HELP catbot_catch_up_updates_total Backlog updates by how catch-up mode handled them.",
+            "# TYPE catbot_catch_up_updates_total counter",
+        ])
+        for outcome in ('ran', 'dropped', 'batched'):
+            lines.append(f"catbot_catch_up_updates_total{_prometheus_labels(outcome=outcome)} {CATCHUP_STATE[outcome]}")
+    if SHARD_STATS:
+        for metric_name, field, metric_type, help_text in (
+            ("catbot_shard_up", 'connected', "gauge", "Whether the shard's worker process is connected to the front."),
+            ("catbot_shard_routed_updates_total", 'routed', "counter", "Updates the front routed to the shard."),
+            ("catbot_shard_routed_bytes_total", 'bytes', "counter", "Bytes of updates the front sent to the shard."),
+            ("catbot_shard_dropped_updates_total", 'dropped', "counter", "Updates dropped because the shard was down and its buffer full."),
+            ("catbot_shard_restarts_total", 'restarts', "counter", "Times the shard's worker process was restarted."),
+            ("catbot_shard_cache_invalidations_total", 'invalidations', "counter", "Cache invalidations the shard broadcast to the others."),
+        ):
+            lines.extend([f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} {metric_type}"])
+            for shard, stats in sorted(SHARD_STATS.items()):
+                lines.append(f"{metric_name}{_prometheus_labels(shard=str(shard))} {int(stats[field])}")
+        lines.extend(["# HELP catbot_shard_buffered_updates Updates waiting for the shard's worker to (re)connect.", "# TYPE catbot_shard_buffered_updates gauge"])
+        for shard, buffer in sorted(SHARD_STATE['buffers'].items()):
+            lines.append(f"catbot_shard_buffered_updates{_prometheus_labels(shard=str(shard))} {len(buffer)}")
+        # Reported by the workers every SHARD_STATS_INTERVAL seconds.
+        for metric_name, field, metric_type, help_text in (
+            ("catbot_shard_cpu_seconds_total", 'cpu_seconds', "counter", "CPU time used by the shard's worker process."),
+            ("catbot_shard_rss_bytes", 'rss_bytes', "gauge", "Resident memory of the shard's worker process."),
+            ("catbot_shard_handler_calls_total", 'handler_calls', "counter", "Handler calls in the shard's worker."),
+            ("catbot_shard_handler_p95_seconds", 'handler_p95', "gauge", "p95 handler latency in the shard's worker."),
+            ("catbot_shard_updates_waiting", 'updates_waiting', "gauge", "Updates waiting for their chat's turn or a free slot in the worker."),
+            ("catbot_shard_updates_running", 'updates_running', "gauge", "Updates being processed by the worker."),
+            ("catbot_shard_update_wait_p95_seconds", 'update_wait_p95', "gauge", "p95 time updates waited before processing in the worker."),
+            ("catbot_shard_db_lock_wait_seconds_total", 'db_lock_wait_seconds', "counter", "Time the worker waited on SQLite locks held by other processes."),
+            ("catbot_shard_loop_stalls_total", 'loop_lag_stalls', "counter", "Event loop stalls in the worker."),
+            ("catbot_shard_catching_up", 'catching_up', "gauge", "Whether the worker is still in catch-up mode."),
+        ):
+            lines.extend([f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} {metric_type}"])
+            for shard, stats in sorted(SHARD_STATS.items()):
+                value = stats['snapshot'].get(field)
+                if value is not None:
+                    lines.append(f"{metric_name}{_prometheus_labels(shard=str(shard))} {float(value)}")
+    lines.extend(["# HELP catbot_startup_phase_seconds Time spent in each cold start phase.", "# TYPE catbot_startup_phase_seconds gauge"])
+    for phase, seconds in STARTUP_TIMINGS.items():
+        lines.append(f"catbot_startup_phase_seconds{_prometheus_labels(phase=phase)} {seconds:.6f}")
+    lines.extend(["# HELP catbot_lazy_import_seconds Time spent importing a lazily loaded module on first use.", "# TYPE catbot_lazy_import_seconds gauge"])
+    for module_name, seconds in LAZY_IMPORT_TIMINGS.items():
+        lines.append(f"catbot_lazy_import_seconds{_prometheus_labels(module=module_name)} {seconds:.6f}")
+    return "\n".join(lines) + "\n"
+
+async def _serve_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+        if path.split("?")[0] == "/metrics":
+            status_line, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", render_prometheus_metrics().encode()
+        else:
+            status_line, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status_line}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics request aborted: {e}")
+    finally:
+        writer.close()
+
+async def start_metrics_server(app: Application) -> None:
+    try:
+        app.bot_data['metrics_server'] = await asyncio.start_server(_serve_metrics_request, "127.0.0.1", METRICS_PORT)
+        logger.info(f"Prometheus metrics endpoint listening on http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+
+async def stop_metrics_server(app: Application) -> None:
+    server = app.bot_data.pop('metrics_server', None)
+    if server:
+        server.close()
+        await server.wait_closed()
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id != OWNER_ID:
+        logger.warning(f"Unauthorized /metrics attempt by user {user.id}.")
+        return
+
+    uptime_seconds = max((datetime.now() - BOT_START_TIME).total_seconds(), 1)
+    per_handler: dict[str, list[dict]] = {}
+    for (handler_name, _), histogram in HANDLER_METRICS.items():
+        per_handler.setdefault(handler_name, []).append(histogram)
+    if not per_handler:
+        await update.message.reply_text("Meow! No handler metrics recorded yet.")
+        return
+
+    merged = sorted(((name, merge_latency_histograms(histograms)) for name, histograms in per_handler.items()), key=lambda item: item[1]['count'], reverse=True)
+    total = merge_latency_histograms(histogram for _, histogram in merged)
+
+    rows = [f"{'handler':<26}{'calls':>7}{'err':>5}{'p50ms':>8}{'p95ms':>8}{'p99ms':>8}"]
+    for name, histogram in merged[:25]:
+        rows.append(
+            f"{name[:25]:<26}{histogram['count']:>7}{histogram['errors']:>5}"
+            f"{histogram_percentile(histogram, 0.5) * 1000:>8.0f}{histogram_percentile(histogram, 0.95) * 1000:>8.0f}{histogram_percentile(histogram, 0.99) * 1000:>8.0f}"
+        )
+
+    chat_type_counts: dict[str, int] = {}
+    for (_, chat_type), histogram in HANDLER_METRICS.items():
+        chat_type_counts[chat_type] = chat_type_counts.get(chat_type, 0) + histogram['count']
+
+    message_text = (
+        "<b>📈 Handler Metrics:</b>\n\n"
+        f"<b>• Calls:</b> <code>{total['count']}</code> (<code>{total['count'] / uptime_seconds:.2f}/s</code>)\n"
+        f"<b>• Errors:</b> <code>{total['errors']}</code>\n"
+        f"<b>• Latency:</b> <code>p50 {histogram_percentile(total, 0.5) * 1000:.0f}ms, p95 {histogram_percentile(total, 0.95) * 1000:.0f}ms, p99 {histogram_percentile(total, 0.99) * 1000:.0f}ms</code>\n"
+        f"<b>• By chat type:</b> <code>{html.escape(', '.join(f'{k}={v}' for k, v in sorted(chat_type_counts.items())))}</code>\n\n"
+        f"<pre>{html.escape(chr(10).join(rows))}</pre>"
     )
 
-    job_queue = JobQueue()
-    
-    application = (
-        Application.builder()
-        .token(BOT_TOKEN)
-        .request(custom_request_settings)
-        .job_queue(job_queue)
-        .build()
+    if API_CALL_METRICS:
+        per_method: dict[str, list[dict]] = {}
+        calls_per_handler: dict[str, int] = {}
+        retry_after_total = 0
+        for (api_method, handler_name), record in API_CALL_METRICS.items():
+            per_method.setdefault(api_method, []).append(record)
+            calls_per_handler[handler_name] = calls_per_handler.get(handler_name, 0) + record['count']
+            retry_after_total += record['retry_after']
+        api_rows = [f"{'method':<26}{'calls':>7}{'err':>5}{'p50ms':>8}{'p95ms':>8}{'kB out':>8}"]
+        for api_method, records in sorted(per_method.items(), key=lambda item: sum(r['count'] for r in item[1]), reverse=True)[:15]:
+            histogram = merge_latency_histograms(records)
+            request_kb = sum(r['request_bytes'] for r in records) / 1024
+            api_rows.append(
+                f"{api_method[:25]:<26}{histogram['count']:>7}{histogram['errors']:>5}"
+                f"{histogram_percentile(histogram, 0.5) * 1000:>8.0f}{histogram_percentile(histogram, 0.95) * 1000:>8.0f}{request_kb:>8.1f}"
+            )
+        top_callers = sorted(calls_per_handler.items(), key=lambda item: item[1], reverse=True)[:8]
+        message_text += (
+            f"\n\n<b>🌐 Bot API Calls:</b> (<code>{retry_after_total}</code> flood waits)\n"
+            f"<pre>{html.escape(chr(10).join(api_rows))}</pre>\n"
+            f"<b>• Top callers:</b> <code>{html.escape(', '.join(f'{name}={count}' for name, count in top_callers))}</code>"
+        )
+    if INBOUND_UPDATE_STATS:
+        inbound_total = sum(stats['count'] for stats in INBOUND_UPDATE_STATS.values())
+        avoidable_total = sum(stats['avoidable'] for stats in INBOUND_UPDATE_STATS.values())
+        avoidable_kb = sum(stats['avoidable_bytes'] for stats in INBOUND_UPDATE_STATS.values()) / 1024
+        inbound_summary = ', '.join(f"{update_type}={stats['count']}" for update_type, stats in sorted(INBOUND_UPDATE_STATS.items(), key=lambda item: item[1]['count'], reverse=True))
+        message_text += (
+            f"\n<b>• Inbound updates:</b> <code>{html.escape(inbound_summary)}</code>\n"
+            f"<b>• Unused by any handler:</b> <code>{avoidable_total}</code> of <code>{inbound_total}</code> (<code>{avoidable_kb:.1f} kB</code>)"
+            f" with allowed_updates=<code>{html.escape(ALLOWED_UPDATES_MODE)}</code>"
+        )
+    if HTTP_POOL_STATS:
+        pool_summaries = (
+            f"{name} {stats['current']}/{stats['size']} (peak {stats['peak']}, saturated {stats['saturated']}, timeouts {stats['pool_timeouts']})"
+            for name, stats in sorted(HTTP_POOL_STATS.items())
+        )
+        message_text += f"\n<b>• Connection pools:</b> <code>{html.escape('; '.join(pool_summaries))}</code>"
+    await update.message.reply_html(message_text)
+
+# --- Loop Lag Watchdog ---
+LOOP_LAG_SAMPLES_WINDOW: deque = deque(maxlen=LOOP_LAG_SAMPLES)
+LOOP_LAG_EVENTS: deque = deque(maxlen=LOOP_LAG_EVENTS_KEPT)
+LOOP_LAG_STATE = {'last_tick': 0.0, 'loop_thread_id': None, 'stalls': 0}
+
+def sample_percentile(samples, quantile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+def _running_handler_from_frame(frame) -> str:
+    while frame is not None:
+        if frame.f_code.co_name == "instrumented_callback" and "handler_name" in frame.f_locals:
+            return frame.f_locals["handler_name"]
+        frame = frame.f_back
+    return "background"
+
+def _watch_loop_lag(stop_event: threading.Event) -> None:
+    """Runs in a separate thread so the stack can be sampled while the loop is still blocked."""
+    sampled_tick = None
+    while not stop_event.wait(LOOP_LAG_INTERVAL / 2):
+        last_tick = LOOP_LAG_STATE['last_tick']
+        stalled_for = time.monotonic() - last_tick - LOOP_LAG_INTERVAL
+        if stalled_for < LOOP_LAG_THRESHOLD or sampled_tick == last_tick:
+            continue
+        sampled_tick = last_tick
+        frame = sys._current_frames().get(LOOP_LAG_STATE['loop_thread_id'])
+        if frame is None:
+            continue
+        handler_name = _running_handler_from_frame(frame)
+        stack = "".join(traceback.format_stack(frame, limit=LOOP_LAG_STACK_DEPTH))
+        LOOP_LAG_STATE['stalls'] += 1
+        LOOP_LAG_EVENTS.append({'time': datetime.now(), 'tick': last_tick, 'handler': handler_name, 'stalled_for': stalled_for, 'stack': stack})
+        logger.warning(f"Event loop blocked for at least {stalled_for * 1000:.0f}ms in handler '{handler_name}'. Stack sample:\n{stack}")
+
+async def monitor_loop_lag() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected_wakeup = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - expected_wakeup)
+        LOOP_LAG_SAMPLES_WINDOW.append(lag)
+        if LOOP_LAG_EVENTS and LOOP_LAG_EVENTS[-1]['tick'] == LOOP_LAG_STATE['last_tick']:
+            # The watchdog only saw the stall while it was ongoing; record its full length now.
+            LOOP_LAG_EVENTS[-1]['stalled_for'] = max(LOOP_LAG_EVENTS[-1]['stalled_for'], lag)
+        LOOP_LAG_STATE['last_tick'] = time.monotonic()
+
+async def start_loop_lag_monitor(app: Application) -> None:
+    LOOP_LAG_STATE['loop_thread_id'] = threading.get_ident()
+    LOOP_LAG_STATE['last_tick'] = time.monotonic()
+    stop_event = threading.Event()
+    watchdog = threading.Thread(target=_watch_loop_lag, args=(stop_event,), name="loop-lag-watchdog", daemon=True)
+    watchdog.start()
+    app.bot_data['loop_lag_monitor'] = (asyncio.create_task(monitor_loop_lag()), stop_event)
+    logger.info(f"Event loop lag monitor started (threshold {LOOP_LAG_THRESHOLD * 1000:.0f}ms).")
+
+async def stop_loop_lag_monitor(app: Application) -> None:
+    monitor = app.bot_data.pop('loop_lag_monitor', None)
+    if monitor:
+        task, stop_event = monitor
+        stop_event.set()
+        task.cancel()
+
+def get_loop_lag_summary() -> str:
+    samples = list(LOOP_LAG_SAMPLES_WINDOW)
+    if not samples:
+        return "N/A"
+    return (
+        f"p50 {sample_percentile(samples, 0.5) * 1000:.1f}ms, p95 {sample_percentile(samples, 0.95) * 1000:.1f}ms, "
+        f"p99 {sample_percentile(samples, 0.99) * 1000:.1f}ms, max {max(samples) * 1000:.0f}ms"
     )
-    
-    application = Application.builder().token(BOT_TOKEN).request(custom_request_settings).build()
-    logger.info(f"Custom request timeouts set for HTTPXRequest: "
-                f"Connect={connect_timeout_val}, Read={read_timeout_val}, "
-                f"Write={write_timeout_val}, Pool={pool_timeout_val}")
-    logger.info("JobQueue has been enabled.")
-    
+
+async def flush_log_summaries(context: ContextTypes.DEFAULT_TYPE) -> None:
+    log_repeated_error_filter.flush()
+    dropped, DroppingQueueHandler.dropped = DroppingQueueHandler.dropped, 0
+    if dropped:
+        logger.warning(f"Logging queue was full: dropped {dropped} log records in the last {LOG_ERROR_SUMMARY_INTERVAL}s.")
+
+# --- Sampling Profiler ---
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_stacks(duration: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> tuple[dict[str, int], int]:
+    """Samples every other thread's stack until `duration` elapses. Returns collapsed stacks and the sample count."""
+    sampler_thread_id = threading.get_ident()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    collapsed: dict[str, int] = {}
+    samples = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_thread_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            stack = ";".join(reversed(labels))
+            collapsed[stack] = collapsed.get(stack, 0) + 1
+        samples += 1
+        time.sleep(interval)
+    return collapsed, samples
+
+def summarize_collapsed_stacks(collapsed: dict[str, int], samples: int, duration: float) -> str:
+    self_counts: dict[str, int] = {}
+    total_counts: dict[str, int] = {}
+    for stack, count in collapsed.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+        for label in set(frames):
+            total_counts[label] = total_counts.get(label, 0) + count
+
+    total_samples = max(sum(collapsed.values()), 1)
+    lines = [
+        f"Sampling profile: {duration:.0f}s, {samples} sampling passes every {PROFILE_SAMPLE_INTERVAL * 1000:.0f}ms, {total_samples} thread samples.",
+        "",
+        f"Top {PROFILE_TOP_FUNCTIONS} functions by self samples:",
+        f"{'self%':>7} {'total%':>7}  function",
+    ]
+    for label, count in sorted(self_counts.items(), key=lambda item: item[1], reverse=True)[:PROFILE_TOP_FUNCTIONS]:
+        lines.append(f"{count / total_samples * 100:>6.1f}% {total_counts[label] / total_samples * 100:>6.1f}%  {label}")
+    lines.extend(["", f"Top {PROFILE_TOP_FUNCTIONS} functions by total (inclusive) samples:", f"{'total%':>7}  function"])
+    for label, count in sorted(total_counts.items(), key=lambda item: item[1], reverse=True)[:PROFILE_TOP_FUNCTIONS]:
+        lines.append(f"{count / total_samples * 100:>6.1f}%  {label}")
+    return "\n".join(lines) + "\n"
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id != OWNER_ID:
+        logger.warning(f"Unauthorized /profile attempt by user {user.id}.")
+        return
+
+    duration = PROFILE_DEFAULT_SECONDS
+    if context.args:
+        try:
+            duration = int(context.args[0])
+            if not 1 <= duration <= PROFILE_MAX_SECONDS:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text(f"Mrow? Usage: /profile <seconds> (1-{PROFILE_MAX_SECONDS})")
+            return
+
+    if context.bot_data.get('profile_running'):
+        await update.message.reply_text("Meow! A profile is already running, please wait for it to finish.")
+        return
+
+    context.bot_data['profile_running'] = True
+    try:
+        await update.message.reply_text(f"🔬 Sampling all threads for {duration}s... Purr, handling continues as normal.")
+        # The sampler runs in a worker thread so the event loop keeps handling updates while it is being observed.
+        collapsed, samples = await asyncio.to_thread(sample_stacks, duration)
+    finally:
+        context.bot_data['profile_running'] = False
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    collapsed_file = io.BytesIO("".join(f"{stack} {count}\n" for stack, count in sorted(collapsed.items())).encode('utf-8'))
+    collapsed_file.name = f"profile_{timestamp}.folded"
+    summary_file = io.BytesIO(summarize_collapsed_stacks(collapsed, samples, duration).encode('utf-8'))
+    summary_file.name = f"profile_{timestamp}_top.txt"
+
+    await update.message.reply_document(
+        document=collapsed_file,
+        caption="🔥 Collapsed stacks. Render with flamegraph.pl or speedscope."
+    )
+    await update.message.reply_document(document=summary_file, caption="📋 Top functions by self and total samples.")
+
+# --- Memory Introspection ---
+def get_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+def approximate_size(obj, limit: int = MEM_SIZE_WALK_LIMIT) -> tuple[int, bool]:
+    """Deep size of containers via sys.getsizeof. Stops after `limit` objects and reports whether it was cut short."""
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        if len(seen) >= limit:
+            return total, True
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            pending.extend(current)
+    return total, False
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def measure_containers(tracked: dict) -> tuple[int, list[tuple[str, int, int, bool]]]:
+    """GC object count and (name, entries, approximate size, truncated) per container, largest first. Meant for a
+    worker thread, so handlers may change the containers mid-walk: the figures are a best effort, and a container
+    that changes size while being walked is reported as truncated."""
+    gc_objects = len(gc.get_objects())
+    sizes = []
+    for name, container in sorted(tracked.items(), key=lambda item: len(item[1]), reverse=True):
+        if isinstance(container, str):
+            continue
+        try:
+            size, truncated = approximate_size(container)
+        except RuntimeError:
+            size, truncated = sys.getsizeof(container), True
+        sizes.append((name, len(container), size, truncated))
+    return gc_objects, sizes
+
+def summarize_allocations(previous: tracemalloc.Snapshot | None) -> tuple[tracemalloc.Snapshot, list[str]]:
+    """Takes a tracemalloc snapshot and formats the top MEM_TOP_ALLOCATIONS rows, as growth since `previous`
+    when given. Filtering and grouping walk every trace, so this runs in a worker thread."""
+    snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+    rows = []
+    if previous is None:
+        for stat in snapshot.statistics('lineno')[:MEM_TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            rows.append(f" • <code>{html.escape(os.path.basename(frame.filename))}:{frame.lineno}</code> <code>{format_bytes(stat.size)}</code> in <code>{stat.count}</code> blocks")
+    else:
+        diffs = [stat for stat in snapshot.compare_to(previous, 'lineno') if stat.size_diff][:MEM_TOP_ALLOCATIONS]
+        for stat in diffs:
+            frame = stat.traceback[0]
+            rows.append(
+                f" • <code>{html.escape(os.path.basename(frame.filename))}:{frame.lineno}</code> "
+                f"<code>{'+' if stat.size_diff >= 0 else ''}{format_bytes(stat.size_diff)}</code> "
+                f"(<code>{'+' if stat.count_diff >= 0 else ''}{stat.count_diff}</code> blocks, now <code>{format_bytes(stat.size)}</code>)"
+            )
+        if not diffs:
+            rows.append(" • No change.")
+    return snapshot, rows
+
+async def mem_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user.id != OWNER_ID:
+        logger.warning(f"Unauthorized /mem attempt by user {user.id}.")
+        return
+
+    if context.args and context.args[0].lower() == "stop":
+        context.bot_data.pop('tracemalloc_snapshot', None)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            await update.message.reply_text("Meow! Allocation tracing stopped.")
+        else:
+            await update.message.reply_text("Allocation tracing was not running.")
+        return
+
+    tracked = {f"bot_data.{key}": value for key, value in context.bot_data.items() if key != 'tracemalloc_snapshot' and hasattr(value, '__len__')}
+    tracked.update({
+        "handler metrics": HANDLER_METRICS,
+        "api call metrics": API_CALL_METRICS,
+        "sql statement stats": DB_STATEMENT_STATS,
+        "slow query log": DB_SLOW_QUERIES,
+        "loop lag samples": LOOP_LAG_SAMPLES_WINDOW,
+    })
+    # Walking up to MEM_SIZE_WALK_LIMIT objects per container would stall every chat if done on the event loop.
+    gc_objects, sizes = await asyncio.to_thread(measure_containers, tracked)
+
+    rss = get_rss_bytes()
+    lines = [
+        "<b>🧠 Memory:</b>\n",
+        f"<b>• RSS:</b> <code>{format_bytes(rss) if rss is not None else 'N/A'}</code>",
+        f"<b>• GC tracked objects:</b> <code>{gc_objects}</code>",
+        f"<b>• bot_data / chat_data / user_data:</b> <code>{len(context.bot_data)}</code> / "
+        f"<code>{len(context.application.chat_data)}</code> / <code>{len(context.application.user_data)}</code> entries\n",
+        "<b>📦 Caches:</b>",
+    ]
+    for name, entries, size, truncated in sizes:
+        lines.append(f" • <code>{html.escape(name)}</code>: <code>{entries}</code> entries, ~<code>{format_bytes(size)}{'+' if truncated else ''}</code>")
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEM_TRACEMALLOC_FRAMES)
+        lines.append("\n<b>🔎 Allocations:</b> tracing started now. Run /mem again later to see growth, /mem stop to end tracing.")
+    else:
+        previous = context.bot_data.get('tracemalloc_snapshot')
+        snapshot, rows = await asyncio.to_thread(summarize_allocations, previous)
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        lines.append(f"\n<b>🔎 Allocations</b> (traced <code>{format_bytes(traced_current)}</code>, peak <code>{format_bytes(traced_peak)}</code>):")
+        if previous is not None:
+            lines.append("<i>Growth since the previous /mem:</i>")
+        lines.extend(rows)
+        context.bot_data['tracemalloc_snapshot'] = snapshot
+
+    message_text = "\n".join(lines)
+    if len(message_text) > 4096:
+        message_text = message_text[:message_text.rfind("\n", 0, 4000)] + "\n\n<i>...list truncated.</i>"
+    await update.message.reply_html(message_text)
+
+# --- Allowed Updates ---
+# Update types whose payload is a Message; MessageHandler/CommandHandler filters are probed against these.
+MESSAGE_UPDATE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post", "business_message", "edited_business_message")
+# Update types other handler classes consume (by class name, so handlers missing from older PTB versions are fine).
+HANDLER_CLASS_UPDATE_TYPES = {
+    'CallbackQueryHandler': ("callback_query",),
+    'InlineQueryHandler': ("inline_query",),
+    'ChosenInlineResultHandler': ("chosen_inline_result",),
+    'ShippingQueryHandler': ("shipping_query",),
+    'PreCheckoutQueryHandler': ("pre_checkout_query",),
+    'PollHandler': ("poll",),
+    'PollAnswerHandler': ("poll_answer",),
+    'ChatJoinRequestHandler': ("chat_join_request",),
+    'ChatBoostHandler': ("chat_boost", "removed_chat_boost"),
+    'MessageReactionHandler': ("message_reaction", "message_reaction_count"),
+    'BusinessConnectionHandler': ("business_connection",),
+    'BusinessMessagesDeletedHandler': ("deleted_business_messages",),
+    'PaidMediaPurchasedHandler': ("purchased_paid_media",),
+}
+INBOUND_UPDATE_STATS: dict[str, dict] = {}
+ALLOWED_UPDATES_STATE = {'allowed': None}
+
+def _update_type_probes(update_type: str) -> list[Update]:
+    """Representative updates of a message-like type: text, command, media with caption and join/leave service messages in every chat type."""
+    probe_bot = SimpleNamespace(username="catbot_probe_bot", defaults=None)
+    probe_user = {"id": 2, "is_bot": False, "first_name": "Probe"}
+    chats = (
+        {"id": 2, "type": "private", "first_name": "Probe"},
+        {"id": -2, "type": "group", "title": "Probe"},
+        {"id": -1002, "type": "supergroup", "title": "Probe"},
+        {"id": -1003, "type": "channel", "title": "Probe"},
+    )
+    contents = (
+        {"text": "meow"},
+        {"text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]},
+        {"photo": [{"file_id": "probe", "file_unique_id": "probe", "width": 1, "height": 1}], "caption": "meow"},
+        {"new_chat_members": [probe_user]},
+        {"left_chat_member": probe_user},
+    )
+    probes = []
+    for chat in chats:
+        for content in contents:
+            message = {"message_id": 1, "date": 0, "chat": chat, "from": probe_user, **content}
+            if update_type.startswith("edited_"):
+                message["edit_date"] = 0
+            probes.append(Update.de_json({"update_id": 1, update_type: message}, probe_bot))
+    return probes
+
+def _handler_update_types(handler, probes: dict[str, list[Update]]) -> set[str] | None:
+    """Update types `handler` can act on, or None if it is a kind of handler we cannot reason about."""
+    handler_class = type(handler).__name__
+    if handler_class in ("MessageHandler", "CommandHandler"):
+        return {update_type for update_type, type_probes in probes.items() if any(handler.check_update(probe) for probe in type_probes)}
+    if handler_class == "ChatMemberHandler":
+        return {
+            handler.MY_CHAT_MEMBER: {"my_chat_member"},
+            handler.CHAT_MEMBER: {"chat_member"},
+        }.get(handler.chat_member_types, {"my_chat_member", "chat_member"})
+    if handler_class == "ConversationHandler":
+        update_types = set()
+        for inner_handler in handler.entry_points + handler.fallbacks + [h for state_handlers in handler.states.values() for h in state_handlers]:
+            inner_types = _handler_update_types(inner_handler, probes)
+            if inner_types is None:
+                return None
+            update_types |= inner_types
+        return update_types
+    if handler_class in HANDLER_CLASS_UPDATE_TYPES:
+        return set(HANDLER_CLASS_UPDATE_TYPES[handler_class])
+    return None
+
+def compute_allowed_updates(application: Application) -> list[str]:
+    """The smallest allowed_updates list that still delivers every update some registered handler would act on."""
+    all_types = [str(update_type) for update_type in Update.ALL_TYPES]
+    probes = {update_type: _update_type_probes(update_type) for update_type in MESSAGE_UPDATE_TYPES if update_type in all_types}
+    allowed = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler_types = _handler_update_types(handler, probes)
+            if handler_types is None:
+                logger.warning(f"Cannot tell which updates {type(handler).__name__} ({getattr(handler.callback, '__name__', '?')}) needs; requesting all update types.")
+                return all_types
+            allowed |= handler_types
+    return [update_type for update_type in all_types if update_type in allowed]
+
+def resolve_allowed_updates(application: Application) -> list[str]:
+    minimal = compute_allowed_updates(application)
+    all_types = [str(update_type) for update_type in Update.ALL_TYPES]
+    if ALLOWED_UPDATES_MODE == "all":
+        allowed = all_types
+    elif ALLOWED_UPDATES_MODE == "auto":
+        allowed = minimal
+    else:
+        allowed = [update_type.strip() for update_type in ALLOWED_UPDATES_MODE.split(",") if update_type.strip()]
+    ALLOWED_UPDATES_STATE['allowed'] = set(allowed)
+    ALLOWED_UPDATES_STATE['minimal'] = set(minimal)
+    excluded = [update_type for update_type in all_types if update_type not in allowed]
+    logger.info(f"allowed_updates ({ALLOWED_UPDATES_MODE}): {', '.join(allowed)}. Not requested: {len(excluded)} of {len(all_types)} types ({', '.join(excluded) or 'none'}).")
+    if ALLOWED_UPDATES_MODE != "auto" and set(minimal) != set(allowed):
+        logger.info(f"The handlers only need: {', '.join(minimal)}. Inbound updates of other types are counted as avoidable in /metrics.")
+    return allowed
+
+def record_inbound_update(update: object) -> None:
+    """Counts received updates per type; updates no handler needs are also sized, as the traffic a minimal allowed_updates avoids."""
+    update_type = next((str(update_type) for update_type in Update.ALL_TYPES if getattr(update, update_type, None) is not None), "unknown")
+    stats = INBOUND_UPDATE_STATS.get(update_type)
+    if stats is None:
+        stats = INBOUND_UPDATE_STATS[update_type] = {'count': 0, 'avoidable': 0, 'avoidable_bytes': 0}
+    stats['count'] += 1
+    minimal = ALLOWED_UPDATES_STATE.get('minimal')
+    if minimal is not None and update_type not in minimal:
+        stats['avoidable'] += 1
+        stats['avoidable_bytes'] += len(json.dumps(update.to_dict()))
+
+# --- Backlog Catch-up ---
+CATCHUP_STATE = {'active': False}
+
+def _catch_up_command(message) -> str | None:
+    text = message.text or ""
+    if not text.startswith("/") or len(text) < 2:
+        return None
+    return text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower()
+
+async def get_pending_update_count(app: Application) -> int:
+    try:
+        webhook_info = await app.bot.get_webhook_info()
+    except TelegramError as e:
+        logger.warning(f"Could not read the pending update count, starting in live mode: {e}")
+        return 0
+    return webhook_info.pending_update_count
+
+async def start_catch_up(app: Application) -> None:
+    """Enters catch-up mode when Telegram holds a backlog of updates for us (typically right after a restart)."""
+    if not CATCHUP_STALE_AGE:
+        return
+    if SHARD_INDEX is not None:
+        # The front process is already polling by now; it passes on the count it read before it started.
+        pending = int(os.getenv("CATBOT_CATCHUP_PENDING") or 0)
+    else:
+        pending = await get_pending_update_count(app)
+    if not pending:
+        logger.info("No update backlog, starting in live mode.")
+        return
+
+    now = time.monotonic()
+    CATCHUP_STATE.update({
+        'active': True, 'pending_at_start': pending, 'started': now, 'last_update': now, 'batch': [], 'batched_ids': set(),
+        'seen': 0, 'ran': 0, 'dropped': 0, 'batched': 0, 'gban_bans': 0,
+    })
+    # The gate stays registered afterwards (it returns at once when inactive): removing a handler group while
+    # other updates are being dispatched concurrently is not safe in PTB.
+    app.add_handler(TypeHandler(Update, catch_up_gate), group=CATCHUP_HANDLER_GROUP)
+    app.job_queue.run_repeating(flush_catch_up, interval=CATCHUP_FLUSH_INTERVAL, first=CATCHUP_FLUSH_INTERVAL, name="flush_catch_up")
+    logger.info(f"Catch-up mode: Telegram holds {pending} pending update(s). Updates older than {CATCHUP_STALE_AGE}s are triaged until the bot is live.")
+
+def is_catch_up_update(update: object) -> bool:
+    """Whether catch_up_gate took over the bookkeeping for this backlog update."""
+    return getattr(update, "update_id", None) in CATCHUP_STATE.get('batched_ids', ())
+
+def moderation_clock(update: Update) -> float:
+    """Wall-clock time of an update for the flood and raid windows: when it was sent while replaying a restart
+    backlog, so a backlog delivered all at once does not look like a flood or a raid; otherwise now."""
+    if is_catch_up_update(update):
+        message = update.effective_message
+        return (message.edit_date or message.date).timestamp()
+    return time.time()
+
+async def catch_up_gate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs before every other handler while catching up: drops stale fun commands and batches the bookkeeping
+    (user and sighting writes, gban checks) of stale chat activity. Moderation handlers still run on it."""
+    state = CATCHUP_STATE
+    if not state['active']:
+        return
+    state['last_update'] = time.monotonic()
+    message = update.effective_message
+    sent_at = (message.edit_date or message.date) if message else None
+    if sent_at is not None and (datetime.now(timezone.utc) - sent_at).total_seconds() <= CATCHUP_LIVE_AGE:
+        await finish_catch_up(context, "reached live updates")
+        return
+    state['seen'] += 1
+    if sent_at is None:
+        state['ran'] += 1
+        return
+    age = (datetime.now(timezone.utc) - sent_at).total_seconds()
+    if age < CATCHUP_STALE_AGE:
+        state['ran'] += 1
+        return
+
+    command = _catch_up_command(message)
+    if command is not None:
+        if command in CATCHUP_MODERATION_COMMANDS:
+            state['ran'] += 1
+            return
+        # Nobody is waiting for a /meow from an hour ago.
+        state['dropped'] += 1
+        raise ApplicationHandlerStop
+
+    bot_id = context.bot.id
+    if any(member.id == bot_id for member in message.new_chat_members or ()) or (message.left_chat_member and message.left_chat_member.id == bot_id):
+        # The bot joining or leaving a chat changes bot_chats; handle it exactly as live.
+        state['ran'] += 1
+        return
+
+    chat = update.effective_chat
+    is_group = bool(chat and chat.type in [ChatType.GROUP, ChatType.SUPERGROUP])
+    # Message authors get the gban check here; joiners get it from handle_new_group_members as usual, and users
+    # who were only replied to are just logged.
+    author = update.effective_user if update.effective_user and update.effective_user.id != bot_id else None
+    checked_users = [author] if author and not message.new_chat_members else []
+    logged_users = [user for user in [author, message.reply_to_message.from_user if message.reply_to_message else None] if user]
+    state['batch'].append((chat.id if chat else None, is_group, logged_users, checked_users))
+    state['batched_ids'].add(update.update_id)
+    state['batched'] += 1
+    if len(state['batch']) >= CATCHUP_BATCH_SIZE:
+        await flush_catch_up_batch(context)
+
+async def flush_catch_up_batch(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Applies the batched backlog with a few bulk queries instead of several per update, then enforces gbans."""
+    batch, CATCHUP_STATE['batch'] = CATCHUP_STATE.get('batch', []), []
+    if not batch:
+        return
+    users = {user.id: user for _, _, logged_users, _ in batch for user in logged_users}
+    sightings = {(chat_id, user.id) for chat_id, is_group, _, checked_users in batch if is_group for user in checked_users if not user.is_bot}
+    await asyncio.to_thread(update_users_in_db_bulk, list(users.values()))
+    await asyncio.to_thread(record_chat_sightings_bulk, sightings)
+
+    gban_reasons = await asyncio.to_thread(get_gban_reasons_bulk, [user_id for _, user_id in sightings])
+    enforced_chats: dict[int, bool] = {}
+    removals: dict[int, list[tuple[User, str]]] = {}
+    for chat_id, user_id in sorted(sightings):
+        if user_id not in gban_reasons or is_privileged_user(user_id):
+            continue
+        if chat_id not in enforced_chats:
+            enforced_chats[chat_id] = is_gban_enforced(chat_id)
+        if not enforced_chats[chat_id]:
+            continue
+        if await _sweep_enforce_gban(context, chat_id, user_id) == "banned":
+            CATCHUP_STATE['gban_bans'] += 1
+            removals.setdefault(chat_id, []).append((users[user_id], gban_reasons[user_id]))
+    for chat_id, chat_removals in removals.items():
+        queue_gban_join_notices(context, chat_id, chat_removals)
+    logger.info(f"Catch-up batch: {len(batch)} event(s), {len(users)} user(s), {len(sightings)} sighting(s), {len(gban_reasons)} gbanned.")
+
+async def flush_catch_up(context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not CATCHUP_STATE['active']:
+        context.job.schedule_removal()
+        return
+    await flush_catch_up_batch(context)
+    if time.monotonic() - CATCHUP_STATE['last_update'] >= CATCHUP_IDLE_FINISH:
+        await finish_catch_up(context, "backlog drained")
+
+async def finish_catch_up(context: ContextTypes.DEFAULT_TYPE, reason: str) -> None:
+    state = CATCHUP_STATE
+    if not state['active']:
+        return
+    state['active'] = False
+    await flush_catch_up_batch(context)
+    state['batched_ids'] = set()
+    report = {
+        'pending_at_start': state['pending_at_start'], 'seen': state['seen'], 'ran': state['ran'], 'dropped': state['dropped'],
+        'batched': state['batched'], 'gban_bans': state['gban_bans'], 'duration': time.monotonic() - state['started'],
+        'finished_at': datetime.now(),
+    }
+    context.bot_data['catch_up_report'] = report
+    logger.info(
+        f"Caught up ({reason}): {report['seen']} backlog update(s) (Telegram reported {report['pending_at_start']}) in {report['duration']:.1f}s. "
+        f"{report['ran']} handled normally, {report['dropped']} stale command(s) dropped, {report['batched']} event(s) batched, "
+        f"{report['gban_bans']} gban ban(s). Now live."
+    )
+
+# --- Webhook Server ---
+WEBHOOK_STATS = {'connections': 0, 'bytes': 0, 'requests': {}}
+WEBHOOK_STATE = {'draining': False, 'idle_writers': set()}
+WEBHOOK_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+def _count_webhook_request(result: str) -> None:
+    WEBHOOK_STATS['requests'][result] = WEBHOOK_STATS['requests'].get(result, 0) + 1
+
+async def _webhook_respond(writer: asyncio.StreamWriter, status_code: int, keep_alive: bool) -> None:
+    writer.write(
+        f"HTTP/1.1 {status_code} {WEBHOOK_REASONS.get(status_code, 'OK')}\r\nContent-Length: 0\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+    )
+    await writer.drain()
+
+async def _serve_webhook_connection(application: Application, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Handles one keep-alive connection from Telegram. An update is acknowledged only once it is in the update queue."""
+    webhook_path = urlparse(WEBHOOK_URL).path or "/"
+    WEBHOOK_STATS['connections'] += 1
+    try:
+        while not WEBHOOK_STATE['draining']:
+            WEBHOOK_STATE['idle_writers'].add(writer)
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=WEBHOOK_IDLE_TIMEOUT)
+            finally:
+                WEBHOOK_STATE['idle_writers'].discard(writer)
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                break
+            headers = {}
+            while (line := await asyncio.wait_for(reader.readline(), timeout=WEBHOOK_IDLE_TIMEOUT)) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if parts[1].split("?", 1)[0] != webhook_path:
+                _count_webhook_request("not_found")
+                await _webhook_respond(writer, 404, keep_alive=False)
+                break
+            if parts[0] != "POST":
+                _count_webhook_request("bad_method")
+                await _webhook_respond(writer, 405, keep_alive=False)
+                break
+            if not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), WEBHOOK_SECRET_TOKEN):
+                _count_webhook_request("bad_secret")
+                logger.warning(f"Rejected webhook request with a missing or wrong secret token from {writer.get_extra_info('peername')}.")
+                await _webhook_respond(writer, 403, keep_alive=False)
+                break
+            if "content-length" not in headers:
+                _count_webhook_request("no_length")
+                await _webhook_respond(writer, 411, keep_alive=False)
+                break
+            content_length = int(headers["content-length"]) if headers["content-length"].isdigit() else -1
+            if content_length < 0 or content_length > WEBHOOK_MAX_BODY_BYTES:
+                # The body is not read, so the connection cannot be reused.
+                _count_webhook_request("too_large")
+                logger.warning(f"Rejected webhook request of {headers['content-length']} bytes (limit {WEBHOOK_MAX_BODY_BYTES}).")
+                await _webhook_respond(writer, 413, keep_alive=False)
+                break
+            body = await asyncio.wait_for(reader.readexactly(content_length), timeout=WEBHOOK_IDLE_TIMEOUT)
+            WEBHOOK_STATS['bytes'] += content_length
+            keep_alive = headers.get("connection", "").lower() != "close"
+
+            if WEBHOOK_STATE['draining']:
+                # Telegram keeps the update and retries it, so nothing is lost when we refuse it while shutting down.
+                _count_webhook_request("draining")
+                await _webhook_respond(writer, 503, keep_alive=False)
+                break
+            try:
+                payload = json.loads(body)
+                if not isinstance(payload, dict):
+                    raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+                update = Update.de_json(payload, application.bot)
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                _count_webhook_request("bad_update")
+                logger.warning(f"Rejected malformed webhook update: {e}")
+                await _webhook_respond(writer, 400, keep_alive)
+                continue
+            await application.update_queue.put(update)
+            _count_webhook_request("accepted")
+            await _webhook_respond(writer, 200, keep_alive)
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        logger.error(f"Unexpected error in webhook connection: {e}", exc_info=True)
+    finally:
+        WEBHOOK_STATS['connections'] -= 1
+        writer.close()
+
+async def drain_webhook(application: Application, server: asyncio.Server) -> None:
+    """Stops accepting updates, then waits (up to WEBHOOK_DRAIN_TIMEOUT) for the ones already accepted to be processed."""
+    WEBHOOK_STATE['draining'] = True
+    server.close()
+    for writer in list(WEBHOOK_STATE['idle_writers']):
+        writer.close()
+    started = time.monotonic()
+    pending_at_start = application.update_queue.qsize() + UPDATE_DISPATCH_STATS['waiting'] + UPDATE_DISPATCH_STATS['running']
+    while time.monotonic() - started < WEBHOOK_DRAIN_TIMEOUT:
+        if not (WEBHOOK_STATS['connections'] or application.update_queue.qsize() or UPDATE_DISPATCH_STATS['waiting'] or UPDATE_DISPATCH_STATS['running']):
+            logger.info(f"Webhook drained: {pending_at_start} pending update(s) finished in {time.monotonic() - started:.1f}s.")
+            return
+        await asyncio.sleep(0.1)
+    logger.warning(
+        f"Webhook drain timed out after {WEBHOOK_DRAIN_TIMEOUT:.0f}s with {application.update_queue.qsize() + UPDATE_DISPATCH_STATS['waiting']} "
+        f"update(s) queued and {UPDATE_DISPATCH_STATS['running']} running."
+    )
+
+async def run_webhook(application: Application, allowed_updates: list[str]) -> None:
+    """Webhook counterpart of Application.run_polling(): serves updates over HTTP until SIGINT/SIGTERM, then drains."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(stop_signal, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    server = None
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        server = await asyncio.start_server(
+            lambda reader, writer: _serve_webhook_connection(application, reader, writer), WEBHOOK_LISTEN, WEBHOOK_PORT
+        )
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET_TOKEN, allowed_updates=allowed_updates, max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        mark_startup_phase('webhook_ready')
+        log_startup_breakdown()
+        logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, Telegram posts to {WEBHOOK_URL}")
+        await stop_event.wait()
+        logger.info("Stop signal received. Draining webhook...")
+        await drain_webhook(application, server)
+    finally:
+        if server is not None:
+            server.close()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# --- Sharding ---
+# Front process: SHARD_STATS[shard] plus the live socket, buffered updates and worker process of each shard.
+SHARD_STATS: dict[int, dict] = {}
+SHARD_STATE = {'stopping': False, 'pending_at_start': 0, 'server': None, 'writers': {}, 'buffers': {}, 'processes': {}, 'supervisors': [], 'front': None}
+
+def shard_for_update(update: object) -> int:
+    """Same key as the per-chat ordering, so a chat always lands on one worker and keeps its order there."""
+    key = update_ordering_key(update)
+    return 0 if key is None else key % SHARD_COUNT
+
+def _shard_message(payload: dict) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode() + b"\n"
+
+def _buffer_shard_update(shard: int, data: bytes, update_id: int) -> None:
+    buffer = SHARD_STATE['buffers'][shard]
+    if len(buffer) >= SHARD_MAX_BUFFERED:
+        SHARD_STATS[shard]['dropped'] += 1
+        hot_logger.warning(f"Shard {shard} is down and its buffer is full; dropped update {update_id}.")
+    else:
+        buffer.append(data)
+
+async def route_update_to_shard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Front process only: hands the update to its shard's worker instead of running any handler here."""
+    shard = shard_for_update(update)
+    stats = SHARD_STATS[shard]
+    data = _shard_message({'type': 'update', 'update': update.to_dict()})
+    writer = SHARD_STATE['writers'].get(shard)
+    if writer is None or writer.is_closing():
+        _buffer_shard_update(shard, data, update.update_id)
+        raise ApplicationHandlerStop
+    writer.write(data)
+    try:
+        # Backpressure: a worker that falls behind slows down routing for its chats only.
+        await writer.drain()
+    except ConnectionError as e:
+        # The worker went away mid-write: keep the update for its replacement instead of losing it.
+        logger.warning(f"Lost the connection to shard {shard} while routing update {update.update_id}: {e}. Buffering it.")
+        _buffer_shard_update(shard, data, update.update_id)
+        raise ApplicationHandlerStop
+    stats['routed'] += 1
+    stats['bytes'] += len(data)
+    raise ApplicationHandlerStop
+
+async def _serve_shard_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        hello = json.loads(await asyncio.wait_for(reader.readline(), timeout=30))
+        shard = int(hello['shard'])
+        stats = SHARD_STATS[shard]
+    except (asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Rejected a shard worker connection with a bad hello: {e}")
+        writer.close()
+        return
+
+    buffer = SHARD_STATE['buffers'][shard]
+    flushed = len(buffer)
+    while buffer:
+        data = buffer.popleft()
+        writer.write(data)
+        stats['routed'] += 1
+        stats['bytes'] += len(data)
+    SHARD_STATE['writers'][shard] = writer
+    stats['connected'] = True
+    logger.info(f"Shard {shard} worker (pid {hello.get('pid')}) connected; sent {flushed} buffered update(s).")
+
+    try:
+        async for line in reader:
+            message = json.loads(line)
+            if message['type'] == 'stats':
+                stats['snapshot'] = message['stats']
+            elif message['type'] == 'invalidate':
+                # Another shard changed settings behind one of our per-chat caches; tell everyone else.
+                data = _shard_message(message)
+                for other_shard, other_writer in list(SHARD_STATE['writers'].items()):
+                    if other_shard != shard and not other_writer.is_closing():
+                        other_writer.write(data)
+                stats['invalidations'] += 1
+    except (ConnectionError, ValueError) as e:
+        logger.error(f"Connection to shard {shard} worker failed: {e}")
+    finally:
+        if SHARD_STATE['writers'].get(shard) is writer:
+            del SHARD_STATE['writers'][shard]
+            stats['connected'] = False
+        writer.close()
+
+async def _supervise_shard_worker(shard: int) -> None:
+    """Runs one worker process and restarts it if it dies; its updates are buffered meanwhile."""
+    stats = SHARD_STATS[shard]
+    while not SHARD_STATE['stopping']:
+        # Only the first start of a worker sees the startup backlog; a restarted one goes straight to live mode.
+        pending = SHARD_STATE['pending_at_start'] if not stats['restarts'] else 0
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            env={**os.environ, "CATBOT_SHARD_INDEX": str(shard), "CATBOT_CATCHUP_PENDING": str(pending)}
+        )
+        SHARD_STATE['processes'][shard] = process
+        stats['pid'] = process.pid
+        return_code = await process.wait()
+        if SHARD_STATE['stopping']:
+            return
+        stats['restarts'] += 1
+        logger.error(f"Shard {shard} worker (pid {process.pid}) exited with code {return_code}. Restarting in {SHARD_RESTART_DELAY:.0f}s.")
+        await asyncio.sleep(SHARD_RESTART_DELAY)
+
+async def start_shard_workers(app: Application) -> None:
+    try:
+        with connect_db() as conn:
+            # Lets the workers read while one of them writes; the setting is stored in the database file.
+            journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            logger.warning(f"Could not switch '{DB_NAME}' to WAL (journal mode is {journal_mode}); shards will wait on each other's writes.")
+    except sqlite3.Error as e:
+        logger.error(f"Could not switch '{DB_NAME}' to WAL: {e}")
+
+    SHARD_STATE['pending_at_start'] = await get_pending_update_count(app) if CATCHUP_STALE_AGE else 0
+    if os.path.exists(SHARD_SOCKET_PATH):
+        os.unlink(SHARD_SOCKET_PATH)
+    SHARD_STATE['server'] = await asyncio.start_unix_server(_serve_shard_worker, path=SHARD_SOCKET_PATH, limit=SHARD_MAX_MESSAGE_BYTES)
+    for shard in range(SHARD_COUNT):
+        SHARD_STATS[shard] = {'connected': False, 'pid': None, 'routed': 0, 'bytes': 0, 'dropped': 0, 'restarts': 0, 'invalidations': 0, 'snapshot': {}}
+        SHARD_STATE['buffers'][shard] = deque()
+        SHARD_STATE['supervisors'].append(asyncio.create_task(_supervise_shard_worker(shard)))
+    logger.info(f"Sharded mode: routing updates by chat to {SHARD_COUNT} worker processes over {SHARD_SOCKET_PATH}.")
+
+async def stop_shard_workers(app: Application) -> None:
+    """Called once the front has stopped receiving: closing a worker's socket tells it to finish its queue and exit."""
+    if SHARD_STATE['server'] is None:
+        return
+    SHARD_STATE['stopping'] = True
+    SHARD_STATE['server'].close()
+    for writer in list(SHARD_STATE['writers'].values()):
+        writer.close()
+    processes = [process for process in SHARD_STATE['processes'].values() if process.returncode is None]
+    if processes:
+        _, pending = await asyncio.wait([asyncio.create_task(process.wait()) for process in processes], timeout=SHARD_STOP_TIMEOUT)
+        if pending:
+            logger.warning(f"{len(pending)} shard worker(s) did not finish within {SHARD_STOP_TIMEOUT:.0f}s; terminating them.")
+            for process in processes:
+                if process.returncode is None:
+                    process.terminate()
+    for task in SHARD_STATE['supervisors']:
+        task.cancel()
+    lost = sum(len(buffer) for buffer in SHARD_STATE['buffers'].values())
+    if lost:
+        logger.warning(f"{lost} buffered update(s) were never delivered to a shard worker.")
+    if os.path.exists(SHARD_SOCKET_PATH):
+        os.unlink(SHARD_SOCKET_PATH)
+    logger.info("Shard workers stopped.")
+
+def publish_cache_invalidation(cache_name: str, chat_id: int) -> None:
+    """Worker process only: asks the other shards to drop their cached entry for chat_id."""
+    writer = SHARD_STATE['front']
+    if writer is not None and not writer.is_closing():
+        writer.write(_shard_message({'type': 'invalidate', 'cache': cache_name, 'chat_id': chat_id}))
+
+def apply_cache_invalidation(bot_data: dict, cache_name: str, chat_id: int) -> None:
+    if cache_name == 'filters':
+        entry = bot_data.get('filter_cache', {}).pop(chat_id, None)
+        if entry is not None:
+            bot_data['filter_cache_bytes'] -= entry['size']
+    elif cache_name == 'blocklist':
+        bot_data.get('blocklist_matchers', {}).pop(chat_id, None)
+    elif cache_name == 'antiflood':
+        bot_data.get('antiflood_settings', {}).pop(chat_id, None)
+
+def shard_stats_snapshot() -> dict:
+    handler_totals = merge_latency_histograms(HANDLER_METRICS.values())
+    return {
+        'pid': os.getpid(),
+        'cpu_seconds': time.process_time(),
+        'rss_bytes': get_rss_bytes(),
+        'handler_calls': handler_totals['count'],
+        'handler_p95': histogram_percentile(handler_totals, 0.95),
+        'updates_waiting': UPDATE_DISPATCH_STATS['waiting'],
+        'updates_running': UPDATE_DISPATCH_STATS['running'],
+        'update_wait_p95': histogram_percentile(UPDATE_WAIT_HISTOGRAM, 0.95),
+        'db_lock_wait_seconds': sum(stats['lock_wait_time'] for stats in DB_STATEMENT_STATS.values()),
+        'loop_lag_stalls': LOOP_LAG_STATE['stalls'],
+        'catching_up': CATCHUP_STATE['active'],
+    }
+
+async def _report_shard_stats(writer: asyncio.StreamWriter) -> None:
+    while not writer.is_closing():
+        writer.write(_shard_message({'type': 'stats', 'stats': shard_stats_snapshot()}))
+        await asyncio.sleep(SHARD_STATS_INTERVAL)
+
+async def _read_shard_updates(application: Application, reader: asyncio.StreamReader) -> None:
+    async for line in reader:
+        # One bad line is logged and skipped; letting it escape would end the reader and shut the worker down.
+        try:
+            message = json.loads(line)
+            if message['type'] == 'invalidate':
+                apply_cache_invalidation(application.bot_data, message['cache'], message['chat_id'])
+                continue
+            if message['type'] != 'update':
+                continue
+            if not isinstance(message['update'], dict):
+                raise ValueError(f"expected a JSON object, got {type(message['update']).__name__}")
+            update = Update.de_json(message['update'], application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"Skipping malformed message from the shard front: {e}")
+            continue
+        await application.update_queue.put(update)
+
+async def run_shard_worker(application: Application) -> None:
+    """Worker counterpart of run_webhook(): takes this shard's updates from the front process until it hangs up."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        # Ctrl+C reaches the whole process group; the front decides when workers stop by closing their socket.
+        loop.add_signal_handler(signal.SIGINT, lambda: None)
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    except NotImplementedError:
+        pass
+
+    await application.initialize()
+    writer = None
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        reader, writer = await asyncio.open_unix_connection(SHARD_SOCKET_PATH, limit=SHARD_MAX_MESSAGE_BYTES)
+        SHARD_STATE['front'] = writer
+        writer.write(_shard_message({'type': 'hello', 'shard': SHARD_INDEX, 'pid': os.getpid()}))
+        stats_task = asyncio.create_task(_report_shard_stats(writer))
+        reader_task = asyncio.create_task(_read_shard_updates(application, reader))
+        stop_task = asyncio.create_task(stop_event.wait())
+        await asyncio.wait([reader_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        if reader_task.done() and reader_task.exception():
+            logger.error(f"Shard {SHARD_INDEX} lost its connection to the front process: {reader_task.exception()}")
+        for task in (stats_task, reader_task, stop_task):
+            task.cancel()
+        unfinished = application.update_queue.qsize() + UPDATE_DISPATCH_STATS['waiting'] + UPDATE_DISPATCH_STATS['running']
+        logger.info(f"Shard {SHARD_INDEX} stopping; finishing {unfinished} update(s) already received.")
+    finally:
+        if writer is not None:
+            writer.close()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# --- Main Function ---
+def register_handlers(application: Application) -> None:
+    """Registers every handler on `application`. Shared by main() and the offline benchmark harness."""
     logger.info("Registering blacklist check handler...")
     application.add_handler(MessageHandler(filters.COMMAND, check_blacklist_handler), group=-1)
 
@@ -3720,6 +6901,18 @@ def main() -> None:
         log_user_from_interaction
     ), group=10)
 
+    logger.info("Registering blocklist handler...")
+    application.add_handler(MessageHandler(
+        filters.ChatType.GROUPS & (filters.TEXT | filters.CAPTION),
+        check_blocklist
+    ), group=-4)
+
+    logger.info("Registering anti-flood handler...")
+    application.add_handler(MessageHandler(
+        filters.ChatType.GROUPS & (~filters.StatusUpdate.ALL) & (~filters.UpdateType.EDITED_MESSAGE),
+        check_flood
+    ), group=-3)
+
     logger.info("Registering global bans handler...")
     application.add_handler(MessageHandler(
         filters.TEXT & (~filters.COMMAND) & filters.ChatType.GROUPS,
@@ -3772,15 +6965,85 @@ def main() -> None:
     application.add_handler(CommandHandler("gban", gban_command))
     application.add_handler(CommandHandler("ungban", ungban_command))
     application.add_handler(CommandHandler("enforcegban", enforce_gban_command))
+    application.add_handler(CommandHandler("antiflood", antiflood_command))
+    application.add_handler(CommandHandler("antiraid", antiraid_command))
+    application.add_handler(CommandHandler("addblock", add_blocklist_command))
+    application.add_handler(CommandHandler("unblock", remove_blocklist_command))
+    application.add_handler(CommandHandler("blocklist", list_blocklist_command))
+    application.add_handler(CommandHandler("filter", add_filter_command))
+    application.add_handler(CommandHandler("stop", stop_filter_command))
+    application.add_handler(CommandHandler("filters", list_filters_command))
     application.add_handler(CommandHandler("listsudo", list_sudo_users_command))
     application.add_handler(CommandHandler("sudocmds", sudo_commands_command))
     application.add_handler(CommandHandler("addsudo", add_sudo_command))
     application.add_handler(CommandHandler("delsudo", del_sudo_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    application.add_handler(CommandHandler("dbstats", db_stats_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("mem", mem_command))
+
+    logger.info("Registering filters handler...")
+    application.add_handler(MessageHandler(
+        filters.ChatType.GROUPS & (filters.TEXT | filters.CAPTION) & (~filters.COMMAND) & (~filters.UpdateType.EDITED_MESSAGE),
+        check_chat_filters
+    ), group=1)
 
     logger.info("Registering message handlers for group joins and lefts...")
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_new_group_members))
     application.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER, handle_left_group_member))
 
+    logger.info("Instrumenting handlers for metrics...")
+    instrumented_count = instrument_application_handlers(application)
+    logger.info(f"Instrumented {instrumented_count} handlers.")
+
+def build_application() -> Application:
+    """Builds the one Application the bot runs: separate connection pools for getUpdates and outgoing calls, and a JobQueue."""
+    timeouts = {
+        'connect_timeout': HTTP_CONNECT_TIMEOUT,
+        'read_timeout': HTTP_READ_TIMEOUT,
+        'write_timeout': HTTP_WRITE_TIMEOUT,
+        'pool_timeout': HTTP_POOL_TIMEOUT,
+    }
+    api_request = TracedHTTPXRequest("api", API_CONNECTION_POOL_SIZE, http_version=HTTP_VERSION, **timeouts)
+    # Long polling keeps one connection busy for up to read_timeout; HTTP/1.1 is what PTB recommends for it.
+    get_updates_request = TracedHTTPXRequest("updates", GET_UPDATES_CONNECTION_POOL_SIZE, **timeouts)
+
+    application_builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(api_request)
+        .get_updates_request(get_updates_request)
+        .job_queue(JobQueue())
+        .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING))
+    )
+    if TELEGRAM_API_BASE_URL:
+        application_builder = (
+            application_builder
+            .base_url(TELEGRAM_API_BASE_URL)
+            .base_file_url(f"{TELEGRAM_API_BASE_URL.removesuffix('/bot')}/file/bot")
+        )
+    application = application_builder.build()
+    logger.info(f"HTTP clients: api pool={API_CONNECTION_POOL_SIZE} (HTTP/{HTTP_VERSION}), updates pool={GET_UPDATES_CONNECTION_POOL_SIZE}; "
+                f"timeouts connect={HTTP_CONNECT_TIMEOUT}, read={HTTP_READ_TIMEOUT}, write={HTTP_WRITE_TIMEOUT}, pool={HTTP_POOL_TIMEOUT}")
+    logger.info("JobQueue has been enabled.")
+    logger.info(f"Processing up to {UPDATE_CONCURRENCY} updates concurrently, one at a time per chat.")
+    return application
+
+def main() -> None:
+    mark_startup_phase('import')
+    init_db()
+    mark_startup_phase('init_db')
+    logger.info("Initializing bot application...")
+    application = build_application()
+    mark_startup_phase('build')
+
+    register_handlers(application)
+    allowed_updates = resolve_allowed_updates(application) if SHARD_INDEX is None else None
+    if IS_SHARD_FRONT:
+        # Handlers stay registered so allowed_updates is computed from them, but the router stops every update first.
+        application.add_handler(TypeHandler(Update, route_update_to_shard), group=SHARD_ROUTER_GROUP)
+    mark_startup_phase('handlers')
+
     async def send_simple_startup_message(app: Application) -> None:
             startup_message_text = "<i>Bot Started...</i>"
             
@@ -3806,11 +7069,47 @@ def main() -> None:
             else:
                 logger.warning("No target (LOG_CHAT_ID or OWNER_ID) to send simple startup message.")
 
-    application.post_init = send_simple_startup_message
-
-    logger.info(f"Bot starting polling... Owner ID configured: {OWNER_ID}")
-    print(f"Bot starting polling... Owner ID: {OWNER_ID}")
-    try: application.run_polling(allowed_updates=Update.ALL_TYPES)
+    async def on_startup(app: Application) -> None:
+        # In a sharded deployment the front sends the notice and runs the DB-wide jobs; workers run the handlers.
+        if SHARD_INDEX is None:
+            await send_simple_startup_message(app)
+        if not IS_SHARD_FRONT:
+            await start_catch_up(app)
+        await start_loop_lag_monitor(app)
+        app.job_queue.run_repeating(
+            flush_log_summaries, interval=LOG_ERROR_SUMMARY_INTERVAL, first=LOG_ERROR_SUMMARY_INTERVAL, name="flush_log_summaries"
+        )
+        app.job_queue.run_repeating(
+            flush_chat_sightings, interval=CHAT_SIGHTINGS_FLUSH_INTERVAL, first=CHAT_SIGHTINGS_FLUSH_INTERVAL, name="flush_chat_sightings"
+        )
+        if SHARD_INDEX is None:
+            app.job_queue.run_repeating(
+                reconcile_table_counters, interval=COUNTERS_RECONCILE_INTERVAL, first=timedelta(minutes=10), name="reconcile_table_counters"
+            )
+        if METRICS_PORT and SHARD_INDEX is None:
+            await start_metrics_server(app)
+        if IS_SHARD_FRONT:
+            await start_shard_workers(app)
+
+    async def on_shutdown(app: Application) -> None:
+        await stop_shard_workers(app)
+        record_chat_sightings_bulk(take_pending_chat_sightings())
+        await stop_loop_lag_monitor(app)
+        await stop_metrics_server(app)
+
+    application.post_init = on_startup
+    application.post_shutdown = on_shutdown
+
+    if SHARD_INDEX is not None:
+        run_mode_text = f"as shard {SHARD_INDEX} of {SHARD_COUNT}"
+    else:
+        run_mode_text = "polling" if BOT_RUN_MODE == "polling" else "in webhook mode"
+    logger.info(f"Bot starting {run_mode_text}... Owner ID configured: {OWNER_ID}")
+    print(f"Bot starting {run_mode_text}... Owner ID: {OWNER_ID}")
+    try:
+        if SHARD_INDEX is not None: asyncio.run(run_shard_worker(application))
+        elif BOT_RUN_MODE == "webhook": asyncio.run(run_webhook(application, allowed_updates))
+        else: application.run_polling(allowed_updates=allowed_updates)
     except KeyboardInterrupt: logger.info("Bot stopped by user (Ctrl+C)."); print("\nBot stopped by user.")
     except TelegramError as te: logger.critical(f"CRITICAL: TelegramError during polling: {te}"); print(f"\n--- FATAL TELEGRAM ERROR ---\n{te}"); exit(1)
     except Exception as e: logger.critical(f"CRITICAL: Bot crashed unexpectedly: {e}", exc_info=True); print(f"\n--- FATAL ERROR ---\nBot crashed: {e}"); exit(1)
@@ -3819,6 +7118,6 @@ def main() -> None:
 
 # --- Script Execution ---
 if __name__ == "__main__":
-    try: import requests
-    except ImportError: print("\n--- DEPENDENCY ERROR ---\n'requests' required.\nPlease install: pip install requests"); exit(1)
+    # find_spec checks the dependency is installed without paying for the import at startup.
+    if importlib.util.find_spec("requests") is None: print("\n--- DEPENDENCY ERROR ---\n'requests' required.\nPlease install: pip install requests"); exit(1)
     main()
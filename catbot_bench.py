@@ -0,0 +1,368 @@
+# MyCatBot - Telegram bot
+# Copyright (C) 2025 R0X
+# Licensed under the GNU General Public License v3.0
+# See the LICENSE file for details.
+
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# --- MyCatBot offline benchmark harness ---
+#
+# Builds the real Application with the same handlers as catbot.main(), swaps the network
+# for an in-process fake Bot API and replays synthetic updates through it.
+#
+# Usage: python catbot_bench.py --updates 5000 --mix group_text=65,group_command=10,private=10,media=6,join=6,left=2,raid=1
+#        python catbot_bench.py --soak 4h --rate 50 --sample-interval 60
+#
+# Runs are saved to bench_results.db (see catbot_benchstore.py) unless --no-store is given.
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("TELEGRAM_OWNER_ID", "1")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+
+import catbot
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+from catbot_benchstore import BENCH_STORE_DEFAULT_PATH, SampleCollector, save_run
+from catbot_fakeapi import FAKE_API_ADMIN_IDS, FAKE_API_DEFAULT_MIX, FakeBotAPI, SyntheticUpdates, parse_mix
+
+# --- Benchmark Settings ---
+BENCH_DEFAULT_UPDATES = 2000
+BENCH_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+BENCH_SOAK_STORED_FIELDS = ("updates_per_s", "p50_ms", "p95_ms", "p99_ms", "rss_mb")
+
+
+class FakeBotAPIRequest(BaseRequest):
+    """Routes Bot API calls to an in-process FakeBotAPI instead of the network."""
+
+    def __init__(self, latency: float = 0.0):
+        self.api = FakeBotAPI(latency=latency)
+
+    @property
+    def calls(self) -> dict[str, int]:
+        return self.api.calls
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs) -> tuple[int, bytes]:
+        parameters = request_data.parameters if request_data else {}
+        status_code, response = await self.api.call(url.rsplit("/", 1)[-1], parameters)
+        return status_code, json.dumps(response).encode()
+
+
+def reset_metrics() -> None:
+    catbot.HANDLER_METRICS.clear()
+    catbot.API_CALL_METRICS.clear()
+    catbot.DB_STATEMENT_STATS.clear()
+
+def db_statement_count() -> int:
+    return sum(stats['count'] for stats in catbot.DB_STATEMENT_STATS.values())
+
+async def build_application(fake_request: FakeBotAPIRequest) -> Application:
+    FAKE_API_ADMIN_IDS.add(catbot.OWNER_ID)
+    application = Application.builder().token(catbot.BOT_TOKEN).request(fake_request).get_updates_request(FakeBotAPIRequest()).build()
+    catbot.register_handlers(application)
+    await application.initialize()
+    await application.start()
+    return application
+
+async def replay(application: Application, generator: SyntheticUpdates, count: int) -> dict:
+    """Feeds `count` updates through the application one at a time and returns timing totals."""
+    per_kind: dict[str, dict] = {}
+    started = time.perf_counter()
+    for _ in range(count):
+        kind, payload = generator.next()
+        update = Update.de_json(payload, application.bot)
+        update_started = time.perf_counter()
+        await application.process_update(update)
+        update_elapsed = time.perf_counter() - update_started
+        kind_histogram = per_kind.setdefault(kind, catbot.new_latency_histogram())
+        catbot.observe_latency(kind_histogram, update_elapsed)
+        if catbot.METRICS_SAMPLE_SINK is not None:
+            catbot.METRICS_SAMPLE_SINK("update", kind, update_elapsed)
+    return {'elapsed': time.perf_counter() - started, 'per_kind': per_kind}
+
+def sample_percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of raw samples."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+def build_report(args, result: dict, fake_request: FakeBotAPIRequest, db_ops: int, samples: dict[tuple[str, str], list[float]]) -> dict:
+    handlers = {}
+    for (handler_name, chat_type), histogram in catbot.HANDLER_METRICS.items():
+        merged = handlers.setdefault(handler_name, catbot.new_latency_histogram())
+        handlers[handler_name] = catbot.merge_latency_histograms([merged, histogram])
+
+    def summarize(histogram: dict, values: list[float] | None) -> dict:
+        # Percentiles come from the raw samples; the shared histograms' buckets are too coarse for sub-millisecond handlers.
+        if values:
+            percentiles = {f'p{int(fraction * 100)}_ms': sample_percentile(values, fraction) for fraction in (0.5, 0.95, 0.99)}
+        else:
+            percentiles = {f'p{int(fraction * 100)}_ms': catbot.histogram_percentile(histogram, fraction) * 1000 for fraction in (0.5, 0.95, 0.99)}
+        return {
+            'count': histogram['count'],
+            'errors': histogram['errors'],
+            'mean_ms': histogram['sum'] / histogram['count'] * 1000 if histogram['count'] else 0.0,
+            **percentiles,
+        }
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'updates': args.updates,
+        'mix': args.mix,
+        'seed': args.seed,
+        'api_latency_ms': args.api_latency,
+        'elapsed_s': result['elapsed'],
+        'updates_per_s': args.updates / result['elapsed'] if result['elapsed'] else 0.0,
+        'db_ops_per_update': db_ops / args.updates,
+        'api_calls_per_update': sum(fake_request.calls.values()) / args.updates,
+        'api_calls': dict(sorted(fake_request.calls.items(), key=lambda item: item[1], reverse=True)),
+        'per_kind': {kind: summarize(histogram, samples.get(('update', kind))) for kind, histogram in sorted(result['per_kind'].items())},
+        'per_handler': {
+            name: summarize(histogram, samples.get(('handler', name)))
+            for name, histogram in sorted(handlers.items(), key=lambda item: item[1]['sum'], reverse=True)
+        },
+    }
+
+def print_report(report: dict) -> None:
+    print(f"\nUpdates: {report['updates']} in {report['elapsed_s']:.2f}s -> {report['updates_per_s']:.1f} updates/s")
+    print(f"DB statements per update: {report['db_ops_per_update']:.2f}")
+    print(f"Bot API calls per update: {report['api_calls_per_update']:.2f} ({', '.join(f'{k}={v}' for k, v in report['api_calls'].items())})")
+    for title, rows in (("update kind", report['per_kind']), ("handler", report['per_handler'])):
+        print(f"\n{title:<28}{'count':>8}{'err':>6}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name, row in rows.items():
+            print(f"{name[:27]:<28}{row['count']:>8}{row['errors']:>6}{row['mean_ms']:>10.3f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+
+async def run_benchmark(args) -> tuple[dict, dict]:
+    """Runs the replay benchmark and returns the report plus raw millisecond samples per update kind, handler and DB statement."""
+    catbot.DB_NAME = args.db or os.path.join(tempfile.mkdtemp(prefix="catbot_bench_"), "bench.db")
+    catbot.init_db()
+
+    fake_request = FakeBotAPIRequest(latency=args.api_latency / 1000)
+    application = await build_application(fake_request)
+    generator = SyntheticUpdates(parse_mix(args.mix), args.users, args.chats, args.seed)
+    try:
+        if args.warmup:
+            await replay(application, generator, args.warmup)
+        reset_metrics()
+        fake_request.calls.clear()
+        collector = SampleCollector(seed=args.seed)
+        catbot.METRICS_SAMPLE_SINK = lambda kind, name, seconds: collector.add(kind, name, seconds * 1000)
+        result = await replay(application, generator, args.updates)
+        return build_report(args, result, fake_request, db_statement_count(), collector.samples), collector.samples
+    finally:
+        catbot.METRICS_SAMPLE_SINK = None
+        await application.stop()
+        await application.shutdown()
+
+def parse_duration(text: str) -> float:
+    text = text.strip().lower()
+    if text[-1:] in BENCH_DURATION_UNITS:
+        return float(text[:-1]) * BENCH_DURATION_UNITS[text[-1]]
+    return float(text)
+
+def count_open_fds() -> int | None:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+def take_soak_sample(application: Application, elapsed: float, window: dict, window_seconds: float) -> dict:
+    rss = catbot.get_rss_bytes()
+    state_entries = sum(len(value) for value in application.bot_data.values() if hasattr(value, '__len__') and not isinstance(value, str))
+    return {
+        'elapsed_s': round(elapsed, 1),
+        'updates': window['count'],
+        'updates_per_s': window['count'] / window_seconds if window_seconds else 0.0,
+        'errors': sum(histogram['errors'] for histogram in catbot.HANDLER_METRICS.values()),
+        'p50_ms': catbot.histogram_percentile(window, 0.5) * 1000,
+        'p95_ms': catbot.histogram_percentile(window, 0.95) * 1000,
+        'p99_ms': catbot.histogram_percentile(window, 0.99) * 1000,
+        'rss_mb': rss / 1048576 if rss is not None else None,
+        'gc_objects': len(gc.get_objects()),
+        'open_fds': count_open_fds(),
+        'state_entries': state_entries + len(application.chat_data) + len(application.user_data),
+        'db_mb': os.path.getsize(catbot.DB_NAME) / 1048576,
+    }
+
+def _slope_per_hour(samples: list[dict], field: str) -> float | None:
+    points = [(sample['elapsed_s'] / 3600, sample[field]) for sample in samples if sample[field] is not None]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.fmean(x for x, _ in points)
+    mean_y = statistics.fmean(y for _, y in points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator if denominator else None
+
+def detect_drift(samples: list[dict], args) -> dict:
+    """Compares the median of the first windows (after the very first) with the median of the last ones."""
+    window = args.drift_window
+    if len(samples) < 2 * window + 1:
+        return {'checked': False, 'reason': f"need at least {2 * window + 1} samples, got {len(samples)}", 'failures': []}
+
+    checks = (
+        # field, allowed relative growth, minimum absolute growth before it counts
+        ('rss_mb', args.max_rss_growth / 100, 1.0),
+        ('gc_objects', args.max_object_growth / 100, 1000),
+        ('state_entries', args.max_state_growth / 100, 10),
+        ('p95_ms', args.max_latency_growth / 100, 0.5),
+        ('open_fds', None, args.max_fd_growth),
+    )
+    failures = []
+    drift = {}
+    for field, relative_limit, absolute_floor in checks:
+        baseline_values = [sample[field] for sample in samples[1:1 + window] if sample[field] is not None]
+        final_values = [sample[field] for sample in samples[-window:] if sample[field] is not None]
+        if not baseline_values or not final_values:
+            continue
+        baseline = statistics.median(baseline_values)
+        final = statistics.median(final_values)
+        growth = final - baseline
+        relative = growth / baseline if baseline else 0.0
+        drift[field] = {'baseline': baseline, 'final': final, 'growth': growth, 'relative': relative, 'slope_per_hour': _slope_per_hour(samples, field)}
+        exceeded = growth > absolute_floor and (relative_limit is None or relative > relative_limit)
+        if exceeded:
+            failures.append(field)
+    return {'checked': True, 'drift': drift, 'failures': failures}
+
+async def run_soak(args) -> dict:
+    catbot.DB_NAME = args.db or os.path.join(tempfile.mkdtemp(prefix="catbot_soak_"), "soak.db")
+    catbot.init_db()
+
+    fake_request = FakeBotAPIRequest(latency=args.api_latency / 1000)
+    application = await build_application(fake_request)
+    generator = SyntheticUpdates(parse_mix(args.mix), args.users, args.chats, args.seed)
+    duration = parse_duration(args.soak)
+    samples = []
+    print(f"{'elapsed':>9}{'upd/s':>8}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'RSS MB':>8}{'objects':>9}{'fds':>5}{'state':>8}{'errors':>7}", flush=True)
+    try:
+        if args.warmup:
+            await replay(application, generator, args.warmup)
+        reset_metrics()
+        started = time.monotonic()
+        window_started = started
+        window = catbot.new_latency_histogram()
+        processed = 0
+        while time.monotonic() - started < duration:
+            _, payload = generator.next()
+            update_started = time.perf_counter()
+            await application.process_update(Update.de_json(payload, application.bot))
+            catbot.observe_latency(window, time.perf_counter() - update_started)
+            processed += 1
+
+            if args.rate:
+                await asyncio.sleep(max(0.0, started + processed / args.rate - time.monotonic()))
+            elif processed % 100 == 0:
+                # Let jobs and other tasks run even when replaying as fast as possible.
+                await asyncio.sleep(0)
+
+            now = time.monotonic()
+            if now - window_started >= args.sample_interval:
+                sample = take_soak_sample(application, now - started, window, now - window_started)
+                samples.append(sample)
+                print(
+                    f"{sample['elapsed_s']:>8.0f}s{sample['updates_per_s']:>8.1f}{sample['p50_ms']:>8.2f}{sample['p95_ms']:>8.2f}{sample['p99_ms']:>8.2f}"
+                    f"{sample['rss_mb'] or 0:>8.1f}{sample['gc_objects']:>9}{sample['open_fds'] or 0:>5}{sample['state_entries']:>8}{sample['errors']:>7}",
+                    flush=True
+                )
+                window = catbot.new_latency_histogram()
+                window_started = now
+    finally:
+        await application.stop()
+        await application.shutdown()
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'mode': 'soak',
+        'duration_s': duration,
+        'rate': args.rate,
+        'mix': args.mix,
+        'seed': args.seed,
+        'updates': processed,
+        'samples': samples,
+        'verdict': detect_drift(samples, args),
+    }
+
+def print_soak_verdict(report: dict) -> None:
+    verdict = report['verdict']
+    if not verdict['checked']:
+        print(f"\nDrift check skipped: {verdict['reason']}")
+        return
+    print(f"\n{'metric':<15}{'baseline':>12}{'final':>12}{'growth':>10}{'per hour':>12}")
+    for field, drift in verdict['drift'].items():
+        slope = f"{drift['slope_per_hour']:+.2f}" if drift['slope_per_hour'] is not None else "n/a"
+        marker = "  <-- DRIFT" if field in verdict['failures'] else ""
+        print(f"{field:<15}{drift['baseline']:>12.2f}{drift['final']:>12.2f}{drift['relative'] * 100:>+9.1f}%{slope:>12}{marker}")
+    print(f"\nSoak {'FAILED: drift in ' + ', '.join(verdict['failures']) if verdict['failures'] else 'passed'}.")
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay synthetic updates through the real catbot handlers against a fake Bot API.")
+    parser.add_argument("--updates", type=int, default=BENCH_DEFAULT_UPDATES, help="number of measured updates")
+    parser.add_argument("--warmup", type=int, default=200, help="updates replayed before measuring")
+    parser.add_argument("--mix", default=FAKE_API_DEFAULT_MIX, help="comma-separated kind=weight list (group_text, group_command, private, media, join, left, raid)")
+    parser.add_argument("--users", type=int, default=500, help="distinct synthetic users")
+    parser.add_argument("--chats", type=int, default=20, help="distinct synthetic groups")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="artificial Bot API latency in milliseconds")
+    parser.add_argument("--db", help="SQLite file to use (default: a fresh temporary database)")
+    parser.add_argument("--json", help="also write the report as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    parser.add_argument("--store", default=BENCH_STORE_DEFAULT_PATH, help="result store to save the run to (see catbot_benchstore.py)")
+    parser.add_argument("--no-store", action="store_true", help="do not save the run to the result store")
+
+    soak = parser.add_argument_group("soak test", "run for a fixed time, sampling resources and latency, and fail on drift")
+    soak.add_argument("--soak", metavar="DURATION", help="soak duration, e.g. 90m or 6h (enables soak mode)")
+    soak.add_argument("--rate", type=float, default=0.0, help="target updates per second (0 = as fast as possible)")
+    soak.add_argument("--sample-interval", type=float, default=60.0, help="seconds between samples")
+    soak.add_argument("--drift-window", type=int, default=3, help="samples averaged at the start and end for the drift check")
+    soak.add_argument("--max-rss-growth", type=float, default=25.0, help="allowed RSS growth in percent")
+    soak.add_argument("--max-object-growth", type=float, default=25.0, help="allowed GC object count growth in percent")
+    soak.add_argument("--max-state-growth", type=float, default=25.0, help="allowed bot_data/chat_data/user_data growth in percent")
+    soak.add_argument("--max-latency-growth", type=float, default=50.0, help="allowed p95 latency growth in percent")
+    soak.add_argument("--max-fd-growth", type=int, default=5, help="allowed growth in open file descriptors")
+    return parser
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.soak:
+        report = asyncio.run(run_soak(args))
+        print_soak_verdict(report)
+        samples = {('soak', field): [sample[field] for sample in report['samples'] if sample[field] is not None] for field in BENCH_SOAK_STORED_FIELDS}
+    else:
+        report, samples = asyncio.run(run_benchmark(args))
+        print_report(report)
+    if not args.no_store:
+        params = {key: value for key, value in vars(args).items() if key not in ('json', 'verbose', 'store', 'no_store', 'db')}
+        run_id = save_run(args.store, 'soak' if args.soak else 'bench', params, report, samples)
+        print(f"\nSaved as run {run_id} in {args.store}")
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"\nReport written to {args.json}")
+    if args.soak and report['verdict']['failures']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
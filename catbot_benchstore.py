@@ -0,0 +1,276 @@
+# MyCatBot - Telegram bot
+# Copyright (C) 2025 R0X
+# Licensed under the GNU General Public License v3.0
+# See the LICENSE file for details.
+
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# --- MyCatBot benchmark result store ---
+#
+# Benchmark runs (catbot_bench.py, catbot_dbbench.py) are saved to a SQLite file keyed by git revision
+# and machine fingerprint, together with raw latency samples per handler / DB operation.
+#
+# Usage:
+#   python catbot_benchstore.py list
+#   python catbot_benchstore.py compare <base run id|git rev> <candidate run id|git rev> [--alpha 0.01]
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+from datetime import datetime
+
+# --- Result Store Settings ---
+BENCH_STORE_DEFAULT_PATH = "bench_results.db"
+BENCH_STORE_MAX_SAMPLES = 5000
+BENCH_STORE_SCHEMA_VERSION = 1
+# Metrics (kind, name) where a larger value is better; all others are latencies or sizes, where smaller is better.
+BENCH_HIGHER_IS_BETTER = {("soak", "updates_per_s")}
+
+
+class SampleCollector:
+    """Keeps a bounded uniform sample (reservoir) of raw values per (kind, name)."""
+
+    def __init__(self, max_samples: int = BENCH_STORE_MAX_SAMPLES, seed: int = 0):
+        self.max_samples = max_samples
+        self.random = random.Random(seed)
+        self.samples: dict[tuple[str, str], list[float]] = {}
+        self.seen: dict[tuple[str, str], int] = {}
+
+    def add(self, kind: str, name: str, value: float) -> None:
+        key = (kind, name)
+        seen = self.seen.get(key, 0) + 1
+        self.seen[key] = seen
+        values = self.samples.setdefault(key, [])
+        if len(values) < self.max_samples:
+            values.append(value)
+        else:
+            slot = self.random.randrange(seen)
+            if slot < self.max_samples:
+                values[slot] = value
+
+
+def git_revision() -> tuple[str, bool]:
+    """Returns the current commit hash and whether the working tree has uncommitted changes."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout
+        return revision, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def machine_info() -> dict:
+    info = {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'system': f"{platform.system()} {platform.release()}",
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'cpus': os.cpu_count(),
+    }
+    try:
+        with open("/proc/meminfo") as meminfo:
+            info['mem_total_kb'] = int(meminfo.readline().split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return info
+
+def machine_fingerprint(info: dict) -> str:
+    stable = {key: info.get(key) for key in ('node', 'machine', 'processor', 'cpus', 'mem_total_kb', 'python', 'sqlite')}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True).encode()).hexdigest()[:12]
+
+def connect_store(path: str = BENCH_STORE_DEFAULT_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schema_version INTEGER NOT NULL,
+            suite TEXT NOT NULL,
+            git_rev TEXT NOT NULL,
+            git_dirty INTEGER NOT NULL,
+            machine_id TEXT NOT NULL,
+            machine_info TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            params TEXT NOT NULL,
+            report TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS samples (
+            run_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_run ON samples (run_id, kind, name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_rev ON runs (git_rev, machine_id)")
+    return conn
+
+def save_run(path: str, suite: str, params: dict, report: dict, samples: dict[tuple[str, str], list[float]]) -> int:
+    revision, dirty = git_revision()
+    info = machine_info()
+    with connect_store(path) as conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (schema_version, suite, git_rev, git_dirty, machine_id, machine_info, timestamp, params, report) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (BENCH_STORE_SCHEMA_VERSION, suite, revision, int(dirty), machine_fingerprint(info), json.dumps(info),
+             datetime.now().isoformat(timespec='seconds'), json.dumps(params, default=str), json.dumps(report, default=str))
+        )
+        run_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO samples (run_id, kind, name, value) VALUES (?, ?, ?, ?)",
+            ((run_id, kind, name, value) for (kind, name), values in samples.items() for value in values)
+        )
+    conn.close()
+    return run_id
+
+def resolve_run(conn: sqlite3.Connection, reference: str, suite: str | None, machine_id: str | None) -> tuple:
+    """Accepts a run id or a (prefix of a) git revision; a revision picks its latest run on the given machine."""
+    columns = "run_id, suite, git_rev, git_dirty, machine_id, timestamp"
+    if reference.isdigit():
+        row = conn.execute(f"SELECT {columns} FROM runs WHERE run_id = ?", (int(reference),)).fetchone()
+        if row:
+            return row
+    query = f"SELECT {columns} FROM runs WHERE git_rev LIKE ?"
+    parameters = [f"{reference}%"]
+    if suite:
+        query += " AND suite = ?"
+        parameters.append(suite)
+    if machine_id:
+        query += " AND machine_id = ?"
+        parameters.append(machine_id)
+    row = conn.execute(query + " ORDER BY run_id DESC LIMIT 1", parameters).fetchone()
+    if not row:
+        raise SystemExit(f"No benchmark run found for '{reference}'.")
+    return row
+
+def load_samples(conn: sqlite3.Connection, run_id: int) -> dict[tuple[str, str], list[float]]:
+    samples: dict[tuple[str, str], list[float]] = {}
+    for kind, name, value in conn.execute("SELECT kind, name, value FROM samples WHERE run_id = ?", (run_id,)):
+        samples.setdefault((kind, name), []).append(value)
+    return samples
+
+def mann_whitney_u(base: list[float], candidate: list[float]) -> float:
+    """Two-sided Mann-Whitney U test p-value using the normal approximation with tie correction."""
+    n1, n2 = len(base), len(candidate)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    combined = sorted([(value, 0) for value in base] + [(value, 1) for value in candidate])
+    rank_sum_base = 0.0
+    tie_term = 0.0
+    index = 0
+    while index < len(combined):
+        end = index
+        while end + 1 < len(combined) and combined[end + 1][0] == combined[index][0]:
+            end += 1
+        average_rank = (index + end) / 2 + 1
+        tied = end - index + 1
+        tie_term += tied ** 3 - tied
+        rank_sum_base += average_rank * sum(1 for position in range(index, end + 1) if combined[position][1] == 0)
+        index = end + 1
+    u_base = rank_sum_base - n1 * (n1 + 1) / 2
+    mean_u = n1 * n2 / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    z = (abs(u_base - mean_u) - 0.5) / math.sqrt(variance)
+    return max(0.0, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2))))
+
+def median(values: list[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+def compare_runs(base_samples: dict, candidate_samples: dict, alpha: float, min_change: float, min_samples: int) -> list[dict]:
+    rows = []
+    for key in sorted(set(base_samples) & set(candidate_samples)):
+        base, candidate = base_samples[key], candidate_samples[key]
+        if len(base) < min_samples or len(candidate) < min_samples:
+            continue
+        base_median, candidate_median = median(base), median(candidate)
+        change = (candidate_median - base_median) / base_median * 100 if base_median else 0.0
+        p_value = mann_whitney_u(base, candidate)
+        significant = p_value < alpha and abs(change) >= min_change
+        regressed = change < 0 if key in BENCH_HIGHER_IS_BETTER else change > 0
+        rows.append({
+            'kind': key[0], 'name': key[1], 'base_n': len(base), 'candidate_n': len(candidate),
+            'base_median': base_median, 'candidate_median': candidate_median, 'change_pct': change, 'p_value': p_value,
+            'verdict': ("REGRESSION" if regressed else "improvement") if significant else "",
+        })
+    return rows
+
+def list_command(args) -> None:
+    conn = connect_store(args.store)
+    query = "SELECT run_id, suite, substr(git_rev, 1, 10), git_dirty, machine_id, timestamp, params FROM runs"
+    parameters = []
+    if args.suite:
+        query += " WHERE suite = ?"
+        parameters.append(args.suite)
+    print(f"{'id':>5}  {'suite':<10}{'revision':<12}{'machine':<14}{'timestamp':<21}params")
+    for run_id, suite, revision, dirty, machine_id, timestamp, params in conn.execute(query + " ORDER BY run_id DESC LIMIT ?", parameters + [args.limit]):
+        print(f"{run_id:>5}  {suite:<10}{revision + ('*' if dirty else ''):<12}{machine_id:<14}{timestamp:<21}{params[:80]}")
+    conn.close()
+
+def compare_command(args) -> None:
+    conn = connect_store(args.store)
+    machine_id = args.machine or machine_fingerprint(machine_info())
+    base = resolve_run(conn, args.base, args.suite, machine_id)
+    candidate = resolve_run(conn, args.candidate, args.suite or base[1], machine_id)
+    if base[4] != candidate[4]:
+        print(f"Warning: runs come from different machines ({base[4]} vs {candidate[4]}); differences may not be caused by the code.")
+    rows = compare_runs(load_samples(conn, base[0]), load_samples(conn, candidate[0]), args.alpha, args.min_change, args.min_samples)
+    conn.close()
+
+    print(f"Base:      run {base[0]} ({base[1]}) {base[2][:10]}{'*' if base[3] else ''} at {base[5]}")
+    print(f"Candidate: run {candidate[0]} ({candidate[1]}) {candidate[2][:10]}{'*' if candidate[3] else ''} at {candidate[5]}")
+    print(f"Mann-Whitney U, alpha={args.alpha}, minimum change {args.min_change}% (medians in ms)\n")
+    for kind in sorted({row['kind'] for row in rows}):
+        print(f"{kind:<44}{'base':>10}{'cand':>10}{'change':>9}{'p':>9}  verdict")
+        for row in (row for row in rows if row['kind'] == kind):
+            if args.only_significant and not row['verdict']:
+                continue
+            print(f"  {row['name'][:42]:<42}{row['base_median']:>10.3f}{row['candidate_median']:>10.3f}{row['change_pct']:>+8.1f}%{row['p_value']:>9.4f}  {row['verdict']}")
+        print()
+    regressions = [row for row in rows if row['verdict'] == "REGRESSION"]
+    print(f"{len(regressions)} significant regression(s), {sum(1 for row in rows if row['verdict'] == 'improvement')} improvement(s) across {len(rows)} metrics.")
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Browse and compare stored catbot benchmark runs.")
+    parser.add_argument("--store", default=BENCH_STORE_DEFAULT_PATH, help="result store SQLite file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="list stored runs")
+    list_parser.add_argument("--suite", help="only runs of this suite (bench, soak, dbbench)")
+    list_parser.add_argument("--limit", type=int, default=30)
+    list_parser.set_defaults(func=list_command)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two runs metric by metric")
+    compare_parser.add_argument("base", help="run id or git revision (prefix) of the baseline")
+    compare_parser.add_argument("candidate", help="run id or git revision (prefix) to compare against the baseline")
+    compare_parser.add_argument("--suite", help="suite to pick when a revision has runs of several suites")
+    compare_parser.add_argument("--machine", help="machine fingerprint to pick runs from (default: this machine)")
+    compare_parser.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    compare_parser.add_argument("--min-change", type=float, default=5.0, help="ignore median changes below this percentage")
+    compare_parser.add_argument("--min-samples", type=int, default=20, help="skip metrics with fewer samples in either run")
+    compare_parser.add_argument("--only-significant", action="store_true", help="only print significant changes")
+    compare_parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if any metric regressed")
+    compare_parser.set_defaults(func=compare_command)
+    return parser
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# MyCatBot - Telegram bot
+# Copyright (C) 2025 R0X
+# Licensed under the GNU General Public License v3.0
+# See the LICENSE file for details.
+
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# --- MyCatBot database scale benchmark ---
+#
+# Fills a scratch catbot_data.db with synthetic users/global bans at several sizes and measures the real
+# DB helpers from catbot.py (update_user_in_db, get_user_from_db_by_username, get_gban_reason and the
+# /status counts) under different journal modes and index strategies.
+#
+# Usage: python catbot_dbbench.py --rows 10000,1000000 --journal-modes delete,wal --index-strategies baseline,lower_expr
+#
+# Runs are saved to bench_results.db (see catbot_benchstore.py) unless --no-store is given.
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault("TELEGRAM_OWNER_ID", "1")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+
+import catbot
+from catbot_benchstore import BENCH_STORE_DEFAULT_PATH, SampleCollector, save_run
+
+# --- DB Benchmark Settings ---
+DBBENCH_DEFAULT_ROWS = "10000,1000000"
+DBBENCH_POPULATE_CHUNK = 50000
+DBBENCH_GBAN_RATIO = 0.01
+DBBENCH_NO_USERNAME_RATIO = 0.3
+DBBENCH_LANGUAGES = ("en", "ru", "es", "pt-br", "id", "de", "it", "tr", "uk", None)
+DBBENCH_INDEX_STRATEGIES = {
+    # The schema init_db() creates: a plain index that LOWER(username) lookups cannot use.
+    'baseline': [],
+    # An expression index matching the WHERE LOWER(username) = ? lookup.
+    'lower_expr': ["CREATE INDEX IF NOT EXISTS idx_username_lower ON users (LOWER(username))"],
+    # No username index at all.
+    'none': ["DROP INDEX IF EXISTS idx_username"],
+}
+
+
+def synthetic_username(rng: random.Random, user_id: int) -> str | None:
+    if rng.random() < DBBENCH_NO_USERNAME_RATIO:
+        return None
+    return rng.choice(("cat", "Kitty", "meow_", "Purr", "tom")) + str(user_id)
+
+def populate(db_path: str, rows: int, seed: int) -> None:
+    """Creates the real schema and bulk-loads `rows` users plus DBBENCH_GBAN_RATIO of them as global bans."""
+    catbot.DB_NAME = db_path
+    catbot.init_db()
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        # Counter triggers are recreated by init_db() below; bulk loading is much faster without them.
+        for (trigger_name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {trigger_name}")
+        for start in range(1, rows + 1, DBBENCH_POPULATE_CHUNK):
+            end = min(start + DBBENCH_POPULATE_CHUNK, rows + 1)
+            conn.executemany(
+                "INSERT INTO users (user_id, username, first_name, last_name, language_code, is_bot, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (user_id, synthetic_username(rng, user_id), f"Cat {user_id}", None if rng.random() < 0.6 else "Whiskers",
+                     rng.choice(DBBENCH_LANGUAGES), 1 if rng.random() < 0.02 else 0,
+                     (now - timedelta(seconds=rng.randint(0, 365 * 86400))).isoformat())
+                    for user_id in range(start, end)
+                )
+            )
+            conn.commit()
+        banned_ids = rng.sample(range(1, rows + 1), max(1, int(rows * DBBENCH_GBAN_RATIO)))
+        conn.executemany(
+            "INSERT INTO global_bans (user_id, reason, banned_by_id, timestamp) VALUES (?, ?, ?, ?)",
+            ((user_id, "Spam (synthetic)", 1, now.isoformat()) for user_id in banned_ids)
+        )
+        conn.executemany(
+            "INSERT INTO bot_chats (chat_id, chat_title, added_at) VALUES (?, ?, ?)",
+            ((-1000000000000 - i, f"Group {i}", now.isoformat()) for i in range(max(1, rows // 1000)))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    catbot.init_db()
+    catbot.reconcile_table_counters_in_db()
+
+def apply_variant(db_path: str, journal_mode: str, index_strategy: str) -> None:
+    conn = sqlite3.connect(db_path)
+    try:
+        actual_mode = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+        if actual_mode.lower() != journal_mode.lower():
+            raise RuntimeError(f"SQLite refused journal_mode={journal_mode} (got {actual_mode})")
+        for statement in DBBENCH_INDEX_STRATEGIES[index_strategy]:
+            conn.execute(statement)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+def summarize(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'ops': len(ordered),
+        'ops_per_s': len(ordered) / total if total else 0.0,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def timed(calls) -> list[float]:
+    samples = []
+    for call, argument in calls:
+        started = time.perf_counter()
+        call(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_user(rng: random.Random, user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=user_id, username=synthetic_username(rng, user_id), first_name=f"Cat {user_id}", last_name=None,
+        language_code=rng.choice(DBBENCH_LANGUAGES), is_bot=False,
+    )
+
+def measure_contention(rows: int, writers: int, ops_per_writer: int, seed: int) -> dict:
+    """Runs update_user_in_db from several threads at once, like to_thread workers or sharded processes would."""
+    lock_wait_before = sum(stats['lock_wait_time'] for stats in catbot.DB_STATEMENT_STATS.values())
+    lock_waits_before = sum(stats['lock_waits'] for stats in catbot.DB_STATEMENT_STATS.values())
+    failures = []
+    failure_counter = logging.Handler()
+    failure_counter.emit = lambda record: failures.append(record) if "SQLite error" in record.getMessage() else None
+    catbot.logger.addHandler(failure_counter)
+
+    def writer(writer_index: int) -> None:
+        rng = random.Random(seed + writer_index)
+        for _ in range(ops_per_writer):
+            catbot.update_user_in_db(bench_user(rng, rng.randint(1, rows)))
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    catbot.logger.removeHandler(failure_counter)
+    return {
+        'writers': writers,
+        'ops_per_s': writers * ops_per_writer / elapsed,
+        'lock_waits': sum(stats['lock_waits'] for stats in catbot.DB_STATEMENT_STATS.values()) - lock_waits_before,
+        'lock_wait_s': sum(stats['lock_wait_time'] for stats in catbot.DB_STATEMENT_STATS.values()) - lock_wait_before,
+        'failed': len(failures),
+    }
+
+def file_size(db_path: str) -> int:
+    return sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal", f"{db_path}-journal") if os.path.exists(path))
+
+def count_with_scans() -> None:
+    with sqlite3.connect(catbot.DB_NAME) as conn:
+        for table_name in catbot.STATUS_COUNTED_TABLES:
+            conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()
+
+def run_variant(args, rows: int, template_path: str, work_dir: str, journal_mode: str, index_strategy: str, collector: SampleCollector) -> dict:
+    db_path = os.path.join(work_dir, "catbot_data.db")
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    shutil.copyfile(template_path, db_path)
+    apply_variant(db_path, journal_mode, index_strategy)
+    catbot.DB_NAME = db_path
+    catbot.DB_STATEMENT_STATS.clear()
+    size_before = file_size(db_path)
+
+    rng = random.Random(args.seed)
+    with sqlite3.connect(db_path) as conn:
+        known_usernames = [row[0] for row in conn.execute("SELECT username FROM users WHERE username IS NOT NULL AND user_id % 97 = 0 LIMIT 5000")]
+        banned_ids = [row[0] for row in conn.execute("SELECT user_id FROM global_bans LIMIT 5000")]
+
+    upserts = timed(
+        (catbot.update_user_in_db, bench_user(rng, rng.randint(1, rows) if rng.random() < 0.5 else rows + rng.randint(1, rows)))
+        for _ in range(args.upserts)
+    )
+    username_lookups = timed(
+        (catbot.get_user_from_db_by_username, rng.choice(known_usernames).swapcase() if rng.random() < 0.8 else f"nobody{rng.randint(1, rows)}")
+        for _ in range(args.lookups)
+    )
+    gban_lookups = timed(
+        (catbot.get_gban_reason, rng.choice(banned_ids) if rng.random() < 0.5 else rows * 3 + rng.randint(1, rows))
+        for _ in range(args.lookups)
+    )
+    status_scans = timed((lambda _: count_with_scans(), None) for _ in range(args.status_runs))
+    status_counters = timed((lambda _: catbot.get_table_counters(), None) for _ in range(args.status_runs))
+    contention = measure_contention(rows, args.writers, args.writer_ops, args.seed)
+
+    operations = {
+        'upsert': upserts, 'username_lookup': username_lookups, 'gban_lookup': gban_lookups,
+        'status_count_scan': status_scans, 'status_count_counters': status_counters,
+    }
+    for operation, samples in operations.items():
+        for sample in samples:
+            collector.add("db", f"{rows}/{journal_mode}/{index_strategy}:{operation}", sample * 1000)
+
+    return {
+        'rows': rows,
+        'journal_mode': journal_mode,
+        'index_strategy': index_strategy,
+        'upsert': summarize(upserts),
+        'username_lookup': summarize(username_lookups),
+        'gban_lookup': summarize(gban_lookups),
+        'status_count_scan': summarize(status_scans),
+        'status_count_counters': summarize(status_counters),
+        'contention': contention,
+        'size_before_bytes': size_before,
+        'size_after_bytes': file_size(db_path),
+    }
+
+def print_results(results: list[dict]) -> None:
+    print(f"\n{'rows':>10} {'journal':<8}{'index':<11}{'upsert/s':>9}{'upsert p99':>11}{'user p50':>9}{'user p99':>9}"
+          f"{'gban p50':>9}{'scan cnt':>9}{'ctr cnt':>9}{'contend/s':>10}{'waits':>7}{'fail':>5}{'size MB':>9}{'growth':>8}")
+    for result in results:
+        print(
+            f"{result['rows']:>10} {result['journal_mode']:<8}{result['index_strategy']:<11}"
+            f"{result['upsert']['ops_per_s']:>9.0f}{result['upsert']['p99_ms']:>10.2f}m"
+            f"{result['username_lookup']['p50_ms']:>8.2f}m{result['username_lookup']['p99_ms']:>8.2f}m"
+            f"{result['gban_lookup']['p50_ms']:>8.2f}m{result['status_count_scan']['p50_ms']:>8.1f}m{result['status_count_counters']['p50_ms']:>8.2f}m"
+            f"{result['contention']['ops_per_s']:>10.0f}{result['contention']['lock_waits']:>7}{result['contention']['failed']:>5}"
+            f"{result['size_after_bytes'] / 1048576:>9.1f}{(result['size_after_bytes'] - result['size_before_bytes']) / 1048576:>+7.1f}M"
+        )
+    print("\nLatencies are in milliseconds (m). 'scan cnt' is the old five COUNT(*) queries, 'ctr cnt' the table_counters lookup.")
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Scale benchmark for the catbot users/global_bans tables.")
+    parser.add_argument("--rows", default=DBBENCH_DEFAULT_ROWS, help="comma-separated table sizes, e.g. 10000,1000000,10000000")
+    parser.add_argument("--journal-modes", default="delete,wal", help="comma-separated SQLite journal modes to compare")
+    parser.add_argument("--index-strategies", default="baseline,lower_expr", help=f"comma-separated, from: {', '.join(DBBENCH_INDEX_STRATEGIES)}")
+    parser.add_argument("--upserts", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--status-runs", type=int, default=5)
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writer threads for the contention test")
+    parser.add_argument("--writer-ops", type=int, default=300, help="upserts per writer thread")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dir", help="scratch directory (default: a new temporary directory, removed afterwards)")
+    parser.add_argument("--json", help="also write the results as JSON to this path")
+    parser.add_argument("--store", default=BENCH_STORE_DEFAULT_PATH, help="result store to save the run to (see catbot_benchstore.py)")
+    parser.add_argument("--no-store", action="store_true", help="do not save the run to the result store")
+    return parser
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    catbot.DB_SLOW_QUERY_THRESHOLD = float("inf")
+    work_dir = args.dir or tempfile.mkdtemp(prefix="catbot_dbbench_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    collector = SampleCollector(seed=args.seed)
+    try:
+        for rows in (int(value) for value in args.rows.split(",")):
+            template_path = os.path.join(work_dir, f"template_{rows}.db")
+            print(f"Populating {rows} users...", flush=True)
+            started = time.perf_counter()
+            populate(template_path, rows, args.seed)
+            print(f"  done in {time.perf_counter() - started:.1f}s ({file_size(template_path) / 1048576:.1f} MB)", flush=True)
+            for journal_mode in args.journal_modes.split(","):
+                for index_strategy in args.index_strategies.split(","):
+                    print(f"  measuring journal_mode={journal_mode} index={index_strategy}...", flush=True)
+                    results.append(run_variant(args, rows, template_path, work_dir, journal_mode.strip(), index_strategy.strip(), collector))
+            os.remove(template_path)
+    finally:
+        if not args.dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"Results written to {args.json}")
+    if not args.no_store:
+        params = {key: value for key, value in vars(args).items() if key not in ('json', 'dir', 'store', 'no_store')}
+        run_id = save_run(args.store, 'dbbench', params, {'results': results}, collector.samples)
+        print(f"Saved as run {run_id} in {args.store}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+# MyCatBot - Telegram bot
+# Copyright (C) 2025 R0X
+# Licensed under the GNU General Public License v3.0
+# See the LICENSE file for details.
+
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# --- MyCatBot fake Bot API server ---
+#
+# A local stand-in for api.telegram.org implementing the subset of Bot API methods catbot.py uses,
+# with configurable latency, error injection, flood-wait responses and scripted update streams.
+#
+# Usage:
+#   python catbot_fakeapi.py --port 8081 --latency 40 --flood-rate 0.01 --script updates.jsonl
+#   TELEGRAM_API_BASE_URL="http://127.0.0.1:8081/bot" python catbot.py
+#
+# When the bot calls setWebhook (BOT_RUN_MODE=webhook), queued updates are POSTed to the webhook URL with the
+# secret token header instead of being served through getUpdates, e.g.:
+#   BOT_RUN_MODE=webhook WEBHOOK_URL="http://127.0.0.1:8443/webhook" TELEGRAM_API_BASE_URL="http://127.0.0.1:8081/bot" python catbot.py
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qs, urlparse
+
+# --- Fake API Settings ---
+FAKE_API_DEFAULT_PORT = 8081
+FAKE_API_BOT_ID = 123456
+FAKE_API_MAX_BODY = 50 * 1024 * 1024
+FAKE_API_WEBHOOK_RETRY_DELAY = 1.0
+FAKE_API_WEBHOOK_TIMEOUT = 30.0
+FAKE_API_ADMIN_IDS = {FAKE_API_BOT_ID}
+FAKE_API_TRUE_METHODS = {
+    "banChatMember", "unbanChatMember", "restrictChatMember", "promoteChatMember", "deleteMessage",
+    "deleteMessages", "leaveChat", "pinChatMessage", "unpinChatMessage", "unpinAllChatMessages",
+    "setChatPermissions", "setMyCommands", "sendChatAction",
+    "approveChatJoinRequest", "declineChatJoinRequest", "close", "logOut",
+}
+FAKE_API_DEFAULT_MIX = "group_text=65,group_command=10,private=10,media=6,join=6,left=2,raid=1"
+# A raid is a burst of join events into one chat, each adding several members at once.
+FAKE_API_RAID_EVENTS = (10, 30)
+FAKE_API_RAID_MEMBERS = (5, 20)
+FAKE_API_GROUP_COMMANDS = ("/meow", "/info", "/nap", "/admins", "/filters")
+FAKE_API_PRIVATE_TEXTS = ("/start", "/help", "/meow", "hello kitty")
+FAKE_API_GROUP_WORDS = ("meow", "purr", "hello", "cat", "food", "nap", "zoomies", "what", "is", "this", "link", "spam")
+
+
+def fake_user(user_id: int, is_bot: bool = False) -> dict:
+    return {"id": user_id, "is_bot": is_bot, "first_name": f"Cat{user_id}", "username": f"cat{user_id}"}
+
+def fake_chat(chat_id: int) -> dict:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"Cat{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Fake Group {-chat_id}"}
+
+
+class FakeBotAPI:
+    """Bot API behaviour without the transport: method dispatch, fault injection and the update queue."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 flood_rate: float = 0.0, flood_retry_after: int = 5, method_latency: dict[str, float] | None = None,
+                 strict: bool = False, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.flood_retry_after = flood_retry_after
+        self.method_latency = method_latency or {}
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.calls: dict[str, int] = {}
+        self.injected: dict[str, int] = {'errors': 0, 'flood_waits': 0}
+        self.updates: list[dict] = []
+        self.next_update_id = 1
+        self.updates_available = asyncio.Event()
+        self.webhook: dict | None = None
+        self.webhook_deliveries: dict[str, int] = {}
+        self._message_id = 0
+
+    def add_update(self, update: dict) -> None:
+        update = dict(update)
+        update.setdefault("update_id", self.next_update_id)
+        self.next_update_id = max(self.next_update_id, update["update_id"]) + 1
+        self.updates.append(update)
+        self.updates_available.set()
+
+    async def call(self, api_method: str, parameters: dict) -> tuple[int, dict]:
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        delay = self.method_latency.get(api_method, self.latency)
+        if delay or self.jitter:
+            await asyncio.sleep(max(0.0, delay + self.random.uniform(-self.jitter, self.jitter)))
+
+        if api_method != "getUpdates":
+            if self.flood_rate and self.random.random() < self.flood_rate:
+                self.injected['flood_waits'] += 1
+                return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.flood_retry_after}",
+                             "parameters": {"retry_after": self.flood_retry_after}}
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.injected['errors'] += 1
+                return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error: injected by fake API"}
+
+        if api_method == "getUpdates":
+            if self.webhook:
+                return 409, {"ok": False, "error_code": 409, "description": "Conflict: can't use getUpdates method while webhook is active; use deleteWebhook to delete the webhook first"}
+            return 200, {"ok": True, "result": await self._get_updates(parameters)}
+        if api_method == "setWebhook":
+            self.set_webhook(parameters)
+            return 200, {"ok": True, "result": True, "description": "Webhook was set"}
+        if api_method == "deleteWebhook":
+            self.webhook = None
+            if str(parameters.get("drop_pending_updates", "")).lower() == "true":
+                self.updates.clear()
+            return 200, {"ok": True, "result": True, "description": "Webhook was deleted"}
+        result = self.result_for(api_method, parameters)
+        if result is None:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        return 200, {"ok": True, "result": result}
+
+    async def _get_updates(self, parameters: dict) -> list[dict]:
+        offset = int(parameters.get("offset") or 0)
+        limit = int(parameters.get("limit") or 100)
+        timeout = float(parameters.get("timeout") or 0)
+        if offset:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout:
+            self.updates_available.clear()
+            try:
+                await asyncio.wait_for(self.updates_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def set_webhook(self, parameters: dict) -> None:
+        url = str(parameters.get("url") or "")
+        if not url:
+            self.webhook = None
+            return
+        webhook = {
+            "url": url,
+            "secret_token": str(parameters.get("secret_token") or ""),
+            "max_connections": int(parameters.get("max_connections") or 40),
+        }
+        self.webhook = webhook
+        for _ in range(webhook["max_connections"]):
+            asyncio.create_task(self._deliver_webhook_updates(webhook))
+
+    async def _deliver_webhook_updates(self, webhook: dict) -> None:
+        """One of max_connections delivery loops; like Telegram, an update is retried until the bot answers 200."""
+        sender = WebhookSender(webhook["url"], webhook["secret_token"])
+        try:
+            while self.webhook is webhook:
+                if not self.updates:
+                    self.updates_available.clear()
+                    try:
+                        await asyncio.wait_for(self.updates_available.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                update = self.updates.pop(0)
+                status = await sender.post(json.dumps(update).encode())
+                self.webhook_deliveries[str(status)] = self.webhook_deliveries.get(str(status), 0) + 1
+                if status != 200:
+                    self.updates.insert(0, update)
+                    await asyncio.sleep(FAKE_API_WEBHOOK_RETRY_DELAY)
+        finally:
+            sender.close()
+
+    def _sent_message(self, chat_id, parameters: dict) -> dict:
+        self._message_id += 1
+        message = {"message_id": self._message_id, "date": int(time.time()), "chat": fake_chat(int(chat_id)), "from": fake_user(FAKE_API_BOT_ID, is_bot=True)}
+        if "text" in parameters:
+            message["text"] = str(parameters["text"])
+        if parameters.get("caption"):
+            message["caption"] = str(parameters["caption"])
+        return message
+
+    def result_for(self, api_method: str, parameters: dict):
+        try:
+            chat_id = int(parameters.get("chat_id", 1))
+        except (TypeError, ValueError):
+            # Channel usernames such as "@channel" have no numeric id here.
+            chat_id = -1
+        if api_method == "getMe":
+            return fake_user(FAKE_API_BOT_ID, is_bot=True) | {"can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if (api_method.startswith("send") and api_method != "sendChatAction") or api_method in ("editMessageText", "copyMessage", "forwardMessage"):
+            return self._sent_message(chat_id, parameters)
+        if api_method == "getChatMember":
+            user_id = int(parameters.get("user_id") or 1)
+            member = {"status": "administrator" if user_id in FAKE_API_ADMIN_IDS else "member", "user": fake_user(user_id, is_bot=user_id == FAKE_API_BOT_ID)}
+            if member["status"] == "administrator":
+                member.update({
+                    "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+                    "can_manage_video_chats": True, "can_restrict_members": True, "can_promote_members": True,
+                    "can_change_info": True, "can_invite_users": True, "can_post_stories": True,
+                    "can_edit_stories": True, "can_delete_stories": True, "can_pin_messages": True,
+                })
+            return member
+        if api_method == "getChatAdministrators":
+            return [self.result_for("getChatMember", {"chat_id": chat_id, "user_id": admin_id}) for admin_id in sorted(FAKE_API_ADMIN_IDS)]
+        if api_method == "getChat":
+            return fake_chat(chat_id) | {"accent_color_id": 0, "max_reaction_count": 11}
+        if api_method == "getChatMemberCount":
+            return 100
+        if api_method == "getUserProfilePhotos":
+            return {"total_count": 0, "photos": []}
+        if api_method == "getWebhookInfo":
+            info = {"url": self.webhook["url"] if self.webhook else "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+            if self.webhook:
+                info["max_connections"] = self.webhook["max_connections"]
+            return info
+        if api_method in FAKE_API_TRUE_METHODS or not self.strict:
+            return True
+        return None
+
+
+class WebhookSender:
+    """Keep-alive HTTP/1.1 client posting updates to a webhook; returns 0 as the status when the connection fails."""
+
+    def __init__(self, url: str, secret_token: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.ssl = parsed.scheme == "https"
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.secret_token = secret_token
+        self.reader = None
+        self.writer = None
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, body: bytes) -> int:
+        try:
+            return await asyncio.wait_for(self._post(body), FAKE_API_WEBHOOK_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            return 0
+
+    async def _post(self, body: bytes) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        headers = f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        if self.secret_token:
+            headers += f"X-Telegram-Bot-Api-Secret-Token: {self.secret_token}\r\n"
+        self.writer.write(headers.encode() + b"\r\n" + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("webhook closed the connection")
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        content_length = int(response_headers.get("content-length") or 0)
+        if content_length:
+            await self.reader.readexactly(content_length)
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(status_line.split()[1])
+
+
+class SyntheticUpdates:
+    """Generates Bot API update payloads for a fixed population of users and groups."""
+
+    def __init__(self, mix: dict[str, int], users: int, chats: int, seed: int):
+        self.random = random.Random(seed)
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.user_ids = [1000 + i for i in range(users)]
+        self.chat_ids = [-1000000000000 - i for i in range(chats)]
+        self.update_id = 0
+        self.message_id = 0
+        self.raid_chat_id = None
+        self.raid_remaining = 0
+
+    def _message(self, chat_id: int, user_id: int, **fields) -> dict:
+        self.update_id += 1
+        self.message_id += 1
+        message = {"message_id": self.message_id, "date": int(time.time()), "chat": fake_chat(chat_id), "from": fake_user(user_id)}
+        message.update(fields)
+        return {"update_id": self.update_id, "message": message}
+
+    def _command(self, chat_id: int, user_id: int, text: str) -> dict:
+        command = text.split()[0]
+        return self._message(chat_id, user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(command)}])
+
+    def _join(self, chat_id: int, member_count: int) -> dict:
+        members = [fake_user(user_id) for user_id in self.random.sample(self.user_ids, min(member_count, len(self.user_ids)))]
+        return self._message(chat_id, members[0]["id"], new_chat_members=members)
+
+    def _photo(self, chat_id: int, user_id: int) -> dict:
+        file_id = f"photo{self.message_id + 1}"
+        sizes = [
+            {"file_id": f"{file_id}_{width}", "file_unique_id": f"{file_id}_{width}", "width": width, "height": width * 3 // 4, "file_size": width * 60}
+            for width in (90, 320, 800)
+        ]
+        fields = {"photo": sizes}
+        if self.random.random() < 0.7:
+            fields["caption"] = " ".join(self.random.choices(FAKE_API_GROUP_WORDS, k=self.random.randint(1, 8)))
+        return self._message(chat_id, user_id, **fields)
+
+    def next(self) -> tuple[str, dict]:
+        if self.raid_remaining:
+            # A raid in progress keeps the stream on one chat until its burst is spent.
+            self.raid_remaining -= 1
+            return "raid", self._join(self.raid_chat_id, self.random.randint(*FAKE_API_RAID_MEMBERS))
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        user_id = self.random.choice(self.user_ids)
+        chat_id = self.random.choice(self.chat_ids)
+        if kind == "group_text":
+            text = " ".join(self.random.choices(FAKE_API_GROUP_WORDS, k=self.random.randint(2, 12)))
+            return kind, self._message(chat_id, user_id, text=text)
+        if kind == "group_command":
+            return kind, self._command(chat_id, user_id, self.random.choice(FAKE_API_GROUP_COMMANDS))
+        if kind == "private":
+            text = self.random.choice(FAKE_API_PRIVATE_TEXTS)
+            if text.startswith("/"):
+                return kind, self._command(user_id, user_id, text)
+            return kind, self._message(user_id, user_id, text=text)
+        if kind == "media":
+            return kind, self._photo(chat_id, user_id)
+        if kind == "join":
+            return kind, self._join(chat_id, self.random.randint(1, 3))
+        if kind == "raid":
+            self.raid_chat_id = chat_id
+            self.raid_remaining = self.random.randint(*FAKE_API_RAID_EVENTS) - 1
+            return kind, self._join(chat_id, self.random.randint(*FAKE_API_RAID_MEMBERS))
+        if kind == "left":
+            return kind, self._message(chat_id, user_id, left_chat_member=fake_user(user_id))
+        raise ValueError(f"Unknown update kind '{kind}'")
+
+
+def parse_mix(mix_text: str) -> dict[str, int]:
+    mix = {}
+    for part in mix_text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+def _decode_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def parse_parameters(content_type: str, body: bytes) -> dict:
+    """Decodes the three body encodings the Bot API accepts. Uploaded file parts are replaced by their size."""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        parameters = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            parameters[name] = f"<file {len(payload)} bytes>" if part.get_filename() else _decode_value(payload.decode("utf-8", "replace"))
+        return parameters
+    return {key: _decode_value(values[-1]) for key, values in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()}
+
+
+class FakeBotAPIServer:
+    """Minimal keep-alive HTTP/1.1 server exposing FakeBotAPI under /bot<token>/<method>."""
+
+    def __init__(self, api: FakeBotAPI, host: str = "127.0.0.1", port: int = FAKE_API_DEFAULT_PORT):
+        self.api = api
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) < 2:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                content_length = int(headers.get("content-length") or 0)
+                if content_length > FAKE_API_MAX_BODY:
+                    await self._respond(writer, 413, {"ok": False, "error_code": 413, "description": "Request Entity Too Large"})
+                    break
+                body = await reader.readexactly(content_length) if content_length else b""
+                status_code, response = await self._dispatch(parts[0], parts[1], headers.get("content-type", ""), body)
+                await self._respond(writer, status_code, response)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, http_method: str, path: str, content_type: str, body: bytes) -> tuple[int, dict]:
+        path = path.split("?", 1)[0]
+        if path == "/stats":
+            return 200, {
+                "calls": self.api.calls, "injected": self.api.injected, "pending_updates": len(self.api.updates),
+                "webhook": self.api.webhook["url"] if self.api.webhook else None, "webhook_deliveries": self.api.webhook_deliveries,
+            }
+        if path == "/updates" and http_method == "POST":
+            payload = json.loads(body or b"[]")
+            for update in payload if isinstance(payload, list) else [payload]:
+                self.api.add_update(update)
+            return 200, {"ok": True, "result": len(self.api.updates)}
+        segments = path.strip("/").split("/")
+        if len(segments) != 2 or not segments[0].startswith("bot"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        try:
+            parameters = parse_parameters(content_type, body)
+        except ValueError as e:
+            return 400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+        return await self.api.call(segments[1], parameters)
+
+    async def _respond(self, writer: asyncio.StreamWriter, status_code: int, response: dict) -> None:
+        body = json.dumps(response).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 413: "Request Entity Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}.get(status_code, "OK")
+        writer.write(f"HTTP/1.1 {status_code} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+
+async def play_script(api: FakeBotAPI, path: str) -> None:
+    """Feeds updates from a JSON lines file. A line may carry a "delay" (seconds to wait before it is queued)."""
+    with open(path) as script_file:
+        for line in script_file:
+            if not line.strip():
+                continue
+            update = json.loads(line)
+            delay = update.pop("delay", 0)
+            if delay:
+                await asyncio.sleep(delay)
+            api.add_update(update)
+
+async def play_generated(api: FakeBotAPI, count: int, rate: float, mix: str, seed: int) -> None:
+    generator = SyntheticUpdates(parse_mix(mix), users=500, chats=20, seed=seed)
+    for _ in range(count):
+        _, update = generator.next()
+        update.pop("update_id")
+        api.add_update(update)
+        if rate:
+            await asyncio.sleep(1 / rate)
+
+def parse_method_latency(text: str | None) -> dict[str, float]:
+    latencies = {}
+    for part in (text or "").split(","):
+        if part.strip():
+            method, _, milliseconds = part.partition("=")
+            latencies[method.strip()] = float(milliseconds) / 1000
+    return latencies
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API server for load and latency testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=FAKE_API_DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="base latency per call in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- jitter in milliseconds")
+    parser.add_argument("--method-latency", help="per-method latency overrides, e.g. sendMessage=200,getChat=50")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 500")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="fraction of calls answered with a 429 flood wait")
+    parser.add_argument("--flood-retry-after", type=int, default=5, help="retry_after seconds in flood-wait responses")
+    parser.add_argument("--strict", action="store_true", help="answer unknown methods with 404 instead of true")
+    parser.add_argument("--script", help="JSON lines file of updates to serve through getUpdates")
+    parser.add_argument("--generate", type=int, default=0, help="serve this many synthetic updates from the benchmark generator")
+    parser.add_argument("--rate", type=float, default=0.0, help="updates per second for --generate (0 = all at once)")
+    parser.add_argument("--mix", default=FAKE_API_DEFAULT_MIX, help="update mix for --generate, e.g. group_text=80,media=10,raid=10")
+    parser.add_argument("--admin-id", type=int, action="append", default=[], help="user id reported as chat administrator (repeatable)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+async def run_server(args) -> None:
+    FAKE_API_ADMIN_IDS.update(args.admin_id)
+    api = FakeBotAPI(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        flood_rate=args.flood_rate, flood_retry_after=args.flood_retry_after,
+        method_latency=parse_method_latency(args.method_latency), strict=args.strict, seed=args.seed,
+    )
+    server = FakeBotAPIServer(api, args.host, args.port)
+    await server.start()
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}/bot<token>/<method>")
+    print(f"Point the bot at it with: TELEGRAM_API_BASE_URL=\"http://{args.host}:{args.port}/bot\"")
+    if args.script:
+        asyncio.create_task(play_script(api, args.script))
+    if args.generate:
+        asyncio.create_task(play_generated(api, args.generate, args.rate, args.mix, args.seed or 42))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        print(f"\nCalls: {json.dumps(api.calls, sort_keys=True)}")
+        print(f"Injected faults: {json.dumps(api.injected)}")
+
+def main() -> None:
+    try:
+        asyncio.run(run_server(build_arg_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
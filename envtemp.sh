@@ -25,6 +25,81 @@ export TELEGRAM_OWNER_ID="PASTE_HERE"
 # However, if you want to use this, remember to delete the hastag before the command below.
 # export TENOR_API_KEY="PASTE_HERE"
 
+# Set a local port here to expose Prometheus metrics on http://127.0.0.1:<port>/metrics
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export METRICS_PORT="9108"
+
+# Set the slow query threshold in milliseconds. Slower SQL statements are logged with their query plan. Default is 100.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export DB_SLOW_QUERY_MS="100"
+
+# Set the event loop lag threshold in milliseconds. Longer stalls are logged with a stack sample. Default is 250.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export LOOP_LAG_THRESHOLD_MS="250"
+
+# Set the cold start target in milliseconds. The startup breakdown (import, init_db, build, handlers, first getUpdates) is logged as a warning when it is exceeded. Default is 5000.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export STARTUP_TARGET_MS="5000"
+
+# Connection pool sizes for outgoing Bot API calls (default 32) and for getUpdates long polling (default 1).
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export API_POOL_SIZE="32"
+# export GET_UPDATES_POOL_SIZE="1"
+
+# Number of updates processed at the same time. Updates from one chat always run in order. Set to 1 to process one update at a time. Default is 8.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export UPDATE_CONCURRENCY="8"
+
+# Which update types Telegram should send. "auto" (default) requests only the types the bot's handlers use. "all" requests every type, and /metrics then shows how many received updates no handler needed. A comma-separated list such as "message,edited_message" is also accepted.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export ALLOWED_UPDATES="auto"
+
+# After a restart, backlog updates older than this many seconds are triaged instead of handled in full: stale fun commands are dropped, moderation commands still run, and chat activity is applied in batches (user logging, gban checks). Set to 0 to handle the backlog like live traffic.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export CATCHUP_STALE_SECONDS="120"
+
+# Number of worker processes that handle updates. Above 1, a front process receives updates and routes each chat to one worker over a Unix socket (SHARD_SOCKET, relative to the working directory), spreading handler CPU work over several cores.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export SHARD_COUNT="4"
+# export SHARD_SOCKET="catbot_shards.sock"
+
+# Webhook mode: Telegram pushes updates to WEBHOOK_URL instead of the bot polling. WEBHOOK_URL must reach WEBHOOK_LISTEN:WEBHOOK_PORT (default 0.0.0.0:8443), e.g. through a reverse proxy.
+# WEBHOOK_SECRET_TOKEN is optional (1-256 characters A-Z, a-z, 0-9, _ and -); a random one is generated on every start if it is not set.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export BOT_RUN_MODE="webhook"
+# export WEBHOOK_URL="https://example.com/catbot-webhook"
+# export WEBHOOK_SECRET_TOKEN=""
+# export WEBHOOK_LISTEN="0.0.0.0"
+# export WEBHOOK_PORT="8443"
+
+# Use HTTP/2 for outgoing Bot API calls. Requires: pip install "httpx[http2]". Default is "1.1".
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export HTTP_VERSION="2"
+
+# Logging options. LOG_FORMAT can be "text" (default) or "json".
+# Hot-path log lines (GIF searches, passive chat discovery, blacklist hits) can be sampled (0.0-1.0) and rate limited (lines per second).
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export LOG_FORMAT="json"
+# export LOG_HOT_SAMPLE_RATE="1.0"
+# export LOG_HOT_RATE_LIMIT="20"
+
+# Point the bot at a different Bot API server, e.g. a local Bot API server or catbot_fakeapi.py for load testing.
+# Note that this does not require to run bot.
+# However, if you want to use this, remember to delete the hastag before the command below.
+# export TELEGRAM_API_BASE_URL="http://127.0.0.1:8081/bot"
+
 echo "done"
 
 # Use this command to start bot: